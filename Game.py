@@ -1,13 +1,17 @@
 import json
+import logging
 from classes.creature import Hero, Monster
 from classes.abilities import Ability
 from classes.inventory import Item, Inventory, EquipmentManager
+from classes.spawner import Spawner
 
 def load_templates(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
 
+logging.basicConfig(level=logging.INFO)
+
 # Load templates
 abilities_templates = load_templates('classes/templates/abilitiesTemplates.json')
 items_templates = load_templates('classes/templates/items.json')
@@ -20,8 +24,12 @@ hero2 = Hero()
 goblin = Monster("GoblinSama", 1, "A small goblin", 50, 50, 5, 5, [], 'physical', [], [], 5, 1, 10, "Goblin", {})
 orc = Monster("OrcSama", 1, "A small orc", 75, 75, 7, 7, [], 'physical', [], [], 7, 2, 15, "Orc", {})
 heroTemplate = Hero.create_hero('Jean Luc', "Warior", hero_templates)
+# Spawn a wave of monsters from the creature templates
+spawner = Spawner.from_files()
+goblins = spawner.spawn_monsters("Goblin", 1000)
+print(len(goblins), goblins[0].name, goblins[-1].name)
 # Assign abilities
-fireball = Ability.create_ability("Fireball", abilities_templates)
+fireball = Ability.create_ability("Fireball", abilities_templates["Fireball"])
 hero.learn_ability(fireball)
 print(hero.abilities)
 print(hero.inventory.items)
@@ -0,0 +1,3 @@
+# The game package.
+# Importing it, or any of its modules, must not read files or configure logging:
+# templates are loaded lazily by classes.templateStore. classes.coldStart checks this.
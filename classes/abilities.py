@@ -1,21 +1,20 @@
 # this file contains the Ability class and related functions
-from classes.effects import DamageOverTimeEffect, HealOverTimeEffect, StatModifierEffect
-import json
+from classes.effects import DamageOverTimeEffect, HealOverTimeEffect, StatModifierEffect, EffectFactory
+from classes.changeTracking import COOLDOWNS, mark
+from classes.enums import CostType, DamageType, TargetType
 import logging
 from typing import TYPE_CHECKING, List, Dict, Any
+from classes.templateStore import get_templates
 
 if TYPE_CHECKING:
-    from creature import Creature
+    from classes.creature import Creature
 
-try:
-    with open('classes/templates/abilitiesTemplates.json', 'r') as file:
-        TEMPLATES = json.load(file)
-except FileNotFoundError:
-    logging.error("Abilities templates file not found.")
-    TEMPLATES = {}
-except json.JSONDecodeError:
-    logging.error("Error decoding JSON from abilities templates file.")
-    TEMPLATES = {}
+
+def __getattr__(name: str):
+    # TEMPLATES is resolved lazily so that importing the module does no I/O
+    if name == "TEMPLATES":
+        return get_templates("abilities")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 effect_classes = {
     "DamageOverTimeEffect": DamageOverTimeEffect,
@@ -36,22 +35,23 @@ class Ability:
         is_offensive: bool = True,
         power: int = 0,  # Renamed from damage to power to handle both healing and damage
         cost: int = 0, 
-        cost_type: str = 'mana', # 'mana', 'stamina', etc.
+        cost_type: CostType = CostType.MANA, # CostType or its name: 'mana', 'stamina', etc.
         cooldown: int = 0, 
-        power_type: str = 'physical', # Renamed from damage_type to power_type to handle both healing and damage
-        target_type: str = 'single', # 'single', 'area', 'self', 'all'
+        power_type: DamageType = DamageType.PHYSICAL, # Renamed from damage_type to power_type to handle both healing and damage
+        target_type: TargetType = TargetType.SINGLE, # TargetType or its name: 'single', 'area', 'self', 'all'
         effects: List[Dict[str, Any]] = None,
         power_modifiers: List[tuple] = None,  # Renamed from damage_modifiers to power_modifiers to handle both healing and damage
         effect_multiplier: float = 1.0):
         self.name: str = name
         self.description: str = description
+        self.is_offensive: bool = is_offensive
         self.base_power: int = power  # Renamed from base_damage to base_power to handle both healing and damage
-        self.power_type: str = power_type  # Renamed from damage_type to power_type to handle both healing and damage
+        self.power_type: DamageType = DamageType.parse(power_type)  # Renamed from damage_type to power_type to handle both healing and damage
         self.cost: int = cost
-        self.cost_type: str = cost_type
+        self.cost_type: CostType = CostType.parse(cost_type)
         self.max_cooldown: int = cooldown
         self.current_cooldown: int = 0
-        self.target_type: str = target_type
+        self.target_type: TargetType = TargetType.parse(target_type)
         self.effect_multiplier: float = effect_multiplier
         self.effects: List[Dict[str, Any]] = effects or []
         self.power_modifiers: List[tuple] = power_modifiers or []  # Renamed from damage_modifiers to power_modifiers to handle both healing and damage
@@ -87,10 +87,10 @@ class Ability:
         if target is None:
             raise AbilityError(self.name, "No target provided")
         
-        elif self.target_type == 'self' and target != user:
+        elif self.target_type == TargetType.SELF and target != user:
             raise AbilityError(self.name, "Ability can only target self")
         
-        elif self.target_type == 'single' and target is user:
+        elif self.target_type == TargetType.SINGLE and target is user:
             raise AbilityError(self.name, "Ability cannot target self")
 
         elif user.resources.get(self.cost_type, 0) < self.cost and self.current_cooldown > 0:
@@ -111,22 +111,22 @@ class Ability:
         Returns the actual damage dealt.
         """
         self.can_use(user, target)
-        user.resources[self.cost_type] -= self.cost
+        user.resources.spend(self.cost_type, self.cost)
         power = 0
         if self.base_power != 0:
             power = self.calculate_power(user)
             try:
                 if self.is_offensive:
-                    target.take_damage(self.power_type, power)
+                    target.take_damage(power, self.power_type, attacker=user)
                 else:
-                    target.heal(power)
+                    target.heal(power, self.power_type, user)
             except AttributeError as e:
                 logging.error(f"Error using ability {self.name}: {e}")
         for effect_template in self.effects:
             effect_class_name = effect_template["effect_class"]
-            effect_class = effect_classes.get(effect_class_name)
-            if effect_class:
-                created_effect = effect_class.create_effect(
+            if effect_class_name in effect_classes:
+                created_effect = EffectFactory.create_effect(
+                    effect_class_name,
                     name=effect_template["effect_name"],
                     source_type="creature",
                     applier=user,
@@ -138,7 +138,9 @@ class Ability:
                     logging.error(f"Failed to create effect {effect_template['effect_name']} for ability {self.name}")
             else:
                 logging.error(f"Effect class {effect_class_name} not found for ability {self.name}")
-        self.current_cooldown = self.max_cooldown
+        if self.max_cooldown or self.current_cooldown:
+            self.current_cooldown = self.max_cooldown
+            mark(user, COOLDOWNS)
         return power
 
     def calculate_power(self, user: 'Creature') -> int:
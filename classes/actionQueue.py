@@ -0,0 +1,166 @@
+# this file contains the opcode action encoding and the batched action executor
+# An action is four integers: opcode, performer index, target index and payload
+# (the ability or item index in the performer's lists). A round of actions is
+# queued in parallel arrays and executed in one pass through a dispatch table,
+# so large battles do not allocate an Action object per turn.
+from array import array
+from typing import Callable, List
+
+from classes.actions import AbilityAction, Action, AttackAction, DefendAction, UseItemAction, WaitAction, attack, use_item
+
+# Opcodes
+WAIT = 0
+ATTACK = 1
+ABILITY = 2
+DEFEND = 3
+USE_ITEM = 4
+
+NO_TARGET = -1
+
+
+def _wait(performer, target, payload):
+    return None
+
+
+def _attack(performer, target, payload):
+    return attack(performer, target)
+
+
+def _ability(performer, target, payload):
+    return performer.abilities[payload].use(performer, target)
+
+
+def _defend(performer, target, payload):
+    return performer.defend()
+
+
+def _use_item(performer, target, payload):
+    return use_item(performer, target, performer.inventory.items[payload])
+
+
+# Opcode -> handler(performer, target, payload)
+DISPATCH: List[Callable] = [_wait, _attack, _ability, _defend, _use_item]
+
+
+def encode_action(action: Action):
+    """
+    (opcode, performer, target, payload) of an Action object.
+    """
+    if isinstance(action, AbilityAction):
+        payload = next(i for i, ability in enumerate(action.performer.abilities) if ability is action.ability)
+        return ABILITY, action.performer, action.target, payload
+    if isinstance(action, UseItemAction):
+        payload = next(i for i, item in enumerate(action.performer.inventory.items) if item is action.item)
+        return USE_ITEM, action.performer, action.target, payload
+    if isinstance(action, AttackAction):
+        return ATTACK, action.performer, action.target, 0
+    if isinstance(action, DefendAction):
+        return DEFEND, action.performer, action.target, 0
+    if isinstance(action, WaitAction):
+        return WAIT, action.performer, action.target, 0
+    raise ValueError(f"Action type not supported: {type(action).__name__}")
+
+
+def decode_action(opcode: int, performer, target, payload: int) -> Action:
+    """
+    Action object of an encoded action.
+    """
+    if opcode == ABILITY:
+        return AbilityAction(performer, target, performer.abilities[payload])
+    if opcode == USE_ITEM:
+        return UseItemAction(performer, target, performer.inventory.items[payload])
+    if opcode == ATTACK:
+        return AttackAction(performer, target)
+    if opcode == DEFEND:
+        return DefendAction(performer, target)
+    if opcode == WAIT:
+        return WaitAction(performer, target)
+    raise ValueError(f"Unknown opcode: {opcode}")
+
+
+class ActionQueue:
+    """
+    Collects the encoded actions of a round and executes them in one pass.
+    Combatants are referred to by their index in the combatants list.
+    """
+    def __init__(self, combatants: list):
+        self.combatants: list = list(combatants)
+        self.indexes: dict = {id(combatant): i for i, combatant in enumerate(self.combatants)}
+        self.opcodes: array = array('b')
+        self.performers: array = array('i')
+        self.targets: array = array('i')
+        self.payloads: array = array('i')
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def index(self, combatant) -> int:
+        return NO_TARGET if combatant is None else self.indexes[id(combatant)]
+
+    def push(self, opcode: int, performer, target=None, payload: int = 0) -> None:
+        """
+        Queue an action, performer and target are combatants.
+        """
+        self.opcodes.append(opcode)
+        self.performers.append(self.indexes[id(performer)])
+        self.targets.append(NO_TARGET if target is None else self.indexes[id(target)])
+        self.payloads.append(payload)
+
+    def push_action(self, action: Action) -> None:
+        """
+        Queue an Action object.
+        """
+        self.push(*encode_action(action))
+
+    def action(self, position: int) -> Action:
+        """
+        Action object of a queued action.
+        """
+        target = self.targets[position]
+        return decode_action(
+            self.opcodes[position],
+            self.combatants[self.performers[position]],
+            None if target == NO_TARGET else self.combatants[target],
+            self.payloads[position]
+        )
+
+    def clear(self) -> None:
+        del self.opcodes[:]
+        del self.performers[:]
+        del self.targets[:]
+        del self.payloads[:]
+
+    def execute(self, is_over: Callable[[], bool] = None, retarget: Callable = None) -> list:
+        """
+        Execute the queued actions in order and clear the queue, returns their results.
+        The queue is cleared even if an action raises, its actions are never replayed.
+        Actions of combatants that died earlier in the pass are skipped (None result).
+        is_over is checked before each action, the pass stops once it returns True.
+        retarget(performer) picks a new target when the queued one died earlier in
+        the pass, the action is skipped if it returns None.
+        """
+        combatants = self.combatants
+        dispatch = DISPATCH
+        results = []
+        append = results.append
+        try:
+            for opcode, performer, target, payload in zip(self.opcodes, self.performers, self.targets, self.payloads):
+                if is_over is not None and is_over():
+                    break
+                performer = combatants[performer]
+                if not performer.is_alive:
+                    append(None)
+                    continue
+                if target == NO_TARGET:
+                    target = None
+                else:
+                    target = combatants[target]
+                    if not target.is_alive and retarget is not None:
+                        target = retarget(performer)
+                        if target is None:
+                            append(None)
+                            continue
+                append(dispatch[opcode](performer, target, payload))
+        finally:
+            self.clear()
+        return results
@@ -1,4 +1,23 @@
-from abilities import Ability
+from classes.abilities import Ability
+from classes.attackResolution import resolve_attack
+
+
+def attack(performer, target) -> int:
+    """Basic attack, a d20 roll against the target's defense, see attackResolution.
+    Returns the damage roll, 0 on a miss and doubled on a critical"""
+    _, damage = resolve_attack(performer, target)
+    if damage:
+        target.take_damage(damage, performer.damage_type, "attack", performer)
+    return damage
+
+
+def use_item(performer, target, item):
+    """Consume an item from the performer's inventory on the target"""
+    inventory = getattr(performer, 'inventory', None)
+    if inventory is not None and item in inventory.items:
+        inventory.remove_item(item)
+    return item.use(target, performer)
+
 
 class Action:
     def __init__(self, performer, target):
@@ -17,27 +36,24 @@ class Action:
         """List characters that can be targeted"""
         return []
 
+class AttackAction(Action):
+    def execute(self):
+        """Attack the target: d20 against its defense, damage rolled between min_attack and max_attack"""
+        return attack(self.performer, self.target)
+
 class AbilityAction(Action):
     def __init__(self, performer, target, ability: Ability):
         super().__init__(performer, target)
         self.ability = ability
     
     def execute(self):
-        """Execute the ability on the target"""
-        if self.ability.is_offensive:
-            damage = self.ability.calculate_power(self.performer)
-            self.target.take_damage(damage)
-        else:
-            heal = self.ability.calculate_power(self.performer)
-            self.target.heal(heal)
-        # Apply effects if any
-        for effect in self.ability.effects:
-            self.target.apply_effect(effect)
+        """Execute the ability on the target, paying its cost and applying its effects"""
+        return self.ability.use(self.performer, self.target)
 
 class DefendAction(Action):
     def execute(self):
         """Increase the performer's defense for a turn"""
-        self.performer.defend()
+        return self.performer.defend()
 
 class WaitAction(Action):
     def execute(self):
@@ -51,4 +67,4 @@ class UseItemAction(Action):
     
     def execute(self):
         """Use an item on the target"""
-        self.item.use(self.target)
\ No newline at end of file
+        return use_item(self.performer, self.target, self.item)
@@ -0,0 +1,71 @@
+# this file contains the attack resolution rules and their lookup tables
+# A basic attack rolls a d20 plus the attacker's attack bonus against the
+# target's defense: a natural 1 always misses, a natural 20 always hits and is
+# critical. The damage roll, between min_attack and max_attack, is doubled on a
+# critical. The outcome of every d20 face only depends on (attack bonus,
+# defense), so it is computed once per pair into a table of damage multipliers:
+# resolving an attack is then one random draw and two lookups, without branching.
+import random
+from typing import Dict, Tuple
+
+# Outcomes, which are also the damage multipliers
+MISS = 0
+HIT = 1
+CRITICAL = 2
+
+D20 = 20
+NATURAL_MISS = 1
+NATURAL_CRITICAL = 20
+
+# (attack bonus, defense) -> outcome of each d20 face, face 1 first
+_tables: Dict[Tuple[int, int], bytes] = {}
+
+
+def outcome(roll: int, attack_bonus: int, defense: int) -> int:
+    """
+    Outcome of a d20 roll, the rule the tables are built from.
+    """
+    if roll == NATURAL_MISS:
+        return MISS
+    if roll == NATURAL_CRITICAL:
+        return CRITICAL
+    return HIT if roll + attack_bonus >= defense else MISS
+
+
+def outcome_table(attack_bonus: int, defense: int) -> bytes:
+    """
+    Outcome of every d20 face for an attack bonus against a defense, computed on first use.
+    """
+    table = _tables.get((attack_bonus, defense))
+    if table is None:
+        table = _tables[attack_bonus, defense] = bytes(outcome(roll, attack_bonus, defense) for roll in range(1, D20 + 1))
+    return table
+
+
+def outcome_counts(attack_bonus: int, defense: int) -> Tuple[int, int, int]:
+    """
+    Number of d20 faces that miss, hit and are critical.
+    """
+    table = outcome_table(attack_bonus, defense)
+    return table.count(MISS), table.count(HIT), table.count(CRITICAL)
+
+
+def hit_chance(attack_bonus: int, defense: int) -> float:
+    """
+    Probability that an attack hits, criticals included.
+    """
+    return 1 - outcome_table(attack_bonus, defense).count(MISS) / D20
+
+
+def resolve_attack(attacker, target) -> Tuple[int, int]:
+    """
+    (outcome, damage) of a basic attack: the damage roll times the outcome's multiplier,
+    before the target's resistances. The d20 and the damage roll come from a single draw.
+    """
+    low = attacker.min_attack
+    faces = attacker.max_attack - low + 1
+    if faces < 1:
+        faces = 1
+    draw = random.randrange(D20 * faces)
+    result = outcome_table(attacker.attack_bonus, target.defense)[draw % D20]
+    return result, (low + draw // D20) * result
@@ -0,0 +1,240 @@
+# this file contains the automated balance tuner
+# Candidate template patches are scored by simulating fights with the pipeline.
+# Successive halving keeps the search cheap: every candidate gets a few fights,
+# only the best fraction survives to the next rung, which gets eta times more.
+import copy
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+from classes import templateStore
+from classes.pipeline import EncounterSpec, simulate
+from classes.spawner import Spawner
+from classes.templateStore import TEMPLATE_DIR, TEMPLATE_FILES, get_templates
+
+# Scenario: (hero classes, monster types)
+Scenario = Tuple[List[str], List[str]]
+
+
+class Parameter:
+    """
+    One tunable template value, e.g. Parameter("abilities", ("Fireball", "power"), 10, 60)
+    or Parameter("effects", ("DamageOverTimeEffect", "Burning", "potency"), 1, 10).
+    Values are drawn from low, low + step, ..., high.
+    """
+    def __init__(self, kind: str, path: Sequence[str], low: float, high: float, step: float = 1):
+        if kind not in TEMPLATE_FILES:
+            raise ValueError(f"Unknown template kind {kind}")
+        self.kind: str = kind
+        self.path: Tuple[str, ...] = tuple(path)
+        self.low: float = low
+        self.high: float = high
+        self.step: float = step
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{'.'.join(self.path)}"
+
+    def values(self) -> List[float]:
+        count = int(round((self.high - self.low) / self.step)) + 1
+        values = [self.low + i * self.step for i in range(count)]
+        if all(isinstance(value, int) for value in (self.low, self.step)):
+            return [int(value) for value in values]
+        return values
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.choice(self.values())
+
+    def current(self, templates: Dict[str, dict]):
+        node = templates[self.kind]
+        for key in self.path:
+            node = node[key]
+        return node
+
+    def apply(self, templates: Dict[str, dict], value) -> None:
+        node = templates[self.kind]
+        for key in self.path[:-1]:
+            node = node[key]
+        if self.path[-1] not in node:
+            raise KeyError(f"{self.name} does not exist in the templates")
+        node[self.path[-1]] = value
+
+
+def patch_templates(templates: Dict[str, dict], parameters: List[Parameter], values: Sequence) -> Dict[str, dict]:
+    """
+    Deep copy of the templates with the parameter values applied.
+    """
+    patched = copy.deepcopy(templates)
+    for parameter, value in zip(parameters, values):
+        parameter.apply(patched, value)
+    return patched
+
+
+def evaluate(templates: Dict[str, dict], scenarios: List[Scenario], seeds: Sequence[int], max_rounds: int = 100) -> Tuple[int, int, int]:
+    """
+    Fight one encounter per seed with the given templates, cycling through the scenarios.
+    Returns (wins, fights, total rounds of the fights).
+    Runs in worker processes, the templates are installed in the store for the
+    duration so that effects created during the fights use them too.
+    """
+    wins = rounds = 0
+    with templateStore.override(templates):
+        spawner = Spawner.from_store()
+        specs = (
+            EncounterSpec(seed, *scenarios[seed % len(scenarios)], seed=seed)
+            for seed in seeds
+        )
+        for record in simulate(specs, spawner, max_rounds):
+            wins += record["win"]
+            rounds += record["rounds"]
+    return wins, len(seeds), rounds
+
+
+class Candidate:
+    """
+    One point of the search space with its accumulated fight statistics
+    """
+    def __init__(self, values: Tuple):
+        self.values: Tuple = values
+        self.wins: int = 0
+        self.fights: int = 0
+        self.rounds: int = 0
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.fights if self.fights else 0.0
+
+    @property
+    def mean_rounds(self) -> float:
+        return self.rounds / self.fights if self.fights else 0.0
+
+    def __repr__(self) -> str:
+        return f"Candidate({self.values}, win_rate={self.win_rate:.3f}, mean_rounds={self.mean_rounds:.2f}, fights={self.fights})"
+
+
+class TuningResult:
+    """
+    Outcome of a tuning run
+    """
+    def __init__(self, best: Candidate, score: float, parameters: List[Parameter], templates: Dict[str, dict], history: List[List[Candidate]], fights: int):
+        self.best: Candidate = best
+        self.score: float = score
+        self.values: Dict[str, float] = {parameter.name: value for parameter, value in zip(parameters, best.values)}
+        self.templates: Dict[str, dict] = templates  # patched templates of every kind
+        self.history: List[List[Candidate]] = history  # candidates at the end of each rung, best first
+        self.fights: int = fights  # fights simulated in total
+
+
+class BalanceTuner:
+    """
+    Searches template parameters toward a target win rate and/or mean fight length (TTK in rounds).
+    Candidates are evaluated in parallel with workers processes (0 evaluates in this process).
+    """
+    def __init__(self,
+        parameters: List[Parameter],
+        scenarios: List[Scenario],
+        target_win_rate: float = None,
+        target_rounds: float = None,
+        templates: Dict[str, dict] = None,
+        max_rounds: int = 100,
+        workers: int = 0,
+        seed: int = 0):
+        if target_win_rate is None and target_rounds is None:
+            raise ValueError("A target win rate or a target number of rounds is required")
+        self.parameters: List[Parameter] = parameters
+        self.scenarios: List[Scenario] = scenarios
+        self.target_win_rate: float = target_win_rate
+        self.target_rounds: float = target_rounds
+        self.templates: Dict[str, dict] = templates or {kind: get_templates(kind) for kind in TEMPLATE_FILES}
+        self.max_rounds: int = max_rounds
+        self.workers: int = workers
+        self.rng: random.Random = random.Random(seed)
+
+    def score(self, candidate: Candidate) -> float:
+        """
+        Distance to the targets, lower is better. The fight length error is relative to the target.
+        """
+        score = 0.0
+        if self.target_win_rate is not None:
+            score += abs(candidate.win_rate - self.target_win_rate)
+        if self.target_rounds is not None:
+            score += abs(candidate.mean_rounds - self.target_rounds) / self.target_rounds
+        return score
+
+    def sample(self, count: int) -> List[Candidate]:
+        """
+        The current template values followed by distinct random candidates.
+        """
+        current = tuple(parameter.current(self.templates) for parameter in self.parameters)
+        seen = {current}
+        candidates = [Candidate(current)]
+        space = math.prod(len(parameter.values()) for parameter in self.parameters)
+        while len(candidates) < min(count, space):
+            values = tuple(parameter.sample(self.rng) for parameter in self.parameters)
+            if values not in seen:
+                seen.add(values)
+                candidates.append(Candidate(values))
+        return candidates
+
+    def evaluate_all(self, candidates: List[Candidate], seeds: range, executor) -> None:
+        """
+        Add the fights of seeds to every candidate. Every candidate fights the
+        same seeds, so differences between them are not drowned in dice noise.
+        """
+        jobs = [
+            (patch_templates(self.templates, self.parameters, candidate.values), self.scenarios, seeds, self.max_rounds)
+            for candidate in candidates
+        ]
+        results = executor.map(evaluate, *zip(*jobs)) if executor else (evaluate(*job) for job in jobs)
+        for candidate, (wins, fights, rounds) in zip(candidates, results):
+            candidate.wins += wins
+            candidate.fights += fights
+            candidate.rounds += rounds
+
+    def tune(self, candidates: int = 27, min_fights: int = 10, eta: int = 3, max_fights: int = 1000) -> TuningResult:
+        """
+        Successive halving: evaluate every candidate with min_fights fights, keep
+        the best 1/eta, give the survivors eta times as many fights, and so on
+        until one candidate is left or the next rung would exceed max_fights.
+        """
+        population = self.sample(candidates)
+        history = []
+        fights = 0
+        budget = min_fights
+        next_seed = 0
+        executor = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+        try:
+            while True:
+                # Top every survivor up to the rung's budget
+                seeds = range(next_seed, next_seed + budget - population[0].fights)
+                next_seed = seeds.stop
+                self.evaluate_all(population, seeds, executor)
+                fights += len(seeds) * len(population)
+                population.sort(key=self.score)
+                history.append([copy.copy(candidate) for candidate in population])
+                if len(population) == 1 or budget * eta > max_fights:
+                    break
+                population = population[:max(1, len(population) // eta)]
+                budget *= eta
+        finally:
+            if executor:
+                executor.shutdown()
+
+        best = population[0]
+        return TuningResult(
+            best, self.score(best), self.parameters,
+            patch_templates(self.templates, self.parameters, best.values), history, fights
+        )
+
+
+def write_templates(templates: Dict[str, dict], template_dir: str = TEMPLATE_DIR, kinds: List[str] = None) -> None:
+    """
+    Write patched templates back to their JSON files.
+    """
+    for kind in kinds or templates:
+        with open(os.path.join(template_dir, TEMPLATE_FILES[kind]), 'w', encoding='utf-8') as file:
+            json.dump(templates[kind], file, indent=4, ensure_ascii=False)
+            file.write("\n")
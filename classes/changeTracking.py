@@ -0,0 +1,269 @@
+# this file contains the creature change tracking and the delta subscriptions
+# Creatures mark the fields they change in a dirty bitmask: hp through
+# TrackedAttribute descriptors, effects through their EffectManager and cooldowns when
+# abilities are used or tick down. Equipment managers count their changes, and
+# resources, which a ResourcePool regenerates in bulk, are compared by value.
+# Once per tick a DeltaTracker turns the marks into compact per-creature deltas
+# and hands every subscription the part it watches.
+import itertools
+import json
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Dirty bits, plain ints like the damage type masks
+HP = 1  # hp, max_hp and is_alive
+RESOURCES = 2
+EFFECTS = 4  # effect list and durations
+COOLDOWNS = 8
+EQUIPMENT = 16
+ALL_FIELDS = HP | RESOURCES | EFFECTS | COOLDOWNS | EQUIPMENT
+
+# Unique id of every creature, clones included
+_uids = itertools.count(1)
+
+
+def next_uid() -> int:
+    return next(_uids)
+
+
+class TrackedAttribute:
+    """
+    Creature attribute that sets a dirty bit when it is assigned.
+    A data descriptor, so only the tracked attributes pay for the mark. The value
+    is kept in the instance __dict__ under the attribute name, writing it there
+    directly restores a value without marking it.
+    """
+    def __init__(self, field: int):
+        self.field: int = field
+        self.name: str = None
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def __get__(self, creature, owner=None):
+        if creature is None:
+            return self
+        try:
+            return creature.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(f"{type(creature).__name__!r} object has no attribute {self.name!r}") from None
+
+    def __set__(self, creature, value) -> None:
+        creature.__dict__[self.name] = value
+        creature.dirty |= self.field
+
+
+def mark(creature, field: int) -> None:
+    """
+    Mark a field of a creature dirty.
+    """
+    creature.dirty = getattr(creature, 'dirty', 0) | field
+
+
+def hp_state(creature) -> Dict:
+    return {"hp": creature.hp, "max_hp": creature.max_hp, "alive": creature.is_alive}
+
+
+def resource_values(creature) -> Tuple[tuple, tuple]:
+    """
+    (resource types, current values), read straight from the pool.
+    """
+    resources = creature.resources
+    return tuple(resources.slots), tuple(map(resources.pool.current.__getitem__, resources.slots.values()))
+
+
+def resource_state(values: Tuple[tuple, tuple], previous: Tuple[tuple, tuple] = None) -> Dict[str, int]:
+    """
+    Resource name -> value, only the values that differ from previous if given.
+    """
+    if previous is None:
+        return {str(resource_type): value for resource_type, value in zip(*values)}
+    last = dict(zip(*previous))
+    return {str(resource_type): value for resource_type, value in zip(*values) if last.get(resource_type) != value}
+
+
+def effect_state(creature) -> List[List]:
+    return [[effect.name, effect.duration] for effect in creature.effect_manager.active_effects]
+
+
+def cooldown_state(creature) -> List[int]:
+    return [ability.current_cooldown for ability in creature.abilities]
+
+
+def equipment_state(creature) -> Dict[str, str]:
+    equipment_manager = getattr(creature, 'equipment_manager', None)
+    if equipment_manager is None:
+        return {}
+    return {str(slot): item.name if item is not None else None for slot, item in equipment_manager.equipped_items.items()}
+
+
+def full_state(creature, fields: int = ALL_FIELDS) -> Dict:
+    """
+    Every watched field of a creature, sent to new subscribers.
+    """
+    state = {"name": creature.name}
+    if fields & HP:
+        state.update(hp_state(creature))
+    if fields & RESOURCES:
+        state["resources"] = resource_state(resource_values(creature))
+    if fields & EFFECTS:
+        state["effects"] = effect_state(creature)
+    if fields & COOLDOWNS:
+        state["cooldowns"] = cooldown_state(creature)
+    if fields & EQUIPMENT:
+        state["equipment"] = equipment_state(creature)
+    return state
+
+
+# Field bit -> keys of a delta
+FIELD_KEYS: Dict[int, Tuple[str, ...]] = {
+    HP: ("hp", "max_hp", "alive"),
+    RESOURCES: ("resources",),
+    EFFECTS: ("effects",),
+    COOLDOWNS: ("cooldowns",),
+    EQUIPMENT: ("equipment",)
+}
+
+
+def filter_fields(delta: Dict, fields: int) -> Dict:
+    keys = {key for field, field_keys in FIELD_KEYS.items() if fields & field for key in field_keys}
+    return {key: value for key, value in delta.items() if key in keys}
+
+
+def encode(delta: Dict) -> bytes:
+    """
+    Compact JSON of a delta, for the wire.
+    """
+    return json.dumps(delta, separators=(',', ':')).encode('utf-8')
+
+
+class Subscription:
+    """
+    Deltas of some creatures (all the tracker's by default) and fields.
+    Deltas are queued until poll(), or handed to callback as soon as they are built.
+    Each delta is {"tick": n, "creatures": {uid: {field: value}}}, the first one holds the full state.
+    """
+    def __init__(self, tracker: 'DeltaTracker', uids: frozenset = None, fields: int = ALL_FIELDS, callback: Callable[[Dict], None] = None):
+        self.tracker: 'DeltaTracker' = tracker
+        self.uids: frozenset = uids  # None watches every creature of the tracker
+        self.fields: int = fields
+        self.callback: Callable[[Dict], None] = callback
+        self.pending: List[Dict] = []
+
+    def deliver(self, delta: Dict) -> None:
+        if self.callback is not None:
+            self.callback(delta)
+        else:
+            self.pending.append(delta)
+
+    def poll(self) -> List[Dict]:
+        """
+        Deltas received since the last poll.
+        """
+        pending, self.pending = self.pending, []
+        return pending
+
+    def close(self) -> None:
+        self.tracker.unsubscribe(self)
+
+
+class DeltaTracker:
+    """
+    Turns the dirty marks of the watched creatures into per-tick deltas for its subscriptions.
+    A creature should be watched by a single tracker: tick() clears its dirty marks.
+    """
+    def __init__(self, creatures: Iterable = ()):
+        self.tick_count: int = 0
+        # uid -> creature
+        self.creatures: Dict[int, object] = {}
+        # uid -> (resource values, equipment revision) last sent
+        self.sent: Dict[int, Tuple[tuple, int]] = {}
+        self.subscriptions: List[Subscription] = []
+        self.watch(creatures)
+
+    def watch(self, creatures: Iterable) -> None:
+        for creature in creatures:
+            self.creatures[creature.uid] = creature
+            self.sent[creature.uid] = (resource_values(creature), self.equipment_revision(creature))
+            creature.dirty = 0
+
+    def unwatch(self, creatures: Iterable) -> None:
+        for creature in creatures:
+            self.creatures.pop(creature.uid, None)
+            self.sent.pop(creature.uid, None)
+
+    @staticmethod
+    def equipment_revision(creature) -> int:
+        equipment_manager = getattr(creature, 'equipment_manager', None)
+        return -1 if equipment_manager is None else equipment_manager.revision
+
+    def subscribe(self, creatures: Iterable = None, fields: int = ALL_FIELDS, callback: Callable[[Dict], None] = None) -> Subscription:
+        """
+        Subscribe to some creatures (every watched creature by default) and fields.
+        The full state of the subscribed creatures is delivered right away.
+        """
+        uids = None if creatures is None else frozenset(creature.uid for creature in creatures)
+        subscription = Subscription(self, uids, fields, callback)
+        self.subscriptions.append(subscription)
+        watched = self.creatures if uids is None else {uid: self.creatures[uid] for uid in uids if uid in self.creatures}
+        subscription.deliver({
+            "tick": self.tick_count,
+            "creatures": {uid: full_state(creature, fields) for uid, creature in watched.items()}
+        })
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def changes(self) -> Dict[int, Tuple[int, Dict]]:
+        """
+        uid -> (dirty bits, changed fields) of every creature that changed since the last tick,
+        and clear the marks.
+        """
+        changes = {}
+        sent = self.sent
+        for uid, creature in self.creatures.items():
+            dirty = creature.dirty
+            resources = resource_values(creature)
+            last_resources, last_revision = sent[uid]
+            if resources != last_resources:
+                dirty |= RESOURCES
+            revision = self.equipment_revision(creature)
+            if revision != last_revision:
+                dirty |= EQUIPMENT
+            if not dirty:
+                continue
+            creature.dirty = 0
+            sent[uid] = (resources, revision)
+            delta = {}
+            if dirty & HP:
+                delta.update(hp_state(creature))
+            if dirty & RESOURCES:
+                delta["resources"] = resource_state(resources, last_resources)
+            if dirty & EFFECTS:
+                delta["effects"] = effect_state(creature)
+            if dirty & COOLDOWNS:
+                delta["cooldowns"] = cooldown_state(creature)
+            if dirty & EQUIPMENT:
+                delta["equipment"] = equipment_state(creature)
+            changes[uid] = (dirty, delta)
+        return changes
+
+    def tick(self) -> Dict[int, Dict]:
+        """
+        Build this tick's deltas and deliver them, returns uid -> changed fields.
+        Subscriptions only get the creatures and fields they watch, and nothing when none changed.
+        """
+        self.tick_count += 1
+        changes = self.changes()
+        for subscription in self.subscriptions:
+            uids, fields = subscription.uids, subscription.fields
+            creatures = {}
+            for uid, (dirty, delta) in changes.items():
+                if (uids is None or uid in uids) and dirty & fields:
+                    if fields != ALL_FIELDS:
+                        delta = filter_fields(delta, fields)
+                    creatures[uid] = delta
+            if creatures:
+                subscription.deliver({"tick": self.tick_count, "creatures": creatures})
+        return {uid: delta for uid, (_, delta) in changes.items()}
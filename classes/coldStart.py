@@ -0,0 +1,91 @@
+# this file measures the cold-start cost of importing the game package
+# Each measurement runs in a fresh interpreter, like a short-lived worker would.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules a simulation worker imports
+WORKER_MODULES = [
+    "classes.creature",
+    "classes.abilities",
+    "classes.effects",
+    "classes.inventory",
+    "classes.actions",
+    "classes.combatManager",
+    "classes.spawner"
+]
+
+# Budget for importing WORKER_MODULES, interpreter startup excluded
+IMPORT_BUDGET_MS = 50.0
+
+PROBE = """
+import json, logging, sys, time
+opened = []
+def audit(event, args):
+    if event == "open" and isinstance(args[0], str) and not args[0].endswith((".py", ".pyc", ".so")):
+        opened.append(args[0])
+sys.addaudithook(audit)
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_ms": elapsed * 1000, "opened": opened, "logging_handlers": len(logging.getLogger().handlers)}}))
+"""
+
+
+def probe(modules: List[str] = None, cwd: str = None) -> Dict:
+    """
+    Import modules in a fresh interpreter.
+    Returns the import time in milliseconds, the non-code files opened and
+    the number of handlers installed on the root logger.
+    """
+    modules = modules or WORKER_MODULES
+    env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=modules)],
+        cwd=cwd or PACKAGE_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def measure_cold_start(modules: List[str] = None, runs: int = 5) -> Dict:
+    """
+    Run the import probe several times and summarize it.
+    """
+    probes = [probe(modules) for _ in range(runs)]
+    timings = [p["import_ms"] for p in probes]
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "budget_ms": IMPORT_BUDGET_MS,
+        "opened": sorted({path for p in probes for path in p["opened"]}),
+        "logging_handlers": max(p["logging_handlers"] for p in probes)
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the game package.")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="number of fresh interpreters to measure")
+    args = parser.parse_args(argv)
+
+    report = measure_cold_start(runs=args.runs)
+    print(f"import: median {report['median_ms']:.1f} ms (min {report['min_ms']:.1f}, max {report['max_ms']:.1f}, budget {report['budget_ms']:.0f})")
+    failed = report["median_ms"] > IMPORT_BUDGET_MS
+    if report["opened"]:
+        print("files opened at import: " + ", ".join(report["opened"]))
+        failed = True
+    if report["logging_handlers"]:
+        print("logging was configured at import")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,36 @@
-from actions import AbilityAction, DefendAction, WaitAction, UseItemAction
+from classes.actions import AbilityAction, AttackAction, DefendAction, WaitAction, UseItemAction
+from classes.actionQueue import ABILITY, ATTACK, WAIT, ActionQueue, decode_action
+from classes.abilities import AbilityError
+from classes.enums import TargetType
+from classes.resources import ResourcePool, Resources
+from classes.templateStore import snapshot
+from classes.threat import ThreatBoard
 
 class CombatManager:
-    def __init__(self, heroes, monsters):
+    def __init__(self, heroes, monsters, auto_heroes: bool = False, max_rounds: int = None, batched: bool = False, threat: bool = False):
         self.heroes = heroes
         self.monsters = monsters
+        self.auto_heroes = auto_heroes  # let the AI play the heroes too
+        self.max_rounds = max_rounds
+        self.round = 0
         self.turn_order = self.calculate_initiative_order()
+        # The combatants' resources are moved into one pool, regenerated once per round
+        # except those of the dead, paused when they die
+        self.resource_pool = ResourcePool()
+        for combatant in self.turn_order:
+            if isinstance(getattr(combatant, 'resources', None), Resources):
+                combatant.resources.move_to(self.resource_pool)
+                if not combatant.is_alive:
+                    combatant.resources.pause()
+        # batched: every combatant picks its action at the start of the round,
+        # then the round runs in one pass through an ActionQueue
+        self.batched = batched
+        self.action_queue = ActionQueue(self.turn_order) if batched else None
+        self.focus = {}
+        # threat: monsters attack the hero with the highest threat against them, see classes.threat
+        self.threat = ThreatBoard(monsters, heroes) if threat else None
+        # Templates of the whole fight (effects created during the fight), even if they are reloaded meanwhile
+        self.templates = snapshot()
     
     def calculate_initiative_order(self):
         """Sort all combatants by initiative"""
@@ -16,6 +42,14 @@ class CombatManager:
         heroes_alive = any(hero.is_alive for hero in self.heroes)
         monsters_alive = any(monster.is_alive for monster in self.monsters)
         return not (heroes_alive and monsters_alive)
+
+    def winner(self):
+        """Return 'heroes' or 'monsters' once one side is left standing, None otherwise"""
+        heroes_alive = any(hero.is_alive for hero in self.heroes)
+        monsters_alive = any(monster.is_alive for monster in self.monsters)
+        if heroes_alive == monsters_alive:
+            return None
+        return 'heroes' if heroes_alive else 'monsters'
     
     def get_next_turn(self):
         """Cycle through turn order"""
@@ -26,8 +60,11 @@ class CombatManager:
     def resolve_turn(self, active_combatant):
         """Execute a single turn"""
         chosen_action = self.select_action(active_combatant)
+        if chosen_action is None:
+            return None
         action_result = chosen_action.execute()
         # Additional logging or game state updates
+        return action_result
 
     def select_action(self, combatant):
         """Select an action for the combatant"""
@@ -41,18 +78,115 @@ class CombatManager:
 
     def player_select_action(self, hero):
         """Player selects an action for the hero"""
+        if self.auto_heroes:
+            return self.auto_select_action(hero, self.monsters)
         # Placeholder for player input logic
         # Example: return AbilityAction(hero, target, ability)
         pass
 
     def monster_select_action(self, monster):
         """AI selects an action for the monster"""
-        # Placeholder for AI logic
-        # Example: return AbilityAction(monster, target, ability)
-        pass
+        return decode_action(*self.auto_select(monster, self.heroes, self.threat_target(monster)))
+
+    def threat_target(self, monster):
+        """Living hero with the highest threat against monster, None without threat tracking or threat"""
+        return self.threat.target(monster) if self.threat is not None else None
+
+    def auto_select_action(self, combatant, enemies):
+        """
+        Simple AI: use the first ability that can be used, a basic attack otherwise,
+        against the living enemy with the least hp.
+        Healing abilities are only used on the combatant itself when it is hurt.
+        """
+        return decode_action(*self.auto_select(combatant, enemies))
+
+    def auto_select(self, combatant, enemies, target=None):
+        """
+        Encoded (opcode, performer, target, payload) form of auto_select_action.
+        target skips the search for the weakest enemy when it is already known.
+        """
+        target = target or self.weakest(enemies)
+        if target is None:
+            return WAIT, combatant, None, 0
+        for index, ability in enumerate(combatant.abilities):
+            if ability.is_offensive:
+                ability_target = combatant if ability.target_type == TargetType.SELF else target
+            elif ability.target_type == TargetType.SELF and combatant.hp < combatant.max_hp:
+                ability_target = combatant
+            else:
+                continue
+            try:
+                ability.can_use(combatant, ability_target)
+            except AbilityError:
+                continue
+            return ABILITY, combatant, ability_target, index
+        return ATTACK, combatant, target, 0
+
+    @staticmethod
+    def weakest(creatures):
+        """Living creature with the least hp, None if there is none"""
+        return min((creature for creature in creatures if creature.is_alive), key=lambda creature: creature.hp, default=None)
+
+    def retarget(self, combatant):
+        """New target of a queued action whose target died: the side's focus, re-picked once it dies"""
+        if not combatant.is_hero:
+            target = self.threat_target(combatant)
+            if target is not None:
+                return target
+        target = self.focus[combatant.is_hero]
+        if target is None or not target.is_alive:
+            target = self.focus[combatant.is_hero] = self.weakest(self.monsters if combatant.is_hero else self.heroes)
+        return target
+
+    def queue_round(self):
+        """
+        Queue the action of every living combatant, in turn order.
+        Each side focuses the weakest enemy at the start of the round,
+        monsters attack their highest-threat hero instead when threat is tracked.
+        """
+        # is_hero of the attacking side -> its focus target
+        self.focus = {True: self.weakest(self.monsters), False: self.weakest(self.heroes)}
+        for combatant in self.get_next_turn():
+            if combatant.is_hero and not self.auto_heroes:
+                action = self.player_select_action(combatant)
+                if action is not None:
+                    self.action_queue.push_action(action)
+            else:
+                enemies = self.monsters if combatant.is_hero else self.heroes
+                target = None if combatant.is_hero else self.threat_target(combatant)
+                self.action_queue.push(*self.auto_select(combatant, enemies, target or self.focus[combatant.is_hero]))
+
+    def end_round(self):
+        """Update effects and cooldowns of every living combatant, then regenerate resources and decay threat"""
+        for combatant in self.turn_order:
+            if combatant.is_alive:
+                combatant.update_turn()
+        self.resource_pool.regenerate()
+        if self.threat is not None:
+            self.threat.end_turn()
+
+    def play_round(self):
+        """Queue and execute one batched round, returns the results of its actions"""
+        self.queue_round()
+        results = self.action_queue.execute(self.is_combat_over, self.retarget)
+        self.end_round()
+        return results
 
     def start_combat(self):
-        """Start the combat loop"""
-        while not self.is_combat_over():
-            for combatant in self.get_next_turn():
-                self.resolve_turn(combatant)
\ No newline at end of file
+        """Start the combat loop, returns the winning side (None if max_rounds was reached)"""
+        with self.templates.activate():
+            try:
+                while not self.is_combat_over() and (self.max_rounds is None or self.round < self.max_rounds):
+                    self.round += 1
+                    if self.batched:
+                        self.play_round()
+                        continue
+                    for combatant in self.get_next_turn():
+                        if self.is_combat_over():
+                            break
+                        self.resolve_turn(combatant)
+                    self.end_round()
+                return self.winner()
+            finally:
+                if self.threat is not None:
+                    self.threat.release()
@@ -1,14 +1,73 @@
 from classes.effects import EffectManager
-from classes.inventory import Inventory, EquipmentManager
+from classes.inventory import Item, Inventory, EquipmentManager
 from classes.abilities import Ability
+from classes.changeTracking import COOLDOWNS, HP, TrackedAttribute, next_uid
+from classes.enums import DamageType
+from classes.resources import Resources, resource_spec
+from classes.templateStore import get_templates
 
+import copy
 import random
 from abc import ABC
-import json
 import logging
 
 
+def create_abilities(names: list, templates: dict = None) -> list:
+    """
+    Resolve a list of ability names into Ability objects.
+    Unknown names are logged and skipped.
+    """
+    templates = get_templates("abilities") if templates is None else templates
+    abilities = []
+    for ability_name in names:
+        if ability_name in templates:
+            abilities.append(Ability.create_ability(ability_name, templates[ability_name]))
+        else:
+            logging.error(f"Ability template not found for {ability_name}.")
+    return abilities
+
+
+class LazyAttribute:
+    """
+    Class attribute building a creature's sub-object, e.g. its effect manager, the first time it is read.
+    The sub-object is then stored on the creature and shadows this attribute, later reads are plain
+    attribute reads. Deleting it from the creature makes it lazy again.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name: str = name
+
+    def __get__(self, creature, owner: type = None):
+        if creature is None:
+            return self
+        value = self.factory(creature)
+        # Not a change of the creature, so no dirty flag
+        creature.__dict__[self.name] = value
+        return value
+
+
+def materialized(creature, attribute: str) -> bool:
+    """Whether a lazy sub-object of a creature was built"""
+    return attribute in creature.__dict__
+
+
 class Creature(ABC):
+    is_hero: bool = False
+    # Called with the creature when it dies, e.g. by a combat manager keeping live counts
+    on_death = None
+    # Called with (creature, attacker, damage) and (creature, healer, heal), e.g. by a ThreatBoard
+    on_damage = None
+    on_heal = None
+    # Fields changed since a DeltaTracker last looked, see changeTracking
+    dirty: int = 0
+    hp: int = TrackedAttribute(HP)
+    max_hp: int = TrackedAttribute(HP)
+    is_alive: bool = TrackedAttribute(HP)
+    # Built on first use, most creatures of a large world never need one
+    effect_manager: EffectManager = LazyAttribute(EffectManager)
+
     def __init__(
         self, 
         name: str = "rien", 
@@ -19,13 +78,16 @@ class Creature(ABC):
         defense: int = 10, 
         initiative: int = 10, 
         abilities: list = None, 
-        damage_type: str = 'physical', 
+        damage_type: DamageType = DamageType.PHYSICAL, 
         resistances: list = None, 
         weaknesses: list = None, 
         max_attack: int = 10, 
-        min_attack: int = 1):
+        min_attack: int = 1,
+        resources: dict = None,
+        attack_bonus: int = 0):
         
         # Initialize basic attributes
+        self.uid: int = next_uid()
         self.name: str = name
         self.level: int = level
         self.description: str = description
@@ -36,73 +98,103 @@ class Creature(ABC):
         
         # Combat stats
         self.defense: int = defense
+        self.defending: int = 0  # defense bonus from defend(), removed by update_turn
         self.initiative: int = initiative
         self.max_attack: int = max_attack
         self.min_attack: int = min_attack
-        self.damage_type: str = damage_type
-        self.resistances: list = resistances or []
-        self.weaknesses: list = weaknesses or []
+        self.attack_bonus: int = attack_bonus  # added to the d20 roll against the target's defense
+        self.damage_type: DamageType = DamageType.parse(damage_type)
+        # DamageType bitmasks, names or members are accepted
+        self.resistances: int = DamageType.mask(resistances)
+        self.weaknesses: int = DamageType.mask(weaknesses)
         
         # Abilities and effects
         self.abilities: list = abilities or []
         self.is_alive: bool = True
         
-        # Effect management
-        self.effect_manager: EffectManager = EffectManager(self)
-        
-        # Additional tracking
-        self.resources: dict = {
-            'mana': 100,
-            'stamina': 100
-        }
+        # Resource type -> (start, cap, regen), see resource_spec
+        self.resources: Resources = Resources(resources)
 
-    def take_damage(self, damage: int, damage_type: str = None, source: str = None) -> None:
+    def take_damage(self, damage: int, damage_type: DamageType = None, source: str = None, attacker: 'Creature' = None) -> None:
         """
         Sophisticated damage calculation with defense and resistances
+        attacker is the creature dealing the damage, if any, reported to the on_damage hook
         """
-        # Calculate damage multiplier based on target's resistances
-        multiply_damage = self.mutlitply_power(damage_type)
-
-        # Apply damage multiplier
-        multipled_damage = int(damage * multiply_damage)
-        # Apply damage reduction from defense if not from effect
-        if source == "effect":
-            print("source is effect")
-            actual_damage = max(multipled_damage, 0)
-        else:
-            actual_damage = max(multipled_damage - self.defense, 0)
+        actual_damage = self.compute_damage(damage, damage_type, source)
         
         # Apply damage to HP
         self.hp = max(self.hp - actual_damage, 0)
+        if self.on_damage is not None:
+            self.on_damage(self, attacker, actual_damage)
 
         # Verify if creature is still alive
-        if self.hp <= 0:
+        if self.hp <= 0 and self.is_alive:
             self.is_alive = False
+            self.resources.pause()
+            if self.on_death is not None:
+                self.on_death(self)
+
+    def compute_damage(self, damage: int, damage_type: DamageType = None, source: str = None) -> int:
+        """
+        Damage actually taken from a hit, after resistances and defense.
+        Does not change the creature, take_damage and the analytic engine both rely on it.
+        """
+        # Calculate damage multiplier based on target's resistances
+        multiply_damage = self.mutlitply_power(damage_type)
 
-    def heal(self, heal: int, heal_type: str) -> int:
+        # Apply damage multiplier
+        multipled_damage = int(damage * multiply_damage)
+        # Apply damage reduction from defense if not from an effect or an attack roll,
+        # attack rolls already had to beat the defense to hit
+        if source == "effect" or source == "attack":
+            return max(multipled_damage, 0)
+        return max(multipled_damage - self.defense, 0)
+
+    def heal(self, heal: int, heal_type: DamageType = None, healer: 'Creature' = None) -> None:
         """
         Heal the creature
+        healer is the creature healing it, if any, reported to the on_heal hook with the hp actually restored
         """
         multiply_heal = self.mutlitply_power(heal_type)
 
-        self.hp = min(self.hp + heal * multiply_heal, self.max_hp)
+        hp = self.hp
+        self.hp = min(self.hp + int(heal * multiply_heal), self.max_hp)
+        if self.on_heal is not None:
+            self.on_heal(self, healer, self.hp - hp)
     
-    def mutlitply_power(self, power_type: str) -> float:
+    def mutlitply_power(self, power_type: DamageType) -> float:
         """
         Calculate damage multiplier based on target's resistances
         """
+        if not power_type:
+            return 1.0
+        if isinstance(power_type, str):
+            power_type = DamageType.parse(power_type) or 0
+        # Plain int operations, IntFlag operators are slow
+        power_type = int(power_type)
+        resistant = self.resistances & power_type
+        weak = self.weaknesses & power_type
         # If has damage type as weakness and resistance, return 1.0 multiplier
-        if (hasattr(self, 'resistances') and power_type in self.resistances) and (hasattr(self, 'weaknesses') and power_type in self.weaknesses):
+        if resistant and weak:
             return 1.0
         # If has damage type as resistance, return 0.5 multiplier
-        elif hasattr(self, 'resistances') and power_type in self.resistances:
+        elif resistant:
             return 0.5
         # If has damage type as weakness, return 1.5 multiplier
-        elif hasattr(self, 'weaknesses') and power_type in self.weaknesses:
+        elif weak:
             return 1.5
         # If none of the above, return 1.0
         return 1.0
-    
+
+    def defend(self) -> int:
+        """
+        Raise defense by half until the next update_turn, returns the bonus
+        """
+        if not self.defending:
+            self.defending = max(self.defense // 2, 1)
+            self.defense += self.defending
+        return self.defending
+
     def get_available_actions(self) -> list:
         """
         Return possible actions based on current state
@@ -119,23 +211,47 @@ class Creature(ABC):
         """
         self.abilities.append(ability)
 
+    def clone(self) -> 'Creature':
+        """
+        Return a copy of the creature that shares no mutable state with it.
+        Used by the spawner to stamp out instances from a prototype.
+        """
+        clone = copy.copy(self)
+        clone.uid = next_uid()
+        clone.dirty = 0
+        clone.abilities = [copy.copy(ability) for ability in self.abilities]
+        clone.resources = self.resources.copy()
+        # The clone builds its own effect manager when it needs one
+        clone.__dict__.pop('effect_manager', None)
+        return clone
+
     def update_turn(self) -> None:
         """
         Called at the start or end of each turn
         Manages effects and ability cooldowns
         """
-        self.effect_manager.update_effects()
+        # A creature that never had an effect has nothing to update
+        effect_manager = self.__dict__.get('effect_manager')
+        if effect_manager is not None:
+            effect_manager.update_effects()
+
+        if self.defending:
+            self.defense -= self.defending
+            self.defending = 0
         
         # Update cooldowns for abilities
         if self.abilities != []:
-            print("updating cooldowns")
-                
             for ability in self.abilities:
-                print("ability: ", ability.name, "cooldown: ", ability.current_cooldown)
-                if hasattr(ability, 'update_cooldown'):
+                logging.debug(f"ability: {ability.name} cooldown: {ability.current_cooldown}")
+                if hasattr(ability, 'update_cooldown') and ability.current_cooldown > 0:
                     ability.update_cooldown()
+                    self.dirty |= COOLDOWNS
 
 class Hero(Creature):
+    is_hero: bool = True
+    inventory: Inventory = LazyAttribute(lambda hero: Inventory(hero.max_weight))
+    equipment_manager: EquipmentManager = LazyAttribute(lambda hero: EquipmentManager())
+
     def __init__(        self, 
         name: str = "rien", 
         level: int = 0, 
@@ -145,14 +261,18 @@ class Hero(Creature):
         defense: int = 10, 
         initiative: int = 10, 
         abilities: list = None, 
-        damage_type: str = 'physical', 
+        damage_type: DamageType = DamageType.PHYSICAL, 
         resistances: list = None, 
         weaknesses: list = None, 
         max_attack: int = 10, 
         min_attack: int = 1, 
         exp: int = 0, 
         hero_class: str = None, 
-        max_weight: int = 100):
+        max_weight: int = 100,
+        inventory: Inventory = None,
+        equipment_manager: EquipmentManager = None,
+        resources: dict = None,
+        attack_bonus: int = 0):
         
         # Call parent constructor with updated parameters
         super().__init__(name=name, 
@@ -167,61 +287,81 @@ class Hero(Creature):
                          damage_type=damage_type, 
                          abilities=abilities, 
                          resistances=resistances, 
-                         weaknesses=weaknesses)
+                         weaknesses=weaknesses,
+                         resources=resources,
+                         attack_bonus=attack_bonus)
         
         self.hero_class: str = hero_class
         self.exp: int = exp
         self.max_weight: int = max_weight
-        self.inventory: 'Inventory' = Inventory(self.max_weight)
-        self.equipment_manager: EquipmentManager = EquipmentManager()
-        self.exp: int = exp
+        # Otherwise built on first use
+        if inventory is not None:
+            self.inventory: 'Inventory' = inventory
+        if equipment_manager is not None:
+            self.equipment_manager: EquipmentManager = equipment_manager
+
+    def clone(self) -> 'Hero':
+        """
+        Return a copy of the hero with its own inventory and equipment.
+        Items carry no per-owner state, so the copies share them.
+        """
+        clone = super().clone()
+        if materialized(self, 'inventory'):
+            clone.inventory = Inventory(self.inventory.max_weight)
+            clone.inventory.items = list(self.inventory.items)
+        if materialized(self, 'equipment_manager'):
+            clone.equipment_manager = EquipmentManager()
+            clone.equipment_manager.equipped_items = dict(self.equipment_manager.equipped_items)
+        return clone
         
     @classmethod   
-    def create_hero(cls, name, hero_class, TEMPLATES):
-        
-        try:
-            template = TEMPLATES[hero_class]
-        except:
-            logging.error(f"Ability template not found for {hero_class}.")
-        
-        print("Templates : ", TEMPLATES)
-        print("template : ", template)
-        hero = template.get(hero_class, [])
-        if hero is []:
-            logging.warning("Class not found : ", hero_class)
-            hero = Hero() # initialisez a Dummy hero
-            return hero
-        else:
-            max_weight = template["max_weight"]
-            equipment_manager=EquipmentManager()
-            inventory = Inventory(max_weight)
-            
-            equipment_manager.equip_item(template["Weapon"])
-            inventory.add_item(template["Weapon"])
-            for armor_piece in template["Armor"]:
-                equipment_manager.equip_item(armor_piece)
-                inventory.add_item(armor_piece)
-            return cls (
-                name=name, 
-                level=1, 
-                description=template["description"], 
-                hp=template["max_hp"], 
-                max_hp=template["max_hp"], 
-                defense=template["defense"], 
-                initiative=template["initiative"], 
-                max_attack=template["max_attack"], 
-                min_attack=template["min_attack"], 
-                damage_type='physical', 
-                abilities=template["abilities"], 
-                resistances=template["resistances"], 
-                weaknesses=template["weaknessses"],
-                hero_class=hero_class,
-                exp=0,
-                max_weight=max_weight,
-                inventory=inventory,
-                equipment_manager=equipment_manager
-            )
-            
+    def create_hero(cls, name: str, hero_class: str, TEMPLATES: dict, ability_templates: dict = None, item_templates: dict = None) -> 'Hero':
+        """
+        Create a hero from a class template.
+        Abilities and equipment named in the template are resolved into objects,
+        the equipment is added to the inventory and equipped.
+        """
+        template = TEMPLATES.get(hero_class)
+        if template is None:
+            logging.warning(f"Hero class not found: {hero_class}")
+            return cls()  # initialize a dummy hero
+
+        item_templates = get_templates("items") if item_templates is None else item_templates
+        max_weight = template.get("max_weight", 100)
+        inventory = Inventory(max_weight)
+        equipment_manager = EquipmentManager()
+
+        equipment = [("Armor", armor_piece) for armor_piece in template.get("Armor", [])]
+        if template.get("Weapon"):
+            equipment.insert(0, ("Weapon", template["Weapon"]))
+        for item_type, item_name in equipment:
+            item = Item.create_item(item_type, item_name, item_templates)
+            if item:
+                inventory.add_item(item)
+                equipment_manager.equip_item(item)
+
+        return cls(
+            name=name, 
+            level=template.get("level", 1), 
+            description=template["description"], 
+            hp=template["max_hp"], 
+            max_hp=template["max_hp"], 
+            defense=template["defense"], 
+            initiative=template["initiative"], 
+            max_attack=template["max_attack"], 
+            min_attack=template["min_attack"], 
+            damage_type=template.get("damage_type", 'physical'), 
+            abilities=create_abilities(template.get("abilities", []), ability_templates), 
+            resistances=template.get("resistances", []), 
+            weaknesses=template.get("weaknesses", []),
+            resources=resource_spec(template.get("resources")),
+            attack_bonus=template.get("attack_bonus", 0),
+            hero_class=hero_class,
+            exp=0,
+            max_weight=max_weight,
+            inventory=inventory,
+            equipment_manager=equipment_manager
+        )
 
 
 class Monster(Creature):
@@ -234,14 +374,16 @@ class Monster(Creature):
         defense: int = 10, 
         initiative: int = 10, 
         abilities: list = None, 
-        damage_type: str = 'physical', 
+        damage_type: DamageType = DamageType.PHYSICAL, 
         resistances: list = None, 
         weaknesses: list = None, 
         max_attack: int = 10, 
         min_attack: int = 1,
         xp: int = 0,
         monster_type: str = None,
-        drop_table: dict = None):
+        drop_table: dict = None,
+        resources: dict = None,
+        attack_bonus: int = 0):
         
         # Call parent constructor with updated parameters
         super().__init__(
@@ -257,13 +399,46 @@ class Monster(Creature):
             damage_type=damage_type,
             abilities=abilities,
             resistances=resistances,
-            weaknesses=weaknesses)
+            weaknesses=weaknesses,
+            resources=resources,
+            attack_bonus=attack_bonus)
         
         # Monster-specific attributes
         self.monster_type: str = monster_type
         self.xp: int = xp
         self.drop_table: dict = drop_table or {}
 
+    @classmethod
+    def create_monster(cls, name: str, monster_type: str, TEMPLATES: dict, ability_templates: dict = None) -> 'Monster':
+        """
+        Create a monster from a creature template.
+        """
+        template = TEMPLATES.get(monster_type)
+        if template is None:
+            logging.warning(f"Monster type not found: {monster_type}")
+            return cls()  # initialize a dummy monster
+
+        return cls(
+            name=name,
+            level=template.get("level", 1),
+            description=template["description"],
+            hp=template["max_hp"],
+            max_hp=template["max_hp"],
+            defense=template["defense"],
+            initiative=template["initiative"],
+            max_attack=template["max_attack"],
+            min_attack=template["min_attack"],
+            damage_type=template.get("damage_type", 'physical'),
+            abilities=create_abilities(template.get("abilities", []), ability_templates),
+            resistances=template.get("resistances", []),
+            weaknesses=template.get("weaknesses", []),
+            resources=resource_spec(template.get("resources")),
+            attack_bonus=template.get("attack_bonus", 0),
+            xp=template.get("xp", 0),
+            monster_type=monster_type,
+            drop_table=dict(template.get("drop_table", {}))
+        )
+
     def drop_loot(self) -> list:
         """
         Drop loot based on drop table
@@ -0,0 +1,238 @@
+# this file contains the analytic damage engine
+# Instead of simulating fights, it computes the exact probability of every
+# outcome by convolving dice distributions through the game's damage rules.
+from fractions import Fraction
+from itertools import accumulate
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Union
+
+from classes.attackResolution import CRITICAL, D20, HIT, outcome_counts
+
+if TYPE_CHECKING:
+    from classes.creature import Creature
+    from classes.effects import DamageOverTimeEffect
+
+
+class Distribution:
+    """
+    Exact probability distribution over integers.
+    Stored densely as integer counts over a common total, so that convolutions
+    stay exact without paying for Fraction arithmetic on every term.
+    The counts may sum to less than the total, the missing mass then stands for
+    outcomes left out of the distribution (e.g. a target surviving every turn).
+    """
+    def __init__(self, offset: int, counts: List[int], total: int):
+        # Trim zero counts at both ends
+        start = 0
+        while start < len(counts) and counts[start] == 0:
+            start += 1
+        end = len(counts)
+        while end > start and counts[end - 1] == 0:
+            end -= 1
+        self.offset: int = offset + start
+        self.counts: List[int] = counts[start:end]
+        self.total: int = total
+
+    @classmethod
+    def point(cls, value: int) -> 'Distribution':
+        """
+        Distribution of a constant.
+        """
+        return cls(value, [1], 1)
+
+    @classmethod
+    def uniform(cls, low: int, high: int) -> 'Distribution':
+        """
+        Uniform distribution over [low, high].
+        """
+        if high < low:
+            low, high = high, low
+        return cls(low, [1] * (high - low + 1), high - low + 1)
+
+    @classmethod
+    def dice(cls, sides: int, count: int = 1) -> 'Distribution':
+        """
+        Distribution of the sum of count dice with the given number of sides.
+        """
+        return cls.uniform(1, sides).repeat(count)
+
+    @classmethod
+    def from_counts(cls, counts: Dict[int, int], total: int) -> 'Distribution':
+        """
+        Distribution of value -> count over total.
+        """
+        if not counts:
+            return cls(0, [], total)
+        low = min(counts)
+        dense = [0] * (max(counts) - low + 1)
+        for value, count in counts.items():
+            dense[value - low] = count
+        return cls(low, dense, total)
+
+    def convolve(self, other: 'Distribution') -> 'Distribution':
+        """
+        Distribution of the sum of two independent variables.
+        """
+        counts = [0] * (len(self.counts) + len(other.counts) - 1) if self.counts and other.counts else []
+        for i, a in enumerate(self.counts):
+            if a:
+                for j, b in enumerate(other.counts):
+                    counts[i + j] += a * b
+        return Distribution(self.offset + other.offset, counts, self.total * other.total)
+
+    def repeat(self, times: int) -> 'Distribution':
+        """
+        Distribution of the sum of times independent copies, by repeated squaring.
+        """
+        result, power = Distribution.point(0), self
+        while times > 0:
+            if times & 1:
+                result = result.convolve(power)
+            times >>= 1
+            if times:
+                power = power.convolve(power)
+        return result
+
+    def map(self, function: Callable[[int], int]) -> 'Distribution':
+        """
+        Distribution of function(value), merging values that map together.
+        """
+        mapped: Dict[int, int] = {}
+        for value, count in self.items():
+            result = function(value)
+            mapped[result] = mapped.get(result, 0) + count
+        return Distribution.from_counts(mapped, self.total)
+
+    def items(self) -> Iterable[tuple]:
+        """
+        (value, count) pairs with a non-zero count.
+        """
+        return ((self.offset + i, count) for i, count in enumerate(self.counts) if count)
+
+    def probability(self, value: int) -> Fraction:
+        """
+        Exact probability of a value.
+        """
+        index = value - self.offset
+        if 0 <= index < len(self.counts):
+            return Fraction(self.counts[index], self.total)
+        return Fraction(0)
+
+    def probabilities(self) -> Dict[int, Fraction]:
+        """
+        Exact probability of every value with a non-zero probability.
+        """
+        return {value: Fraction(count, self.total) for value, count in self.items()}
+
+    def mass(self) -> Fraction:
+        """
+        Total probability held by the distribution.
+        """
+        return Fraction(sum(self.counts), self.total)
+
+    def mean(self) -> Fraction:
+        """
+        Mean of the distribution, conditioned on its mass.
+        """
+        weight = sum(self.counts)
+        return Fraction(sum(value * count for value, count in self.items()), weight) if weight else Fraction(0)
+
+    def cdf(self, value: int) -> Fraction:
+        """
+        Probability of a value lower or equal to value.
+        """
+        index = min(value - self.offset + 1, len(self.counts))
+        return Fraction(sum(self.counts[:index]), self.total) if index > 0 else Fraction(0)
+
+    def __repr__(self) -> str:
+        return f"Distribution({ {value: float(p) for value, p in self.probabilities().items()} })"
+
+
+def attack_damage(attacker: 'Creature', target: 'Creature') -> Distribution:
+    """
+    Damage dealt by one basic attack: the d20 roll against the target's defense, then
+    the damage roll between min_attack and max_attack, doubled on a critical and
+    reduced by the target's resistances.
+    """
+    misses, hits, criticals = outcome_counts(attacker.attack_bonus, target.defense)
+    rolls = Distribution.uniform(attacker.min_attack, attacker.max_attack)
+    counts: Dict[int, int] = {0: misses * rolls.total} if misses else {}
+    for multiplier, faces in ((HIT, hits), (CRITICAL, criticals)):
+        if faces:
+            for roll, count in rolls.items():
+                damage = target.compute_damage(roll * multiplier, attacker.damage_type, "attack")
+                counts[damage] = counts.get(damage, 0) + faces * count
+    return Distribution.from_counts(counts, D20 * rolls.total)
+
+
+def effect_tick_damage(effect: 'DamageOverTimeEffect', target: 'Creature') -> int:
+    """
+    Damage dealt by one tick of a damage over time effect.
+    """
+    return target.compute_damage(effect.potency, effect.damage_type, "effect")
+
+
+def damage_per_turn(attackers: Union['Creature', List['Creature']], target: 'Creature', effects: List['DamageOverTimeEffect'] = None, turn: int = 1) -> Distribution:
+    """
+    Damage taken by the target during a turn.
+    Every attacker attacks once, and every effect that still lasts at this turn ticks once.
+    """
+    if not isinstance(attackers, (list, tuple)):
+        attackers = [attackers]
+    distribution = Distribution.point(0)
+    for attacker in attackers:
+        distribution = distribution.convolve(attack_damage(attacker, target))
+    ticks = sum(effect_tick_damage(effect, target) for effect in effects or [] if effect.duration >= turn)
+    return Distribution(distribution.offset + ticks, distribution.counts, distribution.total)
+
+
+def turns_to_kill(attackers: Union['Creature', List['Creature']], target: 'Creature', effects: List['DamageOverTimeEffect'] = None, max_turns: int = 100, exact: bool = True) -> Union[Distribution, Dict[int, float]]:
+    """
+    Distribution of the turn at which the target dies, starting from its current hp.
+    The mass missing from the result is the probability it survives max_turns turns.
+    With exact=False the computation runs on floats and returns turn -> probability,
+    which is much faster for large hp pools and long fights.
+    """
+    effects = effects or []
+    # Damage distributions only change when an effect runs out
+    last_effect_turn = max((effect.duration for effect in effects), default=0)
+    per_turn = {}
+
+    # alive[hp] = weight of the target having this much hp left, index 0 is unused
+    hp = target.hp
+    alive = [0] * (hp + 1)
+    alive[hp] = 1 if exact else 1.0
+    total = 1
+    deaths = []
+    for turn in range(1, max_turns + 1):
+        key = min(turn, last_effect_turn + 1)
+        if key not in per_turn:
+            per_turn[key] = damage_per_turn(attackers, target, effects, key)
+        damage = per_turn[key]
+        scale = 1 if exact else 1.0 / damage.total
+
+        # prefix[k] = weight of hp in [1, k]
+        prefix = [0, *accumulate(alive[1:])]
+
+        next_alive = [0] * (hp + 1)
+        died = 0
+        for value, count in damage.items():
+            weight = count * scale
+            # Every hp lower or equal to the damage dies
+            died += weight * prefix[min(value, hp)]
+            if value < hp:
+                # hp h survives with h - value, shift the whole slice at once
+                next_alive[1:hp - value + 1] = [
+                    kept + weight * before for kept, before in zip(next_alive[1:hp - value + 1], alive[value + 1:])
+                ]
+        if exact:
+            # Bring earlier deaths to the new common total
+            deaths = [count * damage.total for count in deaths]
+            total *= damage.total
+        deaths.append(died)
+        alive = next_alive
+        if not any(alive) or (not exact and sum(alive) < 1e-15):
+            break
+
+    if not exact:
+        return {turn: probability for turn, probability in enumerate(deaths, 1) if probability}
+    return Distribution(1, deaths, total)
@@ -1,31 +1,39 @@
-import json
 import logging
+import weakref
 from typing import TYPE_CHECKING, Union
 
+from classes.changeTracking import EFFECTS, mark
+from classes.enums import DamageType
+from classes.templateStore import get_templates
+
 if TYPE_CHECKING:
-    from creature import Creature
+    from classes.creature import Creature
+
 
-try:
-    with open('classes/templates/effectsTemplates.json', 'r') as file:
-        TEMPLATES = json.load(file)
-except FileNotFoundError:
-    logging.error("Effects templates file not found.")
-    TEMPLATES = {}
-except json.JSONDecodeError:
-    logging.error("Error decoding JSON from effects templates file.")
-    TEMPLATES = {}
+def __getattr__(name: str):
+    # TEMPLATES is resolved lazily so that importing the module does no I/O
+    if name == "TEMPLATES":
+        return get_templates("effects")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class Effect:
     """
     Base class for all game effects
     """
-    def __init__(self, name: str, duration: int, potency: int, description: str = None):
+    def __init__(self, name: str, duration: int, potency: int, description: str = None, applier: 'Creature' = None):
         # Initialize effect attributes
         self.name: str = name
         self.duration: int = duration  # Number of turns the effect lasts
         self.potency: int = potency  # Strength of the effect
         self.description: str = description
         self.active: bool = True    
+        # Weak reference to the creature that applied the effect, if any: an effect must not keep a dead applier alive
+        self._applier: 'weakref.ref[Creature]' = weakref.ref(applier) if applier is not None else None
+
+    @property
+    def applier(self) -> 'Creature':
+        """The creature that applied the effect, None for the environment or once it is gone"""
+        return self._applier() if self._applier is not None else None
     
     def apply(self, target: 'Creature') -> None:
         """
@@ -56,16 +64,17 @@ class DamageOverTimeEffect(Effect):
     """
     An effect that deals damage each turn
     """
-    def __init__(self, name: str, duration: int, potency: int, damage_type: str, description: str = None):
-        super().__init__(name, duration, potency, description)
-        self.damage_type: str = damage_type
+    def __init__(self, name: str, duration: int, potency: int, damage_type: DamageType, description: str = None,
+                 applier: 'Creature' = None):
+        super().__init__(name, duration, potency, description, applier)
+        self.damage_type: DamageType = DamageType.parse(damage_type)
         
     def apply(self, target: 'Creature') -> None:
         """
-        Deal damage to the target creature each turn
+        Deal damage to the target creature each turn, on behalf of the applier
         """        
         try:
-            target.take_damage(self.potency, self.damage_type, "effect")
+            target.take_damage(self.potency, self.damage_type, "effect", attacker=self.applier)
         except AttributeError:
             logging.error(f"Target {target} does not have a take_damage method.")
     
@@ -89,15 +98,15 @@ class HealOverTimeEffect(Effect):
     """
     An effect that heals the target each turn
     """
-    def __init__(self, name: str, duration: int, potency: int, description: str = None):
-        super().__init__(name, duration, potency, description)
+    def __init__(self, name: str, duration: int, potency: int, description: str = None, applier: 'Creature' = None):
+        super().__init__(name, duration, potency, description, applier)
     
     def apply(self, target: 'Creature') -> None:
         """
-        Heal the target creature each turn
+        Heal the target creature each turn, on behalf of the applier
         """
         try:
-            target.heal(self.potency)
+            target.heal(self.potency, healer=self.applier)
         except AttributeError:
             logging.error(f"Target {target} does not have a heal method.")
     
@@ -172,16 +181,26 @@ class EffectManager:
     Manages effects for a creature
     """
     def __init__(self, owner: 'Creature'):
-        self.owner: 'Creature' = owner
+        # Weak reference: a strong one would make every creature a reference cycle,
+        # only freed by the cyclic garbage collector instead of as soon as it is dropped
+        self._owner: 'weakref.ref[Creature]' = weakref.ref(owner)
         self.active_effects: list[Effect] = []
 
+    @property
+    def owner(self) -> 'Creature':
+        return self._owner()
+
     def add_effect(self, effect: Effect) -> None:
         """
         Add a new effect to the creature
         """
         if effect:
             self.active_effects.append(effect)
-            effect.apply(self.owner)
+            owner = self.owner
+            # The owner may be gone, the manager then only keeps its list
+            if owner is not None:
+                mark(owner, EFFECTS)
+                effect.apply(owner)
 
     def remove_effect(self, effect: Effect) -> None:
         """
@@ -189,11 +208,17 @@ class EffectManager:
         """
         if effect in self.active_effects:
             self.active_effects.remove(effect)
+            owner = self.owner
+            if owner is not None:
+                mark(owner, EFFECTS)
 
     def update_effects(self) -> None:
         """
         Update all active effects and remove expired ones
         """
+        if self.active_effects:
+            # Durations change
+            mark(self.owner, EFFECTS)
         for effect in self.active_effects[:]:
             if not effect.update(self.owner):
                 self.remove_effect(effect)
@@ -218,7 +243,7 @@ class EffectFactory:
         :return: Created effect.
         """
         try:
-            template = TEMPLATES[effect_type][name]
+            template = get_templates("effects")[effect_type][name]
         except KeyError:
             logging.error(f"Effect template not found for {effect_type} with name {name}.")
             return None
@@ -227,7 +252,7 @@ class EffectFactory:
 
         if source_type == "creature" and applier:  # effect comes from a creature
             # Apply player and stats multipliers
-            stats = applier.stats
+            stats = getattr(applier, "stats", {})
             stats_multiplier = 1 + sum(stats.get(stat, 0) * modifier for stat, modifier in template.get("potency_modifier", {}).items())
             final_potency = int(base_potency * potency_modifier * stats_multiplier)
         else:  # effect comes from the world / environment / item
@@ -239,14 +264,16 @@ class EffectFactory:
                 duration=template["duration"],
                 potency=final_potency,
                 damage_type=template["damage_type"],
-                description=template.get("description")
+                description=template.get("description"),
+                applier=applier
             )
         elif effect_type == 'HealOverTimeEffect':
             return HealOverTimeEffect(
                 name=name,
                 duration=template["duration"],
                 potency=final_potency,
-                description=template.get("description")
+                description=template.get("description"),
+                applier=applier
             )
         elif effect_type == 'StatModifierEffect':
             return StatModifierEffect(
@@ -0,0 +1,481 @@
+# this file contains the Markov-chain encounter solver
+# It computes exact win probabilities and the expected length of a fight by
+# enumerating the states the encounter can reach, round after round. The fight
+# is the one CombatManager's auto_select plays, see EncounterSolver for what is
+# left out of the model.
+import math
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from classes.damageDistribution import attack_damage
+from classes.effects import EffectFactory
+from classes.enums import CostType, TargetType
+
+if TYPE_CHECKING:
+    from classes.combatManager import CombatManager
+    from classes.creature import Creature
+
+# State of one combatant: (hp in buckets, resources, cooldowns, over time effects)
+# where effects are sorted (turns left, damage per tick) pairs, heals over time tick negative damage.
+CombatantState = Tuple[int, Tuple[int, ...], Tuple[int, ...], Tuple[Tuple[int, int], ...]]
+EncounterState = Tuple[CombatantState, ...]
+
+# Largest group of mutually reachable states solved by elimination, bigger ones are iterated
+EXACT_SOLVE_LIMIT = 300
+
+
+class EncounterOutcome:
+    """
+    Result of solving an encounter.
+    """
+    def __init__(self, win_probability: float, loss_probability: float, expected_rounds: float, state_count: int):
+        self.win_probability: float = win_probability  # heroes win
+        self.loss_probability: float = loss_probability  # monsters win
+        self.draw_probability: float = max(1.0 - win_probability - loss_probability, 0.0)  # nobody can finish the fight
+        self.expected_rounds: float = expected_rounds
+        self.state_count: int = state_count
+
+    def __str__(self) -> str:
+        return f"win {self.win_probability:.4f}, loss {self.loss_probability:.4f}, draw {self.draw_probability:.4f}, {self.expected_rounds:.2f} rounds ({self.state_count} states)"
+
+
+class CombatantModel:
+    """
+    Static data the solver needs about one combatant
+    """
+    def __init__(self, creature: 'Creature', side: int):
+        self.creature: 'Creature' = creature
+        self.side: int = side
+        self.resource_types: List[CostType] = []
+        # (resource index, cost, max cooldown, damage, damage type, area, damage over time or None, heal)
+        # heal abilities are the self-target ones auto_select uses when the combatant is hurt,
+        # their damage is the hp healed and their effect a (duration, hp per tick) heal over time
+        self.abilities: List[tuple] = []
+
+        for ability in creature.abilities:
+            heal = not ability.is_offensive
+            if heal and ability.target_type != TargetType.SELF:
+                continue
+            if ability.cost_type not in self.resource_types:
+                self.resource_types.append(ability.cost_type)
+            over_time = None
+            effect_class = "HealOverTimeEffect" if heal else "DamageOverTimeEffect"
+            for effect_template in ability.effects:
+                if effect_template.get("effect_class") == effect_class:
+                    effect = EffectFactory.create_effect(effect_class, effect_template["effect_name"], "creature", creature, ability.effect_multiplier)
+                    if effect:
+                        over_time = (effect.duration, effect.potency) if heal else (effect.duration, effect.potency, effect.damage_type)
+            power = ability.calculate_power(creature) if ability.base_power else 0
+            if heal:
+                power = int(power * creature.mutlitply_power(ability.power_type))
+            self.abilities.append((
+                self.resource_types.index(ability.cost_type),
+                ability.cost,
+                ability.max_cooldown,
+                power,
+                ability.power_type,
+                ability.target_type in (TargetType.AREA, TargetType.ALL),
+                over_time,
+                heal
+            ))
+
+        # (regeneration per round, cap) of each resource type
+        self.regen: Tuple[Tuple[int, int], ...] = tuple(
+            (creature.resources.regen(resource_type), creature.resources.cap(resource_type))
+            if resource_type in creature.resources else (0, 0)
+            for resource_type in self.resource_types
+        )
+
+    def signature(self) -> tuple:
+        """
+        Combatants with the same signature are interchangeable.
+        """
+        creature = self.creature
+        return (
+            self.side, creature.initiative, creature.max_hp, creature.defense, creature.min_attack, creature.max_attack, creature.attack_bonus,
+            creature.damage_type, creature.resistances, creature.weaknesses, tuple(self.abilities), self.regen
+        )
+
+
+class EncounterSolver:
+    """
+    Solves an encounter as an absorbing Markov chain over rounds.
+
+    Every round each living combatant acts in initiative order, as auto_select picks:
+    it uses its first ready ability it can pay for, or a basic attack otherwise, on the
+    living enemy with the least hp (every enemy for area abilities). Self-target
+    abilities that are not offensive are only used when the combatant is hurt, they
+    heal it directly and over time. Over time effects then tick, damage before heals,
+    and cooldowns go down.
+
+    Not modelled: stat modifier effects (such an ability only spends the action, its
+    cost and cooldown), offensive self-target abilities (aimed at the enemy) and the
+    threat-based targeting of CombatManager(threat=True).
+
+    Identical combatants with the same initiative act in the order of their state,
+    which makes states that only differ by a permutation of identical combatants
+    equivalent, so they are collapsed into one. hp can be counted in buckets of
+    hp_bucket points to shrink the chain further, at the cost of exactness.
+    The number of states grows with the product of the hp of the combatants: the
+    exact hp_bucket=1 suits duels and small fights, e.g. one hero against a few
+    weak monsters. Template parties need hp_bucket=5 or more: 4 Wariors against
+    4 Goblins take about 11k states and several minutes exactly, 280 states and
+    under a second with hp_bucket=5.
+    """
+    def __init__(self, combat_manager: 'CombatManager', hp_bucket: int = 1):
+        self.hp_bucket: int = max(int(hp_bucket), 1)
+        hero_ids = {id(hero) for hero in combat_manager.heroes}
+        models = [
+            CombatantModel(creature, 0 if id(creature) in hero_ids else 1)
+            for creature in combat_manager.turn_order if creature.is_alive
+        ]
+        # Sorting is stable, identical combatants end up next to each other
+        signatures = {}
+        for model in models:
+            signatures.setdefault(model.signature(), len(signatures))
+        models.sort(key=lambda model: (-model.creature.initiative, model.side, signatures[model.signature()]))
+        self.models: List[CombatantModel] = models
+        # Position of each combatant in its side's list: CombatManager.weakest breaks hp ties by it
+        positions = {id(creature): position for side in (combat_manager.heroes, combat_manager.monsters) for position, creature in enumerate(side)}
+        self.positions: List[int] = [positions.get(id(model.creature), 0) for model in models]
+
+        # Ranges of interchangeable combatants
+        self.groups: List[Tuple[int, int]] = []
+        start = 0
+        for index in range(1, len(models) + 1):
+            if index == len(models) or models[index].signature() != models[start].signature():
+                if index - start > 1:
+                    self.groups.append((start, index))
+                start = index
+
+        self.max_hp: List[int] = [self.to_buckets(model.creature.max_hp) for model in models]
+        self.damage_cache: Dict[tuple, List[Tuple[int, float]]] = {}
+        self.transition_cache: Dict[EncounterState, Dict[EncounterState, float]] = {}
+
+    def initial_state(self) -> EncounterState:
+        """
+        State of the encounter before the first round.
+        """
+        states = []
+        for model in self.models:
+            creature = model.creature
+            resources = tuple(creature.resources.get(resource_type, 0) for resource_type in model.resource_types)
+            cooldowns = tuple(0 for _ in model.abilities)
+            states.append((self.to_buckets(creature.hp), resources, cooldowns, ()))
+        return self.canonical(states)
+
+    def to_buckets(self, hp: int) -> int:
+        return -(-max(hp, 0) // self.hp_bucket)
+
+    def apply_damage(self, hp: int, damage: int) -> int:
+        """
+        Remove damage from hp counted in buckets.
+        """
+        if self.hp_bucket == 1:
+            return max(hp - damage, 0)
+        return self.to_buckets(hp * self.hp_bucket - damage)
+
+    def apply_heal(self, hp: int, heal: int, max_hp: int) -> int:
+        """
+        Add heal to hp counted in buckets, up to max_hp buckets. The dead are not healed.
+        """
+        if hp <= 0:
+            return hp
+        return min(self.apply_damage(hp, -heal), max_hp)
+
+    def canonical(self, states: List[CombatantState]) -> EncounterState:
+        """
+        Normalize dead combatants and sort interchangeable ones.
+        """
+        states = [state if state[0] > 0 else (0, (), (), ()) for state in states]
+        for start, end in self.groups:
+            states[start:end] = sorted(states[start:end])
+        return tuple(states)
+
+    def winner(self, state: EncounterState):
+        """
+        Side left standing (0 heroes, 1 monsters), -1 if everybody died, None while the fight goes on.
+        """
+        alive = {model.side for model, combatant in zip(self.models, state) if combatant[0] > 0}
+        if len(alive) > 1:
+            return None
+        return alive.pop() if alive else -1
+
+    def basic_attack(self, attacker: int, target: int) -> List[Tuple[int, float]]:
+        """
+        (damage, probability) pairs of a basic attack, cached per pair of combatants.
+        """
+        key = (attacker, target)
+        if key not in self.damage_cache:
+            distribution = attack_damage(self.models[attacker].creature, self.models[target].creature)
+            self.damage_cache[key] = [(damage, float(probability)) for damage, probability in distribution.probabilities().items()]
+        return self.damage_cache[key]
+
+    def act(self, state: List[CombatantState], actor: int) -> List[Tuple[List[CombatantState], float]]:
+        """
+        Possible results of one combatant's action, with their probability.
+        """
+        model = self.models[actor]
+        hp, resources, cooldowns, effects = state[actor]
+        enemies = [index for index, other in enumerate(self.models) if other.side != model.side and state[index][0] > 0]
+        if not enemies:
+            return [(state, 1.0)]
+        target = min(enemies, key=lambda index: (state[index][0], self.positions[index]))
+
+        for position, (resource, cost, max_cooldown, power, power_type, area, over_time, heal) in enumerate(model.abilities):
+            if cooldowns[position] > 0 or resources[resource] < cost or (heal and hp >= self.max_hp[actor]):
+                continue
+            result = list(state)
+            spent = list(resources)
+            spent[resource] -= cost
+            ready = list(cooldowns)
+            ready[position] = max_cooldown
+            if heal:
+                healed = self.apply_heal(hp, power, self.max_hp[actor])
+                if over_time:
+                    duration, potency = over_time
+                    # Effects tick once when applied
+                    healed = self.apply_heal(healed, potency, self.max_hp[actor])
+                    effects = tuple(sorted(effects + ((duration, -potency),)))
+                result[actor] = (healed, tuple(spent), tuple(ready), effects)
+                return [(result, 1.0)]
+            result[actor] = (hp, tuple(spent), tuple(ready), effects)
+            damage_over_time = over_time
+            for index in (enemies if area else [target]):
+                creature = self.models[index].creature
+                target_hp, target_resources, target_cooldowns, target_effects = result[index]
+                damage = creature.compute_damage(power, power_type) if power else 0
+                if damage_over_time:
+                    duration, potency, damage_type = damage_over_time
+                    tick = creature.compute_damage(potency, damage_type, "effect")
+                    # Effects tick once when applied
+                    damage += tick
+                    target_effects = tuple(sorted(target_effects + ((duration, tick),)))
+                result[index] = (self.apply_damage(target_hp, damage), target_resources, target_cooldowns, target_effects)
+            return [(result, 1.0)]
+
+        outcomes = []
+        target_hp, target_resources, target_cooldowns, target_effects = state[target]
+        for damage, probability in self.basic_attack(actor, target):
+            result = list(state)
+            result[target] = (self.apply_damage(target_hp, damage), target_resources, target_cooldowns, target_effects)
+            outcomes.append((result, probability))
+        return outcomes
+
+    def end_of_round(self, state: List[CombatantState]) -> EncounterState:
+        """
+        Tick over time effects and cooldowns, then regenerate resources.
+        """
+        result = []
+        for max_hp, model, (hp, resources, cooldowns, effects) in zip(self.max_hp, self.models, state):
+            if hp > 0:
+                hp = self.apply_damage(hp, sum(tick for _, tick in effects if tick > 0))
+                hp = self.apply_heal(hp, -sum(tick for _, tick in effects if tick < 0), max_hp)
+                effects = tuple((turns - 1, tick) for turns, tick in effects if turns > 1)
+                cooldowns = tuple(max(cooldown - 1, 0) for cooldown in cooldowns)
+                if any(regen for regen, _ in model.regen):
+                    resources = tuple(
+                        min(max(value + regen, 0), cap) for value, (regen, cap) in zip(resources, model.regen)
+                    )
+            result.append((hp, resources, cooldowns, effects))
+        return self.canonical(result)
+
+    def transitions(self, state: EncounterState) -> Dict[EncounterState, float]:
+        """
+        Distribution of the state after one round, memoized.
+        """
+        if state in self.transition_cache:
+            return self.transition_cache[state]
+
+        partial: Dict[tuple, float] = {state: 1.0}
+        for actor in range(len(self.models)):
+            next_partial: Dict[tuple, float] = {}
+            for current, probability in partial.items():
+                if current[actor][0] <= 0:
+                    next_partial[current] = next_partial.get(current, 0.0) + probability
+                    continue
+                for result, outcome_probability in self.act(list(current), actor):
+                    result = tuple(result)
+                    next_partial[result] = next_partial.get(result, 0.0) + probability * outcome_probability
+            partial = next_partial
+
+        row: Dict[EncounterState, float] = {}
+        for current, probability in partial.items():
+            final = self.end_of_round(list(current))
+            row[final] = row.get(final, 0.0) + probability
+        self.transition_cache[state] = row
+        return row
+
+    def build_chain(self, start: EncounterState) -> Dict[EncounterState, Dict[EncounterState, float]]:
+        """
+        Sparse transition rows of every transient state reachable from start.
+        """
+        chain = {}
+        pending = [start]
+        while pending:
+            state = pending.pop()
+            if state in chain or self.winner(state) is not None:
+                continue
+            row = chain[state] = self.transitions(state)
+            pending.extend(next_state for next_state in row if next_state not in chain)
+        return chain
+
+    def solve(self) -> EncounterOutcome:
+        """
+        Win probability, loss probability and expected number of rounds of the encounter.
+        """
+        start = self.initial_state()
+        winner = self.winner(start)
+        if winner is not None:
+            return EncounterOutcome(float(winner == 0), float(winner == 1), 0.0, 1)
+
+        chain = self.build_chain(start)
+        # Value of each state: (P(heroes win), P(monsters win), expected rounds)
+        values: Dict[EncounterState, Tuple[float, float, float]] = {}
+
+        def value(state):
+            if state in values:
+                return values[state]
+            winner = self.winner(state)
+            return (float(winner == 0), float(winner == 1), 0.0)
+
+        # Components come out of Tarjan's algorithm successors first
+        for component in strongly_connected_components(chain):
+            members = set(component)
+            exits = {state: sum(p for next_state, p in chain[state].items() if next_state not in members) for state in component}
+            if len(component) == 1:
+                state = component[0]
+                stay = chain[state].get(state, 0.0)
+                if stay >= 1.0 - 1e-12:
+                    values[state] = (0.0, 0.0, math.inf)
+                    continue
+                win = loss = rounds = 0.0
+                for next_state, p in chain[state].items():
+                    if next_state != state:
+                        next_win, next_loss, next_rounds = value(next_state)
+                        win += p * next_win
+                        loss += p * next_loss
+                        rounds += p * next_rounds
+                values[state] = (win / (1 - stay), loss / (1 - stay), (1 + rounds) / (1 - stay))
+            else:
+                self.solve_component(component, members, chain, value, values, exits)
+
+        win, loss, rounds = values[start]
+        if win + loss < 1.0 - 1e-9:
+            rounds = math.inf
+        return EncounterOutcome(win, loss, rounds, len(chain))
+
+    def solve_component(self, component, members, chain, value, values, exits) -> None:
+        """
+        Solve a group of mutually reachable states, once every state it leads to is solved.
+        """
+        if sum(exits.values()) <= 1e-12:
+            # The fight can never leave these states
+            for state in component:
+                values[state] = (0.0, 0.0, math.inf)
+            return
+
+        index = {state: position for position, state in enumerate(component)}
+        constants = []
+        for state in component:
+            win = loss = rounds = 0.0
+            for next_state, p in chain[state].items():
+                if next_state not in members:
+                    next_win, next_loss, next_rounds = value(next_state)
+                    win += p * next_win
+                    loss += p * next_loss
+                    rounds += p * next_rounds
+            constants.append((win, loss, 1.0 + rounds))
+
+        size = len(component)
+        if size <= EXACT_SOLVE_LIMIT:
+            # (I - Q) x = b by Gaussian elimination, three right-hand sides at once
+            matrix = [[0.0] * size + list(constants[row]) for row in range(size)]
+            for row, state in enumerate(component):
+                matrix[row][row] += 1.0
+                for next_state, p in chain[state].items():
+                    if next_state in members:
+                        matrix[row][index[next_state]] -= p
+            for column in range(size):
+                pivot = max(range(column, size), key=lambda row: abs(matrix[row][column]))
+                matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+                divisor = matrix[column][column]
+                matrix[column] = [item / divisor for item in matrix[column]]
+                for row in range(size):
+                    factor = matrix[row][column]
+                    if row != column and factor:
+                        matrix[row] = [item - factor * pivot_item for item, pivot_item in zip(matrix[row], matrix[column])]
+            solution = [tuple(matrix[row][size:]) for row in range(size)]
+        else:
+            # Gauss-Seidel sweeps over the sparse rows
+            solution = [(0.0, 0.0, 0.0)] * size
+            for _ in range(10000):
+                delta = 0.0
+                for row, state in enumerate(component):
+                    win, loss, rounds = constants[row]
+                    for next_state, p in chain[state].items():
+                        if next_state in members:
+                            next_win, next_loss, next_rounds = solution[index[next_state]]
+                            win += p * next_win
+                            loss += p * next_loss
+                            rounds += p * next_rounds
+                    delta = max(delta, abs(rounds - solution[row][2]), abs(win - solution[row][0]))
+                    solution[row] = (win, loss, rounds)
+                if delta < 1e-12:
+                    break
+
+        for row, state in enumerate(component):
+            values[state] = solution[row]
+
+
+def strongly_connected_components(chain: Dict[EncounterState, Dict[EncounterState, float]]) -> List[list]:
+    """
+    Tarjan's algorithm, iterative to cope with deep chains.
+    Components are returned successors first, so each one only depends on earlier ones.
+    """
+    indices: Dict[EncounterState, int] = {}
+    lowlinks: Dict[EncounterState, int] = {}
+    on_stack = set()
+    stack = []
+    components = []
+    counter = 0
+
+    for root in chain:
+        if root in indices:
+            continue
+        work = [(root, iter(chain[root]))]
+        indices[root] = lowlinks[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            state, successors = work[-1]
+            advanced = False
+            for successor in successors:
+                if successor not in chain:
+                    continue  # terminal state
+                if successor not in indices:
+                    indices[successor] = lowlinks[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(chain[successor])))
+                    advanced = True
+                    break
+                if successor in on_stack:
+                    lowlinks[state] = min(lowlinks[state], indices[successor])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlinks[parent] = min(lowlinks[parent], lowlinks[state])
+            if lowlinks[state] == indices[state]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == state:
+                        break
+                components.append(component)
+    return components
@@ -0,0 +1,90 @@
+# this file contains the enumerations used in place of free-form template strings
+# Template strings are converted once, when creatures, abilities, effects and
+# items are built from their templates; the templates themselves stay plain
+# JSON data. Damage types are flags, so resistances and weaknesses are bitmasks.
+import logging
+from enum import IntEnum, IntFlag
+from typing import Iterable, Tuple, Union
+
+
+class TemplateEnum:
+    """
+    Conversion from and to the lowercase strings used in the templates
+    """
+    @classmethod
+    def parse(cls, value: Union[str, int, None]):
+        """
+        Member for a template string (case insensitive), a member or an int.
+        Returns None for None and for unknown strings, which are logged.
+        """
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, int):
+            return cls(value)
+        member = cls.__members__.get(value.upper())
+        if member is None:
+            logging.error(f"Unknown {cls.__name__}: {value}")
+        return member
+
+    @classmethod
+    def names(cls) -> Tuple[str, ...]:
+        """
+        Template strings of every member.
+        """
+        return tuple(name.lower() for name in cls.__members__)
+
+    def __str__(self) -> str:
+        return (self.name or "none").lower()
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+
+class DamageType(TemplateEnum, IntFlag):
+    PHYSICAL = 1
+    MAGICAL = 2
+    FIRE = 4
+    POISON = 8
+
+    @classmethod
+    def mask(cls, values: Union[Iterable[Union[str, int]], int, None]) -> int:
+        """
+        Bitmask of a list of damage types, as a plain int: IntFlag operators
+        are much slower than int ones and masks are tested on every hit.
+        """
+        if values is None:
+            return 0
+        if isinstance(values, int):
+            return int(values)
+        mask = 0
+        for value in values:
+            member = cls.parse(value)
+            if member is not None:
+                mask |= int(member)
+        return mask
+
+
+class CostType(TemplateEnum, IntEnum):
+    MANA = 1
+    STAMINA = 2
+    RAGE = 3
+    ENERGY = 4
+
+
+class TargetType(TemplateEnum, IntEnum):
+    SINGLE = 1
+    AREA = 2
+    SELF = 3
+    ALL = 4
+
+
+class EquipmentSlot(TemplateEnum, IntEnum):
+    HEAD = 1
+    CHEST = 2
+    LEGS = 3
+    WEAPON = 4
+
+
+# Armor categories of the item templates are the armor slots
+ARMOR_SLOTS: Tuple[EquipmentSlot, ...] = (EquipmentSlot.HEAD, EquipmentSlot.CHEST, EquipmentSlot.LEGS)
+
@@ -0,0 +1,556 @@
+# this file contains the fixed-tick game server and its load-test client
+# Clients send newline-delimited JSON commands over a local socket. Incoming
+# commands are only queued: once per tick the server validates all of them in
+# one pass (abilities through Ability.can_use), plays one batched round in every
+# encounter that received commands, and sends each connection all its replies
+# in a single write. Per-round changes come from the encounter's DeltaTracker.
+# Work past the tick budget waits for the next tick, so overload shows up as
+# longer round trips rather than late ticks.
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import statistics
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from classes import templateStore
+from classes.abilities import AbilityError
+from classes.actions import AbilityAction, Action, AttackAction, DefendAction, WaitAction
+from classes.changeTracking import DeltaTracker
+from classes.combatManager import CombatManager
+from classes.spawner import Spawner
+
+TICK_RATE = 20  # ticks per second
+MAX_LINE = 64 * 1024  # longest accepted command, in bytes
+MAX_BUFFER = 1024 * 1024  # bytes waiting to be sent before a client is dropped as too slow
+MAX_JOINS = 200  # encounters created per tick, the rest wait for the next ticks
+TICK_BUDGET = 0.4  # share of the interval spent on commands and rounds, the rest is left to read the sockets
+FULL_COLLECTION = 60 * TICK_RATE  # ticks between full garbage collections
+
+
+def encode(message: Dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b"\n"
+
+
+def uid_field(message: Dict, field: str, optional: bool = False) -> Optional[int]:
+    """
+    Integer id of a command field, CommandError if it is anything else, e.g. a list that can not be looked up.
+    """
+    value = message.get(field)
+    if value is None and optional:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise CommandError(f"{field} should be an integer id")
+    return value
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class CommandError(Exception):
+    """Raised when a client command is invalid."""
+
+
+class RemoteCombatManager(CombatManager):
+    """
+    Batched combat whose heroes are played by clients, monsters are played by the AI.
+    Heroes without a command for the round do nothing.
+    """
+    def __init__(self, heroes, monsters, max_rounds: int = None):
+        super().__init__(heroes, monsters, max_rounds=max_rounds, batched=True)
+        # Hero uid -> action of the next round
+        self.commands: Dict[int, Action] = {}
+
+    def player_select_action(self, hero):
+        return self.commands.pop(hero.uid, None)
+
+
+class Connection:
+    """
+    A client connection, replies are buffered until the end of the tick.
+    """
+    def __init__(self, connection_id: int, writer: asyncio.StreamWriter):
+        self.id: int = connection_id
+        self.writer: asyncio.StreamWriter = writer
+        self.outbox: List[bytes] = []
+        self.encounters: set = set()  # ids of the encounters it plays
+        self.closed: bool = False
+
+    def send(self, message: Dict) -> None:
+        self.outbox.append(encode(message))
+
+    def flush(self) -> None:
+        """
+        Write the buffered replies at once, drop the client if it does not read them.
+        """
+        if self.closed or not self.outbox:
+            return
+        self.writer.write(b"".join(self.outbox))
+        self.outbox.clear()
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            logging.warning(f"Dropping connection {self.id}: too slow")
+            self.close()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+class Encounter:
+    """
+    One fight hosted by the server, played by one connection.
+    """
+    def __init__(self, encounter_id: int, connection: Connection, heroes: list, monsters: list, max_rounds: int = None):
+        self.id: int = encounter_id
+        self.connection: Connection = connection
+        self.combat_manager: RemoteCombatManager = RemoteCombatManager(heroes, monsters, max_rounds)
+        # uid -> creature
+        self.creatures: Dict[int, object] = {creature.uid: creature for creature in heroes + monsters}
+        self.tracker: DeltaTracker = DeltaTracker(self.creatures.values())
+
+    def describe(self) -> Dict:
+        combat_manager = self.combat_manager
+        return {
+            "op": "joined",
+            "encounter": self.id,
+            "heroes": [[hero.uid, hero.name, [ability.name for ability in hero.abilities]] for hero in combat_manager.heroes],
+            "monsters": [[monster.uid, monster.name] for monster in combat_manager.monsters]
+        }
+
+    @property
+    def is_over(self) -> bool:
+        combat_manager = self.combat_manager
+        return combat_manager.is_combat_over() or (
+            combat_manager.max_rounds is not None and combat_manager.round >= combat_manager.max_rounds
+        )
+
+    def command(self, message: Dict) -> None:
+        """
+        Validate an "act" command and queue its action for the next round.
+        Raises CommandError if the command can not be played.
+        """
+        hero_uid, target_uid = uid_field(message, "hero"), uid_field(message, "target", optional=True)
+        hero = self.creatures.get(hero_uid)
+        if hero is None or not hero.is_hero:
+            raise CommandError(f"Unknown hero {hero_uid}")
+        if not hero.is_alive:
+            raise CommandError(f"{hero.name} is dead")
+        target = hero if target_uid is None else self.creatures.get(target_uid)
+        if target is None:
+            raise CommandError(f"Unknown target {target_uid}")
+        action = message.get("action", "attack")
+        if action == "attack":
+            if not target.is_alive or target.is_hero:
+                raise CommandError(f"{target.name} can not be attacked")
+            self.combat_manager.commands[hero.uid] = AttackAction(hero, target)
+        elif action == "ability":
+            index = message.get("ability", 0)
+            if not isinstance(index, int) or not 0 <= index < len(hero.abilities):
+                raise CommandError(f"Unknown ability {index}")
+            ability = hero.abilities[index]
+            try:
+                ability.can_use(hero, target)
+            except AbilityError as e:
+                raise CommandError(str(e))
+            self.combat_manager.commands[hero.uid] = AbilityAction(hero, target, ability)
+        elif action == "defend":
+            self.combat_manager.commands[hero.uid] = DefendAction(hero, None)
+        elif action == "wait":
+            self.combat_manager.commands[hero.uid] = WaitAction(hero, None)
+        else:
+            raise CommandError(f"Unknown action {action}")
+
+    def play(self) -> Dict:
+        """
+        Play one round with the queued commands, returns the reply for the client.
+        """
+        combat_manager = self.combat_manager
+        with combat_manager.templates.activate():
+            combat_manager.round += 1
+            results = combat_manager.play_round()
+        combat_manager.commands.clear()
+        reply = {
+            "op": "round",
+            "encounter": self.id,
+            "round": combat_manager.round,
+            "results": results,
+            "changes": self.tracker.tick()
+        }
+        if self.is_over:
+            reply["winner"] = combat_manager.winner()
+        return reply
+
+
+class GameServer:
+    """
+    Hosts many encounters in one process, advancing them at a fixed tick rate.
+    Commands: {"op": "join", "party": [...], "monsters": [...]},
+    {"op": "act", "encounter": id, "hero": uid, "action": "attack" | "ability" | "defend" | "wait", "target": uid, "ability": index},
+    {"op": "leave", "encounter": id} and {"op": "stats"}. Every command may carry an "id" echoed in errors.
+    """
+    def __init__(self, tick_rate: float = TICK_RATE, max_rounds: int = 100, max_party: int = 8, max_joins: int = MAX_JOINS,
+                 budget: float = TICK_BUDGET, full_collection: int = FULL_COLLECTION):
+        self.interval: float = 1 / tick_rate
+        self.budget: float = budget * self.interval  # seconds of work per tick
+        self.full_collection: int = full_collection
+        self.max_rounds: int = max_rounds
+        self.max_party: int = max_party
+        self.max_joins: int = max_joins
+        self.inbox: List[Tuple[Connection, Dict]] = []
+        # Encounters with commands whose round did not fit in the last tick, played first at the next one
+        self.ready: Dict[int, Encounter] = {}
+        self.connections: Dict[int, Connection] = {}
+        self.encounters: Dict[int, Encounter] = {}
+        self.next_connection: int = 1
+        self.next_encounter: int = 1
+        self.tick_count: int = 0
+        self.tick_times: deque = deque(maxlen=1000)  # seconds spent in each of the last ticks
+        self.overruns: int = 0  # ticks that took longer than the interval
+        self.snapshot: Optional[templateStore.TemplateSnapshot] = None
+        self.spawner: Optional[Spawner] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop_task: Optional[asyncio.Task] = None
+        self.tasks: set = set()  # tasks reading the connections
+        self.handlers: Dict[str, Callable[[Connection, Dict], Optional[Encounter]]] = {
+            "join": self.join, "act": self.act, "leave": self.leave, "stats": self.send_stats
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> 'GameServer':
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE, backlog=4096)
+        self.loop_task = asyncio.create_task(self.run())
+        return self
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.loop_task is not None:
+            self.loop_task.cancel()
+            try:
+                await self.loop_task
+            except asyncio.CancelledError:
+                pass
+        if self.server is not None:
+            self.server.close()
+            for connection in list(self.connections.values()):
+                connection.close()
+            # Closed connections reach the end of their stream
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Read the commands of a connection into the inbox, they are handled at the next tick.
+        """
+        connection = Connection(self.next_connection, writer)
+        self.next_connection += 1
+        self.connections[connection.id] = connection
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    connection.send({"op": "error", "error": "Invalid JSON"})
+                    continue
+                self.inbox.append((connection, message))
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.tasks.discard(task)
+            connection.close()
+            del self.connections[connection.id]
+            for encounter_id in connection.encounters:
+                self.encounters.pop(encounter_id, None)
+
+    async def run(self) -> None:
+        """
+        Tick at a fixed rate. A late tick is not made up for, the next one is scheduled from now.
+        The garbage collector only runs at the end of the ticks: an automatic full collection
+        of thousands of encounters stalls the tick it lands in for several intervals.
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            while True:
+                next_tick += self.interval
+                self.tick()
+                delay = next_tick - loop.time()
+                if delay < 0:
+                    self.overruns += 1
+                    next_tick = loop.time()
+                    delay = 0
+                await asyncio.sleep(delay)
+        finally:
+            if collecting:
+                gc.enable()
+
+    def tick(self) -> None:
+        """
+        Validate every command received since the last tick, play a round in every
+        encounter that received commands and flush every connection once.
+        Joins past max_joins, and the later commands of their connections, wait for the next tick
+        so that a burst of new players does not stall the running encounters.
+        Once the budget is spent, the commands of connections not yet handled and the rounds
+        not yet played wait for the next tick, so that the tick keeps its rate under load
+        and the players see a longer round trip instead.
+        """
+        start = time.perf_counter()
+        deadline = start + self.budget
+        self.tick_count += 1
+        snapshot = templateStore.snapshot()
+        if snapshot is not self.snapshot:
+            # Templates were reloaded, new encounters use the new ones
+            self.snapshot, self.spawner = snapshot, Spawner.from_snapshot(snapshot)
+
+        inbox, self.inbox = self.inbox, []
+        ready, self.ready = self.ready, {}
+        joins = 0
+        deferred: set = set()  # ids of the connections whose commands wait
+        handled: set = set()  # ids of the connections with a command handled, the rest of their batch is too
+        for connection, message in inbox:
+            if connection.closed:
+                continue
+            if connection.id in deferred or (isinstance(message, dict) and message.get("op") == "join" and joins >= self.max_joins) or (
+                    handled and connection.id not in handled and time.perf_counter() > deadline):
+                deferred.add(connection.id)
+                self.inbox.append((connection, message))
+                continue
+            handled.add(connection.id)
+            joins += isinstance(message, dict) and message.get("op") == "join"
+            try:
+                if not isinstance(message, dict):
+                    raise CommandError("Commands are JSON objects")
+                op = message.get("op")
+                handler = self.handlers.get(op) if isinstance(op, str) else None
+                if handler is None:
+                    raise CommandError(f"Unknown op {op}")
+                encounter = handler(connection, message)
+                if encounter is not None:
+                    ready[encounter.id] = encounter
+            except CommandError as e:
+                connection.send({"op": "error", "id": message.get("id") if isinstance(message, dict) else None, "error": str(e)})
+            except Exception:
+                # A command the checks let through must not stop the tick loop for everyone
+                logging.exception(f"Command of connection {connection.id} failed: {message!r:.200}")
+                connection.send({"op": "error", "id": message.get("id") if isinstance(message, dict) else None, "error": "Internal error"})
+
+        played = 0
+        for encounter in ready.values():
+            if encounter.id not in self.encounters:
+                continue
+            if played and time.perf_counter() > deadline:
+                self.ready[encounter.id] = encounter
+                continue
+            played += 1
+            encounter.connection.send(encounter.play())
+            if encounter.is_over:
+                self.close_encounter(encounter)
+
+        for connection in list(self.connections.values()):
+            connection.flush()
+        # Encounters rarely leave cycles, the young objects are enough most ticks
+        gc.collect(2 if self.tick_count % self.full_collection == 0 else 1)
+        self.tick_times.append(time.perf_counter() - start)
+
+    def encounter(self, connection: Connection, message: Dict) -> Encounter:
+        encounter_id = uid_field(message, "encounter")
+        encounter = self.encounters.get(encounter_id)
+        if encounter is None or encounter.connection is not connection:
+            raise CommandError(f"Unknown encounter {encounter_id}")
+        return encounter
+
+    def join(self, connection: Connection, message: Dict) -> None:
+        party, monsters = message.get("party") or [], message.get("monsters") or []
+        if not isinstance(party, list) or not isinstance(monsters, list) or not party or not monsters:
+            raise CommandError("join needs a party and monsters")
+        if len(party) > self.max_party or len(monsters) > self.max_party:
+            raise CommandError(f"At most {self.max_party} heroes and monsters")
+        heroes = [hero for hero_class in party for hero in self.spawner.spawn_heroes(str(hero_class))]
+        spawned = [monster for monster_type in monsters for monster in self.spawner.spawn_monsters(str(monster_type))]
+        if len(heroes) != len(party) or len(spawned) != len(monsters):
+            raise CommandError("Unknown hero class or monster type")
+        encounter = Encounter(self.next_encounter, connection, heroes, spawned, self.max_rounds)
+        self.next_encounter += 1
+        self.encounters[encounter.id] = encounter
+        connection.encounters.add(encounter.id)
+        connection.send(encounter.describe())
+        return None
+
+    def act(self, connection: Connection, message: Dict) -> Encounter:
+        encounter = self.encounter(connection, message)
+        encounter.command(message)
+        return encounter
+
+    def leave(self, connection: Connection, message: Dict) -> None:
+        self.close_encounter(self.encounter(connection, message))
+        connection.send({"op": "left", "encounter": message.get("encounter")})
+        return None
+
+    def close_encounter(self, encounter: Encounter) -> None:
+        self.encounters.pop(encounter.id, None)
+        encounter.connection.encounters.discard(encounter.id)
+
+    def stats(self) -> Dict:
+        """
+        Load of the server and duration of the last ticks, in milliseconds.
+        """
+        times = [duration * 1000 for duration in self.tick_times]
+        return {
+            "op": "stats",
+            "tick": self.tick_count,
+            "connections": len(self.connections),
+            "encounters": len(self.encounters),
+            "waiting": len(self.ready),  # encounters whose round waits for the next tick
+            "overruns": self.overruns,
+            "tick_ms": {
+                "mean": statistics.fmean(times) if times else 0.0,
+                "p50": percentile(times, 0.5),
+                "p99": percentile(times, 0.99),
+                "max": max(times, default=0.0)
+            }
+        }
+
+    def send_stats(self, connection: Connection, message: Dict) -> None:
+        connection.send(self.stats())
+        return None
+
+
+async def play_client(host: str, port: int, party: List[str], monsters: List[str], deadline: float, report: Dict) -> None:
+    """
+    One simulated player: joins an encounter, orders every hero to attack the first
+    living monster, waits for the round, and joins a new encounter when the fight ends.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    loop = asyncio.get_running_loop()
+    try:
+        while loop.time() < deadline:
+            writer.write(encode({"op": "join", "party": party, "monsters": monsters}))
+            joined = json.loads(await reader.readline())
+            if joined.get("op") != "joined":
+                report["errors"] += 1
+                return
+            heroes = [uid for uid, _, _ in joined["heroes"]]
+            alive = [uid for uid, _ in joined["monsters"]]
+            report["encounters"] += 1
+            while loop.time() < deadline:
+                commands = [
+                    encode({"op": "act", "encounter": joined["encounter"], "hero": hero, "action": "attack", "target": alive[0]})
+                    for hero in heroes
+                ]
+                sent = loop.time()
+                writer.write(b"".join(commands))
+                # An error per rejected command, the round follows if any command was valid
+                rejected = 0
+                reply = json.loads(await reader.readline())
+                while reply.get("op") == "error" and rejected < len(commands) - 1:
+                    rejected += 1
+                    reply = json.loads(await reader.readline())
+                if reply.get("op") != "round":
+                    report["errors"] += rejected + 1
+                    break
+                report["latencies"].append(loop.time() - sent)
+                report["rounds"] += 1
+                for uid, change in reply["changes"].items():
+                    if change.get("alive") is False:
+                        uid = int(uid)
+                        if uid in alive:
+                            alive.remove(uid)
+                        elif uid in heroes:
+                            heroes.remove(uid)
+                if "winner" in reply or not alive or not heroes:
+                    break
+    finally:
+        writer.close()
+
+
+async def load_test(host: str, port: int, clients: int = 100, duration: float = 5.0,
+                    party: List[str] = None, monsters: List[str] = None) -> Dict:
+    """
+    Connect clients simulated players for duration seconds.
+    Returns the rounds played, the round-trip latency in milliseconds and the server's tick statistics.
+    """
+    loop = asyncio.get_running_loop()
+    report = {"encounters": 0, "rounds": 0, "errors": 0, "latencies": []}
+    deadline = loop.time() + duration
+    await asyncio.gather(*(
+        play_client(host, port, party or ["Warior"], monsters or ["Goblin"], deadline, report)
+        for _ in range(clients)
+    ))
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"op": "stats"}))
+    server_stats = json.loads(await reader.readline())
+    writer.close()
+    latencies = [latency * 1000 for latency in report.pop("latencies")]
+    report.update({
+        "clients": clients,
+        "rounds_per_second": report["rounds"] / duration,
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99), "max": max(latencies, default=0.0)},
+        "server": server_stats
+    })
+    return report
+
+
+async def serve(host: str, port: int, tick_rate: float) -> None:
+    server = await GameServer(tick_rate).start(host, port)
+    print(f"serving on {host}:{server.port}, {tick_rate:g} ticks per second")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+async def run_load_test(host: str, port: int, clients: int, duration: float, tick_rate: float) -> Dict:
+    """
+    Load test a server, started in this process when port is 0.
+    """
+    server = None
+    if not port:
+        server = await GameServer(tick_rate).start(host)
+        port = server.port
+    try:
+        return await load_test(host, port, clients, duration)
+    finally:
+        if server is not None:
+            await server.stop()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the game server or load test it.")
+    parser.add_argument("mode", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port to serve on, or of the server to load test (0 starts one in process)")
+    parser.add_argument("--tick-rate", type=float, default=TICK_RATE)
+    parser.add_argument("--clients", type=int, default=1000, help="simulated players of the load test")
+    parser.add_argument("--duration", type=float, default=10.0, help="length of the load test in seconds")
+    args = parser.parse_args(argv)
+
+    if args.mode == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.tick_rate))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    report = asyncio.run(run_load_test(args.host, args.port, args.clients, args.duration, args.tick_rate))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+# this file contains the SQLite store for heroes, their inventories and equipment
+# The store remembers what it last wrote for every hero and only writes the parts
+# that changed since: the hero row, its inventory, equipped slots, ability
+# cooldowns and active effects are compared separately. Changes are written in
+# batched transactions with executemany, whose statements sqlite prepares once
+# and reuses. Child tables are keyed by (hero id, position) without rowid, so
+# the rows of a hero are stored together and bulk loads read them in key order.
+import json
+import logging
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from operator import attrgetter, itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from classes.changeTracking import resource_values
+from classes.effects import EffectFactory
+from classes.enums import CostType, EquipmentSlot
+from classes.inventory import Item
+from classes.spawner import Spawner
+from classes.templateStore import get_templates
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS heroes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    hero_class TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    exp INTEGER NOT NULL,
+    hp INTEGER NOT NULL,
+    max_hp INTEGER NOT NULL,
+    defense INTEGER NOT NULL,
+    defending INTEGER NOT NULL,
+    initiative INTEGER NOT NULL,
+    max_attack INTEGER NOT NULL,
+    min_attack INTEGER NOT NULL,
+    attack_bonus INTEGER NOT NULL,
+    max_weight REAL NOT NULL,
+    is_alive INTEGER NOT NULL,
+    resources TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS heroes_by_class ON heroes (hero_class);
+CREATE TABLE IF NOT EXISTS inventory_items (
+    hero_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    item_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (hero_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS equipped_items (
+    hero_id INTEGER NOT NULL,
+    slot TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (hero_id, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cooldowns (
+    hero_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    ability TEXT NOT NULL,
+    cooldown INTEGER NOT NULL,
+    PRIMARY KEY (hero_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS effects (
+    hero_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    effect_class TEXT NOT NULL,
+    name TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    potency REAL NOT NULL,
+    applied INTEGER NOT NULL,
+    PRIMARY KEY (hero_id, position)
+) WITHOUT ROWID;
+"""
+
+HERO_COLUMNS = (
+    "id", "name", "hero_class", "level", "exp", "hp", "max_hp", "defense", "defending",
+    "initiative", "max_attack", "min_attack", "attack_bonus", "max_weight", "is_alive", "resources"
+)
+# Hero attributes stored as is, in HERO_COLUMNS order after the id
+HERO_ATTRIBUTES = HERO_COLUMNS[1:-1]
+
+# Child table -> its columns after hero_id
+CHILD_TABLES: Dict[str, Tuple[str, ...]] = {
+    "inventory_items": ("position", "item_type", "name"),
+    "equipped_items": ("slot", "item_type", "name"),
+    "cooldowns": ("position", "ability", "cooldown"),
+    "effects": ("position", "effect_class", "name", "duration", "potency", "applied")
+}
+
+# Template name of every equipment slot -> slot
+SLOTS: Dict[str, EquipmentSlot] = {str(slot): slot for slot in EquipmentSlot}
+SLOT_NAMES: Dict[EquipmentSlot, str] = {slot: name for name, slot in SLOTS.items()}
+
+BATCH_SIZE = 20000  # heroes per write transaction
+MAX_PARAMETERS = 500  # ids per "IN (...)" query
+
+
+class ConnectionPool:
+    """
+    A few SQLite connections to one database, handed to one thread at a time.
+    Connections are opened on first use and kept until close().
+    """
+    def __init__(self, path: str, size: int = 4):
+        self.path: str = path
+        self.size: int = size
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.opened: List[sqlite3.Connection] = []
+
+    def open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=OFF")
+        self.opened.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection, waiting for one to be returned if size are in use.
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.open() if len(self.opened) < self.size else self.idle.get()
+        try:
+            yield connection
+        finally:
+            self.idle.put(connection)
+
+    def close(self) -> None:
+        for connection in self.opened:
+            connection.close()
+        self.opened.clear()
+        self.idle = queue.LifoQueue()
+
+
+_row = attrgetter(*HERO_ATTRIBUTES)
+_cooldown = attrgetter("current_cooldown")
+
+
+def effect_row(effect) -> tuple:
+    # applied tells whether a stat modifier is already in the saved stats and has to be reverted on expiry
+    return type(effect).__name__, effect.name, effect.duration, effect.potency, getattr(effect, 'applied', False)
+
+
+def hero_state(hero) -> Tuple[tuple, tuple, tuple, tuple, tuple]:
+    """
+    (row, inventory, equipment, cooldowns, effects) of a hero, compared with the saved ones
+    to find what changed. Rows are without the hero id. Items carry no per-owner state,
+    so they are compared by identity.
+    """
+    inventory = getattr(hero, 'inventory', None)
+    equipment_manager = getattr(hero, 'equipment_manager', None)
+    effects = hero.effect_manager.active_effects
+    return (
+        _row(hero) + resource_values(hero),
+        tuple(inventory.items) if inventory is not None else (),
+        tuple(equipment_manager.equipped_items.items()) if equipment_manager is not None else (),
+        tuple(map(_cooldown, hero.abilities)),
+        tuple(map(effect_row, effects)) if effects else ()
+    )
+
+
+class HeroStore:
+    """
+    Saves heroes to a SQLite database and loads them back.
+    Heroes get a database id the first time they are saved, save() then only writes what changed.
+    """
+    def __init__(self, path: str, pool_size: int = 4, batch_size: int = BATCH_SIZE, spawner: Spawner = None):
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.spawner: Optional[Spawner] = spawner
+        self.pool: ConnectionPool = ConnectionPool(path, pool_size)
+        # hero uid -> database id
+        self.ids: Dict[int, int] = {}
+        # hero uid -> hero_state when it was last saved or loaded
+        self.saved: Dict[int, tuple] = {}
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def __enter__(self) -> 'HeroStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def hero_id(self, hero) -> Optional[int]:
+        """Database id of a hero, None if it was never saved or loaded"""
+        return self.ids.get(hero.uid)
+
+    def forget(self, hero) -> None:
+        """Stop tracking a hero that is no longer in memory, its rows are kept"""
+        self.ids.pop(hero.uid, None)
+        self.saved.pop(hero.uid, None)
+
+    def save(self, heroes: Iterable) -> int:
+        """
+        Write the heroes that changed since they were last saved or loaded, new ones entirely.
+        Returns the number of heroes written.
+        """
+        written = 0
+        batch = []
+        for hero in heroes:
+            batch.append(hero)
+            if len(batch) >= self.batch_size:
+                written += self.save_batch(batch)
+                batch = []
+        if batch:
+            written += self.save_batch(batch)
+        return written
+
+    def save_batch(self, heroes: Sequence) -> int:
+        """
+        Write the changes of some heroes in one transaction.
+        New heroes get their ids inside the transaction, under the write lock, so that
+        stores sharing the database never hand out the same id.
+        The saved states are only updated once the transaction is committed.
+        """
+        changed = []
+        for hero in heroes:
+            state = hero_state(hero)
+            last = self.saved.get(hero.uid)
+            if last != state:
+                changed.append((hero, state, last))
+        if not changed:
+            return 0
+
+        with self.pool.connection() as connection:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                next_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM heroes").fetchone()[0]
+                rows, children, new_ids = self.changed_rows(changed, next_id)
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO heroes ({', '.join(HERO_COLUMNS)}) VALUES ({', '.join('?' * len(HERO_COLUMNS))})",
+                    rows
+                )
+                for table, columns in CHILD_TABLES.items():
+                    ids, new_rows = children[table]
+                    if ids:
+                        connection.executemany(f"DELETE FROM {table} WHERE hero_id = ?", ids)
+                    if new_rows:
+                        connection.executemany(
+                            f"INSERT INTO {table} (hero_id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+                            new_rows
+                        )
+        self.ids.update(new_ids)
+        self.saved.update((hero.uid, state) for hero, state, _ in changed)
+        return len(changed)
+
+    def changed_rows(self, changed: Sequence[tuple], next_id: int) -> Tuple[List[tuple], Dict[str, Tuple[List[tuple], List[tuple]]], Dict[int, int]]:
+        """
+        (hero rows, child table -> (ids whose rows are replaced, new rows), hero uid -> new id) to write
+        for some (hero, state, last saved state), new heroes are numbered from next_id.
+        """
+        rows: List[tuple] = []
+        children: Dict[str, Tuple[List[tuple], List[tuple]]] = {table: ([], []) for table in CHILD_TABLES}
+        new_ids: Dict[int, int] = {}
+        for hero, state, last in changed:
+            hero_id = self.ids.get(hero.uid)
+            # Heroes saved before have child rows to replace
+            replaced = hero_id is not None
+            if not replaced:
+                hero_id = new_ids[hero.uid] = next_id + len(new_ids)
+                last = (None, None, None, None, None)
+            row, inventory, equipment, cooldowns, effects = state
+            if row != last[0]:
+                *attributes, resource_types, values = row
+                resources = json.dumps({str(resource_type): value for resource_type, value in zip(resource_types, values)})
+                rows.append((hero_id, *attributes, resources))
+            if inventory != last[1]:
+                ids, new_rows = children["inventory_items"]
+                if replaced:
+                    ids.append((hero_id,))
+                new_rows.extend((hero_id, position, type(item).__name__, item.name) for position, item in enumerate(inventory))
+            if equipment != last[2]:
+                ids, new_rows = children["equipped_items"]
+                if replaced:
+                    ids.append((hero_id,))
+                new_rows.extend((hero_id, SLOT_NAMES[slot], type(item).__name__, item.name) for slot, item in equipment if item is not None)
+            if cooldowns != last[3]:
+                ids, new_rows = children["cooldowns"]
+                if replaced:
+                    ids.append((hero_id,))
+                new_rows.extend(
+                    (hero_id, position, ability.name, cooldown)
+                    for position, (ability, cooldown) in enumerate(zip(hero.abilities, cooldowns))
+                )
+            if effects != last[4]:
+                ids, new_rows = children["effects"]
+                if replaced:
+                    ids.append((hero_id,))
+                new_rows.extend((hero_id, position, *effect) for position, effect in enumerate(effects))
+        return rows, children, new_ids
+
+    def delete(self, heroes: Iterable) -> int:
+        """Delete saved heroes and all their rows, returns the number deleted"""
+        ids = []
+        for hero in heroes:
+            hero_id = self.ids.pop(hero.uid, None)
+            self.saved.pop(hero.uid, None)
+            if hero_id is not None:
+                ids.append((hero_id,))
+        if ids:
+            with self.pool.connection() as connection:
+                with connection:
+                    connection.executemany("DELETE FROM heroes WHERE id = ?", ids)
+                    for table in CHILD_TABLES:
+                        connection.executemany(f"DELETE FROM {table} WHERE hero_id = ?", ids)
+        return len(ids)
+
+    def select(self, connection: sqlite3.Connection, table: str, columns: Sequence[str], key: str,
+               ids: Optional[Sequence[int]], order: str) -> Iterator[tuple]:
+        """
+        Rows of a table whose key is in ids (every row if ids is None), in key order.
+        Full chunks of ids reuse the same prepared statement.
+        """
+        query = f"SELECT {', '.join(columns)} FROM {table}"
+        if ids is None:
+            yield from connection.execute(f"{query} ORDER BY {order}")
+            return
+        for start in range(0, len(ids), MAX_PARAMETERS):
+            chunk = ids[start:start + MAX_PARAMETERS]
+            yield from connection.execute(f"{query} WHERE {key} IN ({', '.join('?' * len(chunk))}) ORDER BY {order}", chunk)
+
+    def ids_of_class(self, hero_class: str) -> List[int]:
+        """Database ids of the saved heroes of a class, read from the class index"""
+        with self.pool.connection() as connection:
+            return [hero_id for hero_id, in connection.execute("SELECT id FROM heroes WHERE hero_class = ? ORDER BY id", (hero_class,))]
+
+    def load(self, ids: Sequence[int] = None) -> List:
+        """
+        Load saved heroes, all of them when ids is None, in id order.
+        Heroes are rebuilt from their class template, then given their saved state.
+        Heroes whose class no longer exists are skipped and logged.
+        """
+        spawner = self.spawner or Spawner.from_store()
+        item_templates = spawner.item_templates if spawner.item_templates is not None else get_templates("items")
+        ids = None if ids is None else sorted(set(ids))
+        # (item type, name) -> item, items carry no per-owner state and are shared
+        items: Dict[Tuple[str, str], Item] = {}
+
+        def item(item_type: str, name: str) -> Optional[Item]:
+            key = (item_type, name)
+            if key not in items:
+                items[key] = Item.create_item(item_type, name, item_templates)
+            return items[key]
+
+        # Resource name -> CostType
+        resource_types: Dict[str, CostType] = {}
+        heroes: Dict[int, object] = {}
+        with self.pool.connection() as connection:
+            for row in self.select(connection, "heroes", HERO_COLUMNS, "id", ids, "id"):
+                hero_id, name, hero_class = row[0], row[1], row[2]
+                spawned = spawner.spawn_heroes(hero_class, name=name)
+                if not spawned:
+                    logging.error(f"Can not load hero {hero_id}: unknown hero class {hero_class}")
+                    continue
+                hero = spawned[0]
+                # Restored state is not a change: the attributes bypass the dirty marks of TrackedAttribute
+                vars(hero).update(zip(HERO_ATTRIBUTES, row[1:-1]))
+                vars(hero)["is_alive"] = bool(hero.is_alive)
+                for resource_name, value in json.loads(row[-1]).items():
+                    resource_type = resource_types.get(resource_name)
+                    if resource_type is None:
+                        resource_type = resource_types[resource_name] = CostType.parse(resource_name)
+                    hero.resources[resource_type] = value
+                hero.inventory.items = []
+                hero.equipment_manager.equipped_items = dict.fromkeys(hero.equipment_manager.equipped_items)
+                heroes[hero_id] = hero
+
+            for table, columns in CHILD_TABLES.items():
+                rows = self.select(connection, table, ("hero_id",) + columns, "hero_id", ids, "hero_id, " + columns[0])
+                for hero_id, hero_rows in groupby(rows, key=itemgetter(0)):
+                    hero = heroes.get(hero_id)
+                    if hero is None:
+                        continue
+                    if table == "inventory_items":
+                        hero.inventory.items = [
+                            loaded for loaded in (item(item_type, name) for _, _, item_type, name in hero_rows) if loaded is not None
+                        ]
+                    elif table == "equipped_items":
+                        for _, slot, item_type, name in hero_rows:
+                            equipped = item(item_type, name)
+                            if equipped is not None:
+                                hero.equipment_manager.equipped_items[SLOTS.get(slot, slot)] = equipped
+                    elif table == "cooldowns":
+                        for _, position, ability_name, cooldown in hero_rows:
+                            if position < len(hero.abilities) and hero.abilities[position].name == ability_name:
+                                hero.abilities[position].current_cooldown = cooldown
+                    else:
+                        for _, _, effect_class, name, duration, potency, applied in hero_rows:
+                            effect = EffectFactory.create_effect(effect_class, name, source_type="environment")
+                            if effect is not None:
+                                # Restored as is, the effect was applied when it was first added:
+                                # the saved stats include its modifier, which expiry reverts
+                                effect.duration, effect.potency = duration, potency
+                                if hasattr(effect, 'applied'):
+                                    effect.applied = bool(applied)
+                                hero.effect_manager.active_effects.append(effect)
+
+        for hero_id, hero in heroes.items():
+            self.ids[hero.uid] = hero_id
+            self.saved[hero.uid] = hero_state(hero)
+        return list(heroes.values())
+
+
+def benchmark(path: str, count: int = 100000, changed: float = 0.1) -> Dict[str, float]:
+    """
+    Seconds taken to save count new heroes, to save them again after changing a fraction of them,
+    and to load them all back.
+    """
+    spawner = Spawner.from_store()
+    heroes = [hero for hero_class in ("Warior", "Mage") for hero in spawner.spawn_heroes(hero_class, count // 2)]
+    timings = {}
+    with HeroStore(path, spawner=spawner) as store:
+        start = time.perf_counter()
+        store.save(heroes)
+        timings["save_all"] = time.perf_counter() - start
+        for hero in heroes[:int(len(heroes) * changed)]:
+            hero.hp -= 1
+            hero.exp += 10
+        start = time.perf_counter()
+        timings["written"] = store.save(heroes)
+        timings["save_changed"] = time.perf_counter() - start
+    with HeroStore(path, spawner=spawner) as store:
+        start = time.perf_counter()
+        timings["loaded"] = len(store.load())
+        timings["load_all"] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(json.dumps(benchmark(os.path.join(tmp_dir, "heroes.db")), indent=2))
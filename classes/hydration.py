@@ -0,0 +1,221 @@
+# this file contains the creature records that dormant creatures are kept as
+# A creature that is not fighting does not need its objects: a record keeps its
+# template, uid, name and the fields that differ from the template's prototype,
+# a few hundred bytes instead of the creature, its abilities, resources and
+# managers. Hydrating a record clones the prototype and applies the overrides,
+# dehydrating an idle creature builds its record again. A dormant world keeps
+# its creatures as records and only hydrates the ones that wake up.
+import copy
+from typing import Dict, Iterable, List, Optional, Tuple, Type, Union
+
+from classes.changeTracking import next_uid
+from classes.creature import Creature, Hero, Monster, create_abilities, materialized
+from classes.inventory import Item
+from classes.resources import Resources
+from classes.spawner import Spawner, roll
+from classes.templateStore import get_templates
+
+# Attributes that are not plain values, recorded separately or not at all
+SPECIAL_ATTRIBUTES = frozenset((
+    'uid', 'name', 'dirty', 'abilities', 'resources', 'effect_manager', 'inventory', 'equipment_manager',
+    'on_death', 'on_damage', 'on_heal'
+))
+_MISSING = object()
+# Override names of the records, shared: the records of a template mostly override the same fields
+_fields: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+class CreatureRecord:
+    """
+    Compact form of a creature: its template and what differs from the template's prototype.
+    Overrides are stored as a shared tuple of names and a tuple of values.
+    """
+    __slots__ = ('creature_class', 'template', 'uid', 'name', 'fields', 'values')
+
+    def __init__(self, creature_class: Type[Union[Hero, Monster]], template: str, uid: int, name: str,
+                 overrides: Dict[str, object] = None):
+        self.creature_class: Type[Union[Hero, Monster]] = creature_class
+        self.template: str = template
+        self.uid: int = uid
+        self.name: str = name
+        # attribute names, plus 'abilities', 'cooldowns', 'resources', 'inventory' and 'equipment' when they differ
+        fields = tuple(overrides or ())
+        self.fields: Tuple[str, ...] = _fields.setdefault(fields, fields)
+        self.values: tuple = tuple(overrides.values()) if overrides else ()
+
+    @property
+    def overrides(self) -> Dict[str, object]:
+        return dict(zip(self.fields, self.values))
+
+    def __repr__(self) -> str:
+        return f"CreatureRecord({self.creature_class.__name__}, {self.template!r}, uid={self.uid}, name={self.name!r})"
+
+
+def template_of(creature: Creature) -> str:
+    return creature.hero_class if creature.is_hero else creature.monster_type
+
+
+def item_names(items: Iterable[Item]) -> Tuple[Tuple[str, str], ...]:
+    return tuple((type(item).__name__, item.name) for item in items)
+
+
+def equipped_names(hero: Hero) -> Tuple[Tuple[object, str, str], ...]:
+    """(slot, item type, name) of the equipped items of a hero"""
+    return tuple((slot, type(item).__name__, item.name) for slot, item in hero.equipment_manager.equipped_items.items() if item is not None)
+
+
+def is_idle(creature: Creature) -> bool:
+    """Whether a creature can be dehydrated: no active effect and no fight watching it through its hooks"""
+    if materialized(creature, 'effect_manager') and creature.effect_manager.active_effects:
+        return False
+    return all(creature.__dict__.get(hook) is None for hook in ('on_death', 'on_damage', 'on_heal'))
+
+
+def dehydrate(creature: Creature, spawner: Spawner) -> Optional[CreatureRecord]:
+    """
+    Record of an idle creature, None if it is not idle or its template is unknown.
+    """
+    template = template_of(creature)
+    prototype = spawner.compile(type(creature), template) if template is not None else None
+    if prototype is None or not is_idle(creature):
+        return None
+
+    defaults = vars(prototype)
+    overrides = {
+        attribute: value for attribute, value in vars(creature).items()
+        if attribute not in SPECIAL_ATTRIBUTES and defaults.get(attribute, _MISSING) != value
+    }
+    abilities = tuple(ability.name for ability in creature.abilities)
+    if abilities != tuple(ability.name for ability in prototype.abilities):
+        overrides['abilities'] = abilities
+    cooldowns = tuple(ability.current_cooldown for ability in creature.abilities)
+    if any(cooldowns):
+        overrides['cooldowns'] = cooldowns
+    resources = creature.resources.spec()
+    if resources != prototype.resources.spec():
+        overrides['resources'] = resources
+    if creature.is_hero:
+        if materialized(creature, 'inventory'):
+            inventory = item_names(creature.inventory.items)
+            if inventory != item_names(prototype.inventory.items):
+                overrides['inventory'] = inventory
+        if materialized(creature, 'equipment_manager'):
+            equipment = equipped_names(creature)
+            if equipment != equipped_names(prototype):
+                overrides['equipment'] = equipment
+    return CreatureRecord(type(creature), template, creature.uid, creature.name, overrides)
+
+
+def hydrate(record: CreatureRecord, spawner: Spawner) -> Optional[Creature]:
+    """
+    Creature of a record, None if its template no longer exists.
+    """
+    prototype = spawner.compile(record.creature_class, record.template)
+    if prototype is None:
+        return None
+    creature = prototype.clone()
+    creature.uid = record.uid
+    creature.name = record.name
+    overrides = record.overrides
+
+    abilities = overrides.pop('abilities', None)
+    if abilities is not None:
+        creature.abilities = create_abilities(abilities, spawner.ability_templates)
+    cooldowns = overrides.pop('cooldowns', None)
+    if cooldowns is not None:
+        for ability, cooldown in zip(creature.abilities, cooldowns):
+            ability.current_cooldown = cooldown
+    resources = overrides.pop('resources', None)
+    if resources is not None:
+        creature.resources = Resources(resources)
+
+    inventory = overrides.pop('inventory', None)
+    equipment = overrides.pop('equipment', None)
+    if inventory is not None or equipment is not None:
+        item_templates = spawner.item_templates if spawner.item_templates is not None else get_templates("items")
+        # (item type, name) -> items of the inventory, equipped items are taken from them
+        carried: Dict[Tuple[str, str], List[Item]] = {}
+        if inventory is not None:
+            creature.inventory.items = [item for item in (Item.create_item(*key, item_templates) for key in inventory) if item]
+        for item in creature.inventory.items:
+            carried.setdefault((type(item).__name__, item.name), []).append(item)
+        if equipment is not None:
+            equipped = creature.equipment_manager.equipped_items = dict.fromkeys(creature.equipment_manager.equipped_items)
+            for slot, item_type, name in equipment:
+                items = carried.get((item_type, name))
+                equipped[slot] = items[0] if items else Item.create_item(item_type, name, item_templates)
+
+    for attribute, value in overrides.items():
+        setattr(creature, attribute, copy.copy(value) if isinstance(value, (dict, list, set)) else value)
+    creature.dirty = 0
+    return creature
+
+
+class DormantWorld:
+    """
+    Creatures of a world by uid, kept as records while dormant and as creatures while awake.
+    """
+    def __init__(self, spawner: Spawner = None):
+        self.spawner: Spawner = spawner or Spawner.from_store()
+        self.records: Dict[int, CreatureRecord] = {}
+        self.awake: Dict[int, Creature] = {}
+
+    def __len__(self) -> int:
+        return len(self.records) + len(self.awake)
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self.records or uid in self.awake
+
+    def populate(self, creature_class: Type[Union[Hero, Monster]], template: str, count: int = 1, name: str = None) -> List[int]:
+        """
+        Add count dormant creatures of a template, numbered and rolled as Spawner.spawn would, without building them.
+        Returns their uids, empty if the template does not exist.
+        """
+        prototype = self.spawner.compile(creature_class, template)
+        if prototype is None:
+            return []
+        variance = self.spawner.prototypes[(creature_class, template)][1]
+        base_name = name or prototype.name
+        uids = []
+        for index in range(count):
+            overrides = {stat: roll(getattr(prototype, stat), spread) for stat, spread in variance}
+            hp = overrides.get('max_hp', prototype.max_hp)
+            if hp != prototype.hp:
+                overrides['hp'] = hp
+            uid = next_uid()
+            self.records[uid] = CreatureRecord(creature_class, template, uid, f"{base_name} {index + 1}" if count > 1 else base_name, overrides)
+            uids.append(uid)
+        return uids
+
+    def add(self, creature: Creature) -> None:
+        """Add a creature, dormant if it is idle"""
+        record = dehydrate(creature, self.spawner)
+        if record is None:
+            self.awake[creature.uid] = creature
+        else:
+            self.records[creature.uid] = record
+
+    def wake(self, uids: Iterable[int]) -> List[Creature]:
+        """Creatures of some uids, hydrated if they were dormant. Unknown uids are skipped"""
+        creatures = []
+        for uid in uids:
+            creature = self.awake.get(uid)
+            if creature is None and uid in self.records:
+                creature = hydrate(self.records.pop(uid), self.spawner)
+                if creature is not None:
+                    self.awake[uid] = creature
+            if creature is not None:
+                creatures.append(creature)
+        return creatures
+
+    def sleep(self, uids: Iterable[int] = None) -> int:
+        """Dehydrate the idle creatures of some uids, all awake ones by default. Returns how many went dormant"""
+        count = 0
+        for uid in list(self.awake) if uids is None else uids:
+            creature = self.awake.get(uid)
+            record = dehydrate(creature, self.spawner) if creature is not None else None
+            if record is not None:
+                del self.awake[uid]
+                self.records[uid] = record
+                count += 1
+        return count
@@ -1,21 +1,18 @@
-import json
 import logging
 from typing import List, Union, TYPE_CHECKING, Dict
+from classes.enums import ARMOR_SLOTS, CostType, EquipmentSlot
+from classes.itemCatalog import item_catalog
+from classes.templateStore import get_templates
 
 if TYPE_CHECKING:
-    from creature import Creature
+    from classes.creature import Creature
 
-try:
-    with open('classes/templates/items.json', 'r') as file:
-        TEMPLATES = json.load(file)
-except FileNotFoundError:
-    logging.error("Effects templates file not found.")
-    TEMPLATES = {}
-except json.JSONDecodeError:
-    logging.error("Error decoding JSON from effects templates file.")
-    TEMPLATES = {}
 
-logging.basicConfig(level=logging.INFO)
+def __getattr__(name: str):
+    # TEMPLATES is resolved lazily so that importing the module does no I/O
+    if name == "TEMPLATES":
+        return get_templates("items")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class Inventory:
     def __init__(self, max_weight: float):
@@ -98,27 +95,30 @@ class Item:
         :return: Created item.
         """
         try:
-            # Adjust to search through nested dictionaries for Armor items
-            if item_type == 'Armor':
-                for category, items in template[item_type].items():
-                    if name in items:
-                        item_template = items[name]
-                        break
-                else:
-                    raise KeyError
-            else:
-                item_template = template[item_type][name]
+            item_template, category = item_catalog(template).find(item_type, name)
         except KeyError:
             logging.error(f"Item template not found for {item_type} with name {name}.")
             return None
+        return cls.from_template(item_type, name, item_template, category)
+
+    @classmethod
+    def from_template(cls, item_type: str, name: str, item_template: Dict[str, Union[str, float, int]], category: Union[EquipmentSlot, str] = None) -> 'Item':
+        """
+        Create an item from its own template.
 
+        :param item_type: Type of the item (e.g., 'Armor', 'Weapon', 'Consumable').
+        :param name: Name of the item.
+        :param item_template: Template of the item.
+        :param category: Armor slot of the item, or its name, for armors.
+        :return: Created item.
+        """
         if item_type == 'Armor':
             return Armor(
                 name=name,
                 defense=item_template["defense"],
                 weight=item_template["weight"],
                 description=item_template["description"],
-                category=category
+                category=EquipmentSlot.parse(category)
             )
         elif item_type == 'Weapon':
             return Weapon(
@@ -136,7 +136,7 @@ class Item:
                 target=item_template.get("target"),
                 is_damage=item_template.get("is_damage", False),
                 is_energy=item_template.get("is_energy", False),
-                energy_type=item_template.get("energy_type"),
+                energy_type=CostType.parse(item_template.get("energy_type")),
                 effect=item_template.get("effect", [])
             )
         else:
@@ -144,7 +144,7 @@ class Item:
             return None
                 
 class Armor(Item):
-    def __init__(self, name: str, weight: float, description : str, defense: float, category : str = None):
+    def __init__(self, name: str, weight: float, description : str, defense: float, category : EquipmentSlot = None):
         """
         Initialize an armor item.
 
@@ -154,7 +154,7 @@ class Armor(Item):
         """
         super().__init__(name, weight, description)
         self.defense: float = defense
-        self.category: str = category
+        self.category: EquipmentSlot = EquipmentSlot.parse(category)
 
 class Weapon(Item):
     def __init__(self, name: str, weight: float, description : str, attack: float):
@@ -169,7 +169,7 @@ class Weapon(Item):
         self.attack: float = attack
         
 class Consumable(Item):
-    def __init__(self, name: str, weight: float, description: str, power : int = 0, target : 'Creature' = None, is_damage : bool = False, is_energy : bool = False, energy_type : str = None, effect: List[Dict[str, str]] = None):
+    def __init__(self, name: str, weight: float, description: str, power : int = 0, target : 'Creature' = None, is_damage : bool = False, is_energy : bool = False, energy_type : CostType = None, effect: List[Dict[str, str]] = None):
         """
         Initialize a consumable item.
 
@@ -183,20 +183,38 @@ class Consumable(Item):
         self.target : 'Creature' = target
         self.is_damage : bool = is_damage
         self.is_energy : bool = is_energy
-        self.energy_type : str = energy_type
+        self.energy_type : CostType = CostType.parse(energy_type)
         self.effect: List[Dict[str, str]] = effect or []
-        
+
+    def use(self, target: 'Creature', user: 'Creature' = None) -> int:
+        """
+        Apply the consumable to a creature.
+
+        :param target: Creature the consumable is used on.
+        :param user: Creature using the consumable, credited with its damage or heal.
+        :return: Power of the consumable.
+        """
+        if self.is_damage:
+            target.take_damage(self.power, source="effect", attacker=user)
+        elif self.is_energy:
+            # Capped by the resource pool
+            target.resources[self.energy_type] = target.resources.get(self.energy_type, 0) + self.power
+        else:
+            target.heal(self.power, healer=user)
+        return self.power
+
 class EquipmentManager:
     """
     Equipement Manager class to handle equipping and unequipping items.
     """
     def __init__(self):
-        self.equipped_items: Dict[str, Union[Armor, Weapon]] = {
-            "head": None,
-            "chest": None,
-            "legs": None,
-            "weapon": None
+        self.equipped_items: Dict[EquipmentSlot, Union[Armor, Weapon]] = {
+            EquipmentSlot.HEAD: None,
+            EquipmentSlot.CHEST: None,
+            EquipmentSlot.LEGS: None,
+            EquipmentSlot.WEAPON: None
         }
+        self.revision: int = 0  # number of changes, watched by change tracking
         
     def equip_item(self, item: Union[Armor, Weapon]) -> None:
         """
@@ -205,29 +223,32 @@ class EquipmentManager:
         :param item: Item to be equipped.
         """
         if isinstance(item, Armor):
-            if item.category in self.equipped_items:
+            if item.category in ARMOR_SLOTS:
                 self.equipped_items[item.category] = item
             else:
                 logging.error(f"Unknown armor category: {item.category}")
                 return
         elif isinstance(item, Weapon):
-            self.equipped_items["weapon"] = item
+            self.equipped_items[EquipmentSlot.WEAPON] = item
         else:
             logging.error(f"Item type not supported: {type(item)}")
             return
+        self.revision += 1
         logging.info(f"Equipped {item.name}")
 
-    def unequip_item(self, slot: str) -> None:
+    def unequip_item(self, slot: EquipmentSlot) -> None:
         """
         Unequip an item from a specific slot.
 
-        :param slot: Slot to unequip the item from.
+        :param slot: Slot to unequip the item from, or its name.
         """
+        slot = EquipmentSlot.parse(slot)
         if slot in self.equipped_items and self.equipped_items[slot] is not None:
             logging.info(f"Unequipped {self.equipped_items[slot].name}")
             self.equipped_items[slot] = None
+            self.revision += 1
 
-    def get_equipped_items(self) -> Dict[str, Union[Armor, Weapon]]:
+    def get_equipped_items(self) -> Dict[EquipmentSlot, Union[Armor, Weapon]]:
         """
         Get the currently equipped items.
 
@@ -236,6 +257,8 @@ class EquipmentManager:
         return self.equipped_items
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Example usage:
     TEMPLATES = {
         "Armor": {
@@ -283,7 +306,7 @@ if __name__ == "__main__":
     # Print equipped items
     for slot, item in equipped_items.items():
         if item:
-            print(f"{slot.capitalize()}: {item.name}")
+            print(f"{str(slot).capitalize()}: {item.name}")
         else:
-            print(f"{slot.capitalize()}: None")
+            print(f"{str(slot).capitalize()}: None")
 
@@ -0,0 +1,227 @@
+# this file contains the item catalog, the indexed view of the item templates
+# The templates group armors by category, so finding an armor by name used to
+# scan every category, and nothing else could be asked of them without a full
+# scan. The catalog indexes every item by name, type and slot, and keeps the
+# items sorted by each numeric attribute, so a range query is two bisects and a
+# query such as "chest armor with weight <= 10 by defense" only touches the
+# matching items. Catalogs are built once per item templates and shared.
+import heapq
+import logging
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+from classes.enums import EquipmentSlot
+from classes.templateStore import get_templates
+
+if TYPE_CHECKING:
+    from classes.inventory import Item
+
+# Numeric attributes the items are sorted by
+ATTRIBUTES = ("weight", "defense", "attack", "power")
+# Catalogs kept for the most recently used item templates
+CATALOG_CACHE = 4
+
+
+class ItemCatalog:
+    """
+    Indexes of some item templates.
+    The templates must not be modified in place once catalogued, items added
+    in place are only picked up when a lookup misses them.
+    """
+    def __init__(self, templates: Mapping):
+        self.templates: Mapping = templates
+        self.build()
+
+    def build(self) -> None:
+        """(Re)build every index from the templates"""
+        # name -> (item type, armor slot or None, template), the first item of a name wins
+        self.entries: Dict[str, Tuple[str, Optional[EquipmentSlot], Mapping]] = {}
+        for item_type, group in self.templates.items():
+            if item_type == 'Armor':
+                for category, armors in group.items():
+                    slot = EquipmentSlot.parse(category)
+                    for name, template in armors.items():
+                        self.entries.setdefault(name, (item_type, slot, template))
+            else:
+                for name, template in group.items():
+                    self.entries.setdefault(name, (item_type, None, template))
+        self.size: int = count_items(self.templates)
+        # name -> position in the templates, the order of unsorted results
+        self.order: Dict[str, int] = {name: position for position, name in enumerate(self.entries)}
+
+        by_type: Dict[str, set] = {}
+        by_slot: Dict[EquipmentSlot, set] = {}
+        for name, (item_type, slot, _) in self.entries.items():
+            by_type.setdefault(item_type, set()).add(name)
+            if item_type == 'Weapon':
+                slot = EquipmentSlot.WEAPON
+            if slot is not None:
+                by_slot.setdefault(slot, set()).add(name)
+        self.by_type: Dict[str, FrozenSet[str]] = {item_type: frozenset(names) for item_type, names in by_type.items()}
+        self.by_slot: Dict[EquipmentSlot, FrozenSet[str]] = {slot: frozenset(names) for slot, names in by_slot.items()}
+
+        # attribute -> (sorted values, names in the same order), items without the attribute are left out
+        self.indexes: Dict[str, Tuple[List[float], List[str]]] = {}
+        # attribute -> name -> position in that index
+        self.ranks: Dict[str, Dict[str, int]] = {}
+        for attribute in ATTRIBUTES:
+            pairs = sorted(
+                (template[attribute], name) for name, (_, _, template) in self.entries.items()
+                if isinstance(template.get(attribute), (int, float)) and not isinstance(template.get(attribute), bool)
+            )
+            self.indexes[attribute] = ([value for value, _ in pairs], [name for _, name in pairs])
+            self.ranks[attribute] = {name: position for position, (_, name) in enumerate(pairs)}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def find(self, item_type: str, name: str) -> Tuple[Mapping, Optional[EquipmentSlot]]:
+        """
+        (template, armor slot or None) of an item of a type, KeyError if there is none.
+        """
+        if item_type != 'Armor':
+            return self.templates[item_type][name], None
+        entry = self.entries.get(name)
+        if (entry is None or entry[0] != 'Armor') and self.size != count_items(self.templates):
+            # Items were added in place since the catalog was built
+            self.build()
+            entry = self.entries.get(name)
+        if entry is None or entry[0] != 'Armor':
+            raise KeyError(name)
+        return entry[2], entry[1]
+
+    def item_type(self, name: str) -> Optional[str]:
+        entry = self.entries.get(name)
+        return entry[0] if entry else None
+
+    def positions(self, attribute: str, low: float = None, high: float = None) -> Tuple[int, int]:
+        """
+        (start, stop) of the items with low <= attribute <= high in the index of the attribute.
+        """
+        if attribute not in self.indexes:
+            raise ValueError(f"Items are not indexed by {attribute}")
+        values = self.indexes[attribute][0]
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_right(values, high)
+        return start, max(start, stop)
+
+    def range(self, attribute: str, low: float = None, high: float = None) -> List[str]:
+        """
+        Names of the items with low <= attribute <= high (either bound may be None), by increasing attribute.
+        """
+        start, stop = self.positions(attribute, low, high)
+        return self.indexes[attribute][1][start:stop]
+
+    def query(self, item_type: str = None, slot: Union[EquipmentSlot, str] = None, sort_by: str = None,
+              descending: bool = False, limit: int = None, **bounds: Tuple[Optional[float], Optional[float]]) -> List[str]:
+        """
+        Names of the items matching every filter, e.g.
+        query(slot="chest", weight=(None, 10), sort_by="defense", descending=True) for the chest armors
+        of weight 10 or less, best defense first.
+        Bounds are (low, high) of an attribute, inclusive, None for no bound.
+        Results are sorted by sort_by, items without that attribute are left out, and in template order otherwise.
+        """
+        if sort_by is not None and sort_by not in self.ranks:
+            raise ValueError(f"Items are not indexed by {sort_by}")
+        groups: List[FrozenSet[str]] = []
+        if item_type is not None:
+            groups.append(self.by_type.get(item_type, frozenset()))
+        if slot is not None:
+            groups.append(self.by_slot.get(EquipmentSlot.parse(slot), frozenset()))
+        # attribute -> (start, stop) of the matching items in its index
+        ranges = {attribute: self.positions(attribute, low, high) for attribute, (low, high) in bounds.items()}
+
+        if not groups and not ranges:
+            if sort_by is None:
+                names = list(self.entries)
+            else:
+                names = self.indexes[sort_by][1]
+                names = names[::-1] if descending else list(names)
+            return names if limit is None else names[:limit]
+
+        # Start from the smallest filter, the others are checked on its names only
+        sizes = [(len(group), position, None) for position, group in enumerate(groups)]
+        sizes += [(stop - start, len(groups), attribute) for attribute, (start, stop) in ranges.items()]
+        _, position, attribute = min(sizes)
+        if attribute is None:
+            candidates = set(groups.pop(position))
+        else:
+            candidates = self.range(attribute, *bounds[attribute])
+            del ranges[attribute]
+        for group in groups:
+            candidates = group.intersection(candidates)
+        for attribute, (start, stop) in ranges.items():
+            rank = self.ranks[attribute]
+            candidates = [name for name in candidates if start <= rank.get(name, -1) < stop]
+
+        if sort_by is None:
+            rank = self.order
+        else:
+            rank = self.ranks[sort_by]
+            candidates = [name for name in candidates if name in rank]
+        if limit is not None:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            return select(limit, candidates, key=rank.__getitem__)
+        return sorted(candidates, key=rank.__getitem__, reverse=descending)
+
+    def create(self, name: str) -> Optional['Item']:
+        """Item of a name, None if there is none"""
+        from classes.inventory import Item
+        entry = self.entries.get(name)
+        if entry is None:
+            logging.error(f"Item template not found with name {name}.")
+            return None
+        item_type, slot, template = entry
+        return Item.from_template(item_type, name, template, slot)
+
+    def create_many(self, names: List[str], shared: bool = False) -> List['Item']:
+        """
+        Items of many names, e.g. loot, each template is looked up once. Unknown names are logged and skipped.
+        With shared, every occurrence of a name is the same item: items carry no per-owner state.
+        """
+        from classes.inventory import Item
+        made: Dict[str, Optional[Item]] = {}
+        items = []
+        for name in names:
+            if shared and name in made:
+                item = made[name]
+            elif name in self.entries:
+                item_type, slot, template = self.entries[name]
+                item = made[name] = Item.from_template(item_type, name, template, slot)
+            else:
+                item = made[name] = self.create(name)
+            if item is not None:
+                items.append(item)
+        return items
+
+
+def count_items(templates: Mapping) -> int:
+    """Number of items of some item templates"""
+    return sum(
+        sum(len(armors) for armors in group.values()) if item_type == 'Armor' else len(group)
+        for item_type, group in templates.items()
+    )
+
+
+# (item templates, catalog) of the last item templates catalogued, most recent last
+_catalogs: List[Tuple[Mapping, ItemCatalog]] = []
+
+
+def item_catalog(templates: Mapping = None) -> ItemCatalog:
+    """
+    Catalog of some item templates (those of the template store by default), built on first use.
+    """
+    templates = get_templates("items") if templates is None else templates
+    for position, (catalogued, catalog) in enumerate(_catalogs):
+        if catalogued is templates:
+            if position != len(_catalogs) - 1:
+                _catalogs.append(_catalogs.pop(position))
+            return catalog
+    catalog = ItemCatalog(templates)
+    _catalogs.append((templates, catalog))
+    if len(_catalogs) > CATALOG_CACHE:
+        del _catalogs[0]
+    return catalog
@@ -0,0 +1,106 @@
+# this file contains the loadout optimizer that auto-equips heroes
+# Choosing one item or nothing for each of the head, chest, legs and weapon
+# slots, for the best total value under a weight budget, is a multiple-choice
+# knapsack. It is solved slot by slot, keeping only the loadouts that no
+# lighter loadout beats, which is exact for any item weights. Solutions are
+# memoized by the inventory signature, the (weight, value) options of each slot
+# and the budget, so heroes carrying the same kind of items after a loot wave
+# share a single solve.
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from classes.enums import ARMOR_SLOTS, EquipmentSlot
+from classes.inventory import Armor, Item, Weapon
+
+EQUIPMENT_SLOTS: Tuple[EquipmentSlot, ...] = (*ARMOR_SLOTS, EquipmentSlot.WEAPON)
+ATTACK_VALUE = 1.0  # value of a point of weapon attack
+DEFENSE_VALUE = 1.0  # value of a point of armor defense
+
+# (weight, value) options of each slot, sorted
+Signature = Tuple[Tuple[Tuple[float, float], ...], ...]
+
+
+def slot_of(item: Item) -> Optional[EquipmentSlot]:
+    """Slot an item is equipped in, None if it can not be equipped"""
+    if isinstance(item, Armor):
+        return item.category if item.category in ARMOR_SLOTS else None
+    return EquipmentSlot.WEAPON if isinstance(item, Weapon) else None
+
+
+def item_value(item: Item, attack_value: float = ATTACK_VALUE, defense_value: float = DEFENSE_VALUE) -> float:
+    return item.attack * attack_value if isinstance(item, Weapon) else item.defense * defense_value
+
+
+@lru_cache(maxsize=4096)
+def best_loadout(options: Signature, budget: Optional[float]) -> Tuple[float, Tuple[Optional[Tuple[float, float]], ...]]:
+    """
+    (value, chosen option or None for each slot) of the best loadout with a total weight of at most budget.
+    Among the loadouts of the best value the lightest is chosen.
+    """
+    # Loadouts of the slots so far that no lighter loadout matches, as (weight, value, choices), by weight
+    frontier: List[Tuple[float, float, tuple]] = [(0, 0, ())]
+    for slot_options in options:
+        loadouts = []
+        for weight, value, choices in frontier:
+            loadouts.append((weight, value, choices + (None,)))
+            for option in slot_options:
+                total = weight + option[0]
+                if budget is None or total <= budget:
+                    loadouts.append((total, value + option[1], choices + (option,)))
+        loadouts.sort(key=lambda loadout: (loadout[0], -loadout[1]))
+        frontier = []
+        for loadout in loadouts:
+            if not frontier or loadout[1] > frontier[-1][1]:
+                frontier.append(loadout)
+    _, value, choices = frontier[-1]
+    return value, choices
+
+
+def equipment_budget(hero) -> float:
+    """Weight the hero's equipment may take: what the items that can not be equipped leave of max_weight"""
+    inventory = hero.inventory
+    return inventory.max_weight - sum(item.weight for item in inventory.items if slot_of(item) is None)
+
+
+def optimize(hero, budget: float = None, attack_value: float = ATTACK_VALUE,
+             defense_value: float = DEFENSE_VALUE) -> Dict[EquipmentSlot, Optional[Item]]:
+    """
+    Best item, or None, for each equipment slot among the items the hero carries or wears.
+    The budget defaults to equipment_budget(hero).
+    """
+    budget = equipment_budget(hero) if budget is None else budget
+    equipped = hero.equipment_manager.equipped_items
+    # slot -> (weight, value) -> item, the equipped item first so that it is kept over an equal one
+    candidates: Dict[EquipmentSlot, Dict[Tuple[float, float], Item]] = {slot: {} for slot in EQUIPMENT_SLOTS}
+    for item in [*(item for item in equipped.values() if item is not None), *hero.inventory.items]:
+        slot = slot_of(item)
+        if slot is not None:
+            candidates[slot].setdefault((item.weight, item_value(item, attack_value, defense_value)), item)
+
+    signature = tuple(tuple(sorted(candidates[slot])) for slot in EQUIPMENT_SLOTS)
+    _, choices = best_loadout(signature, budget)
+    return {slot: None if choice is None else candidates[slot][choice] for slot, choice in zip(EQUIPMENT_SLOTS, choices)}
+
+
+def auto_equip(hero, budget: float = None, attack_value: float = ATTACK_VALUE, defense_value: float = DEFENSE_VALUE) -> int:
+    """
+    Equip the best loadout of a hero, see optimize. Only the slots that change are touched.
+    Returns the number of slots changed.
+    """
+    equipment_manager = hero.equipment_manager
+    changed = 0
+    for slot, item in optimize(hero, budget, attack_value, defense_value).items():
+        if equipment_manager.equipped_items.get(slot) is item:
+            continue
+        if item is None:
+            equipment_manager.unequip_item(slot)
+        else:
+            equipment_manager.equip_item(item)
+        changed += 1
+    return changed
+
+
+def auto_equip_all(heroes: Iterable, budget: float = None, attack_value: float = ATTACK_VALUE,
+                   defense_value: float = DEFENSE_VALUE) -> int:
+    """Auto-equip many heroes, e.g. after a loot wave. Returns the number of heroes whose loadout changed"""
+    return sum(1 for hero in heroes if auto_equip(hero, budget, attack_value, defense_value))
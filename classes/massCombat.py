@@ -0,0 +1,104 @@
+# this file contains the mass-battle combat manager
+# Large fights can not afford to scan every combatant after each action: live
+# counts per faction are kept up to date by the creatures' death hook, so the
+# victory check is O(1), and dead combatants are compacted out of the turn order
+# and the faction lists once they make up half of them, which is amortized O(1)
+# per death. Every faction fights every other one.
+import random
+from typing import Dict, List
+
+from classes.combatManager import CombatManager
+
+
+class MassCombatManager(CombatManager):
+    """
+    Batched combat between any number of factions, every combatant is played by the AI.
+    Each combatant attacks a random living enemy, which takes O(1) expected time.
+    """
+    def __init__(self, factions: Dict[str, list], max_rounds: int = None):
+        self.faction_names: List[str] = list(factions)
+        # Faction index -> its combatants, dead ones are compacted out lazily
+        self.members: List[list] = [list(creatures) for creatures in factions.values()]
+        # id(combatant) -> faction index
+        self.faction_of: Dict[int, int] = {
+            id(creature): faction for faction, creatures in enumerate(self.members) for creature in creatures
+        }
+        self.alive: List[int] = [sum(creature.is_alive for creature in creatures) for creatures in self.members]
+        self.factions_alive: int = sum(count > 0 for count in self.alive)
+        combatants = [creature for creatures in self.members for creature in creatures]
+        super().__init__(
+            [creature for creature in combatants if creature.is_hero],
+            [creature for creature in combatants if not creature.is_hero],
+            auto_heroes=True, max_rounds=max_rounds, batched=True
+        )
+        self.dead_in_turn_order: int = sum(not creature.is_alive for creature in self.turn_order)
+        for creature in combatants:
+            creature.on_death = self.died
+
+    @classmethod
+    def from_sides(cls, heroes: list, monsters: list, max_rounds: int = None) -> 'MassCombatManager':
+        return cls({"heroes": heroes, "monsters": monsters}, max_rounds)
+
+    def died(self, creature) -> None:
+        """Death hook of the combatants"""
+        faction = self.faction_of[id(creature)]
+        self.alive[faction] -= 1
+        if self.alive[faction] == 0:
+            self.factions_alive -= 1
+        self.dead_in_turn_order += 1
+
+    def is_combat_over(self):
+        return self.factions_alive <= 1
+
+    def winner(self):
+        """Name of the last faction standing, None if there is none or several"""
+        if self.factions_alive != 1:
+            return None
+        return next(name for name, count in zip(self.faction_names, self.alive) if count)
+
+    def living(self, faction: int) -> list:
+        """Combatants of a faction, at most half of them dead"""
+        members = self.members[faction]
+        if 2 * self.alive[faction] < len(members):
+            members = self.members[faction] = [creature for creature in members if creature.is_alive]
+        return members
+
+    def pick_target(self, combatant):
+        """Random living enemy of combatant, None if there is none"""
+        own = self.faction_of[id(combatant)]
+        enemies = [faction for faction, count in enumerate(self.alive) if count and faction != own]
+        if not enemies:
+            return None
+        members = self.living(random.choice(enemies))
+        # At least half of the members are alive, two draws are expected
+        while True:
+            target = members[random.randrange(len(members))]
+            if target.is_alive:
+                return target
+
+    def retarget(self, combatant):
+        return self.pick_target(combatant)
+
+    def queue_round(self):
+        """Queue the action of every living combatant, in turn order"""
+        for combatant in self.get_next_turn():
+            target = self.pick_target(combatant)
+            if target is not None:
+                self.action_queue.push(*self.auto_select(combatant, None, target))
+
+    def end_round(self):
+        if 2 * self.dead_in_turn_order > len(self.turn_order):
+            self.turn_order = [creature for creature in self.turn_order if creature.is_alive]
+            self.dead_in_turn_order = 0
+        super().end_round()
+
+    def release(self):
+        """Remove the death hooks, so that the combatants do not keep the manager alive"""
+        for creature in self.action_queue.combatants:
+            creature.on_death = None
+
+    def start_combat(self):
+        try:
+            return super().start_combat()
+        finally:
+            self.release()
@@ -0,0 +1,200 @@
+# this file contains the per-subsystem memory accounting and the leak tracker
+# Every block traced by tracemalloc is charged to the subsystem of the innermost
+# frame of its traceback that lies in one of the subsystem's modules, so memory
+# allocated by the json decoder while loading templates counts as templates.
+# Object counts come from the garbage collector. The leak tracker keeps weak
+# references to the objects of finished encounters and reports the survivors.
+import gc
+import os
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from classes.creature import Creature
+from classes.effects import Effect, EffectManager
+from classes.inventory import EquipmentManager, Inventory
+from classes.templateStore import TemplateSnapshot
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subsystem -> modules whose allocations it is charged with
+SUBSYSTEM_MODULES: Dict[str, Tuple[str, ...]] = {
+    "creatures": ("creature.py", "spawner.py", "resources.py"),
+    "effects": ("effects.py",),
+    "inventories": ("inventory.py",),
+    "templates": ("templateStore.py", "templateCompiler.py", "sharedTemplates.py")
+}
+
+# Subsystem -> classes whose live instances it counts
+SUBSYSTEM_TYPES: Dict[str, Tuple[type, ...]] = {
+    "creatures": (Creature,),
+    "effects": (Effect, EffectManager),
+    "inventories": (Inventory, EquipmentManager),
+    "templates": (TemplateSnapshot,)
+}
+
+OTHER = "other"
+
+
+class Usage(NamedTuple):
+    bytes: int  # traced bytes still allocated
+    blocks: int  # traced memory blocks still allocated
+    objects: int  # live instances of the subsystem's classes
+
+
+class MemoryAccountant:
+    """
+    Reports memory per subsystem. Tracing starts with start() (or the with statement),
+    only memory allocated while tracing is accounted for.
+    frames is the traceback depth kept by tracemalloc: deeper is more accurate, and slower.
+    """
+    def __init__(self, frames: int = 25, modules: Dict[str, Tuple[str, ...]] = None, types: Dict[str, Tuple[type, ...]] = None):
+        self.frames: int = frames
+        modules = SUBSYSTEM_MODULES if modules is None else modules
+        self.types: Dict[str, Tuple[type, ...]] = SUBSYSTEM_TYPES if types is None else types
+        # Absolute file name -> subsystem
+        self.files: Dict[str, str] = {
+            os.path.join(PACKAGE_DIR, module): subsystem
+            for subsystem, module_names in modules.items() for module in module_names
+        }
+        self.started: bool = False
+
+    def start(self) -> 'MemoryAccountant':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started = True
+        return self
+
+    def stop(self) -> None:
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def __enter__(self) -> 'MemoryAccountant':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def subsystem(self, traceback: tracemalloc.Traceback) -> str:
+        # Frames are ordered from the oldest to the most recent
+        for frame in reversed(traceback):
+            subsystem = self.files.get(frame.filename)
+            if subsystem is not None:
+                return subsystem
+        return OTHER
+
+    def memory(self) -> Dict[str, Tuple[int, int]]:
+        """
+        (bytes, blocks) allocated per subsystem.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ])
+        memory = {subsystem: [0, 0] for subsystem in self.types}
+        memory[OTHER] = [0, 0]
+        for statistic in snapshot.statistics('traceback'):
+            totals = memory.setdefault(self.subsystem(statistic.traceback), [0, 0])
+            totals[0] += statistic.size
+            totals[1] += statistic.count
+        return {subsystem: (size, count) for subsystem, (size, count) in memory.items()}
+
+    def objects(self) -> Dict[str, int]:
+        """
+        Live instances per subsystem, subclasses included.
+        """
+        counts = Counter(map(type, gc.get_objects()))
+        return {
+            subsystem: sum(count for cls, count in counts.items() if issubclass(cls, types))
+            for subsystem, types in self.types.items()
+        }
+
+    def report(self) -> Dict[str, Usage]:
+        """
+        Usage of every subsystem, plus OTHER for the memory of the rest of the process.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory is not traced, call start() first")
+        objects = self.objects()
+        return {
+            subsystem: Usage(size, blocks, objects.get(subsystem, 0))
+            for subsystem, (size, blocks) in self.memory().items()
+        }
+
+
+def format_report(report: Dict[str, Usage]) -> str:
+    lines = [f"{'subsystem':<12} {'KiB':>10} {'blocks':>9} {'objects':>9}"]
+    for subsystem, usage in sorted(report.items(), key=lambda item: -item[1].bytes):
+        lines.append(f"{subsystem:<12} {usage.bytes / 1024:>10.1f} {usage.blocks:>9} {usage.objects:>9}")
+    return "\n".join(lines)
+
+
+class Leak(NamedTuple):
+    encounter: str
+    kind: str  # class name of the object
+    name: str  # name of the object when it has one
+
+
+def encounter_objects(combat_manager) -> Iterable:
+    """
+    Objects that belong to an encounter and should be freed with it.
+    Items are not included: spawned creatures share them with their prototype.
+    """
+    yield combat_manager
+    for combatant in combat_manager.turn_order:
+        yield combatant
+        effect_manager = getattr(combatant, 'effect_manager', None)
+        if effect_manager is not None:
+            yield effect_manager
+            yield from effect_manager.active_effects
+        for attribute in ('inventory', 'equipment_manager'):
+            value = getattr(combatant, attribute, None)
+            if value is not None:
+                yield value
+
+
+class LeakTracker:
+    """
+    Flags objects that stay alive after the end of their encounter.
+    """
+    def __init__(self):
+        # (encounter, weak reference, class name, name)
+        self.tracked: List[Tuple[str, weakref.ref, str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.tracked)
+
+    def track(self, encounter: str, objects: Iterable) -> None:
+        """
+        Watch objects that should be freed now that encounter is over.
+        """
+        for obj in objects:
+            try:
+                reference = weakref.ref(obj)
+            except TypeError:
+                continue
+            self.tracked.append((encounter, reference, type(obj).__name__, str(getattr(obj, 'name', ''))))
+
+    def track_encounter(self, encounter: str, combat_manager) -> None:
+        """
+        Watch the combat manager of a finished encounter, its combatants and their effects and inventories.
+        """
+        self.track(encounter, encounter_objects(combat_manager))
+
+    def leaks(self, collect: bool = True) -> List[Leak]:
+        """
+        Tracked objects still alive, freed ones are forgotten.
+        collect runs the garbage collector first, so that objects only kept by reference cycles are not reported.
+        """
+        if collect:
+            gc.collect()
+        self.tracked = [entry for entry in self.tracked if entry[1]() is not None]
+        return [Leak(encounter, kind, name) for encounter, _, kind, name in self.tracked]
+
+    def summary(self, collect: bool = True) -> Dict[str, int]:
+        """
+        Number of leaked objects per class.
+        """
+        return dict(Counter(leak.kind for leak in self.leaks(collect)))
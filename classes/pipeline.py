@@ -0,0 +1,295 @@
+# this file contains the streaming results pipeline for batch simulations
+# encounter spec -> simulated CombatManager run -> summary record -> sink
+# Every stage is a generator, so a sweep of any size only ever holds one
+# batch of records in memory.
+import csv
+import itertools
+import json
+import marshal
+import os
+import queue
+import random
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from classes.combatManager import CombatManager
+from classes.spawner import Spawner
+
+# Fields of a summary record, in order
+RECORD_FIELDS = [
+    "encounter_id",
+    "seed",
+    "party",
+    "monster_types",
+    "loadout",
+    "winner",
+    "win",
+    "rounds",
+    "heroes_alive",
+    "monsters_alive",
+    "hero_hp_left",
+    "damage_taken",
+    "damage_dealt"
+]
+
+BINARY_MAGIC = b'DNDR'
+FRAME_HEADER = struct.Struct('<I')
+
+
+class EncounterSpec:
+    """
+    Description of one encounter to simulate
+    """
+    def __init__(self, encounter_id: int, heroes: List[str], monsters: List[str], seed: int = None):
+        self.encounter_id: int = encounter_id
+        self.heroes: List[str] = heroes  # hero classes
+        self.monsters: List[str] = monsters  # monster types
+        self.seed: int = encounter_id if seed is None else seed
+
+
+def sweep(parties: List[List[str]], monster_groups: List[List[str]], repeats: int = 1, first_id: int = 0) -> Iterator[EncounterSpec]:
+    """
+    Every party against every monster group, repeats times each.
+    """
+    encounter_id = first_id
+    for _ in range(repeats):
+        for party, monsters in itertools.product(parties, monster_groups):
+            yield EncounterSpec(encounter_id, party, monsters)
+            encounter_id += 1
+
+
+def run_encounter(spec: EncounterSpec, spawner: Spawner, max_rounds: int = 100) -> CombatManager:
+    """
+    Spawn and fight an encounter, returns the finished CombatManager.
+    The spec's seed makes the fight reproducible. The fight draws from the module random
+    generator, whose state is restored afterwards so that other code sees no reseed.
+    """
+    state = random.getstate()
+    random.seed(spec.seed)
+    try:
+        heroes = [hero for hero_class in spec.heroes for hero in spawner.spawn_heroes(hero_class)]
+        monsters = [monster for monster_type in spec.monsters for monster in spawner.spawn_monsters(monster_type)]
+        combat_manager = CombatManager(heroes, monsters, auto_heroes=True, max_rounds=max_rounds)
+        combat_manager.start_combat()
+    finally:
+        random.setstate(state)
+    return combat_manager
+
+
+def summarize(spec: EncounterSpec, combat_manager: CombatManager) -> Dict:
+    """
+    Summary record of a finished fight.
+    """
+    heroes, monsters = combat_manager.heroes, combat_manager.monsters
+    winner = combat_manager.winner()
+    return {
+        "encounter_id": spec.encounter_id,
+        "seed": spec.seed,
+        "party": "+".join(sorted(spec.heroes)),
+        "monster_types": "+".join(sorted(spec.monsters)),
+        "loadout": "+".join(sorted({ability.name for hero in heroes for ability in hero.abilities})),
+        "winner": winner or "none",
+        "win": int(winner == 'heroes'),
+        "rounds": combat_manager.round,
+        "heroes_alive": sum(hero.is_alive for hero in heroes),
+        "monsters_alive": sum(monster.is_alive for monster in monsters),
+        "hero_hp_left": sum(hero.hp for hero in heroes),
+        "damage_taken": sum(hero.max_hp - hero.hp for hero in heroes),
+        "damage_dealt": sum(monster.max_hp - monster.hp for monster in monsters)
+    }
+
+
+def simulate(specs: Iterable[EncounterSpec], spawner: Spawner = None, max_rounds: int = 100) -> Iterator[Dict]:
+    """
+    Lazily simulate encounters, yielding one summary record per fight.
+    """
+    spawner = spawner or Spawner.from_store()
+    for spec in specs:
+        yield summarize(spec, run_encounter(spec, spawner, max_rounds))
+
+
+def batched(records: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """
+    Group records into lists of at most batch_size.
+    """
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class Sink:
+    """
+    Base class for record sinks, records are written batch by batch
+    """
+    def write_batch(self, records: List[Dict]) -> None:
+        raise NotImplementedError("Each sink must implement write_batch")
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class JsonlSink(Sink):
+    """
+    Writes one JSON object per line
+    """
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_batch(self, records: List[Dict]) -> None:
+        self.file.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CsvSink(Sink):
+    """
+    Writes records as CSV rows with a header line
+    """
+    def __init__(self, path: str, fields: List[str] = None):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields or RECORD_FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write_batch(self, records: List[Dict]) -> None:
+        self.writer.writerows(records)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class BinarySink(Sink):
+    """
+    Writes records into chunk files of at most chunk_records records.
+    Each chunk starts with the magic and the field names, followed by one
+    length-prefixed marshal frame of value tuples per batch.
+    """
+    def __init__(self, directory: str, chunk_records: int = 1_000_000, fields: List[str] = None):
+        self.directory: str = directory
+        self.chunk_records: int = chunk_records
+        self.fields: List[str] = fields or RECORD_FIELDS
+        self.chunk_index: int = 0
+        self.chunk_count: int = 0
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def open_chunk(self) -> None:
+        if self.file:
+            self.file.close()
+        self.file = open(os.path.join(self.directory, f"results-{self.chunk_index:05d}.bin"), 'wb')
+        self.chunk_index += 1
+        self.chunk_count = 0
+        self.file.write(BINARY_MAGIC)
+        self.write_frame(self.fields)
+
+    def write_frame(self, value) -> None:
+        payload = marshal.dumps(value)
+        self.file.write(FRAME_HEADER.pack(len(payload)))
+        self.file.write(payload)
+
+    def write_batch(self, records: List[Dict]) -> None:
+        start = 0
+        while start < len(records):
+            if self.file is None or self.chunk_count >= self.chunk_records:
+                self.open_chunk()
+            part = records[start:start + self.chunk_records - self.chunk_count]
+            self.write_frame([tuple(record[field] for field in self.fields) for record in part])
+            self.chunk_count += len(part)
+            start += len(part)
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_binary(directory: str) -> Iterator[Dict]:
+    """
+    Stream the records written by a BinarySink back, chunk by chunk.
+    """
+    for file_name in sorted(os.listdir(directory)):
+        if not (file_name.startswith("results-") and file_name.endswith(".bin")):
+            continue
+        with open(os.path.join(directory, file_name), 'rb') as file:
+            if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError(f"{file_name} is not a results chunk")
+            fields = None
+            while True:
+                header = file.read(FRAME_HEADER.size)
+                if not header:
+                    break
+                frame = marshal.loads(file.read(FRAME_HEADER.unpack(header)[0]))
+                if fields is None:
+                    fields = frame
+                    continue
+                for values in frame:
+                    yield dict(zip(fields, values))
+
+
+class ThreadedWriter:
+    """
+    Writes batches to a sink from a background thread.
+    The queue between the producer and the writer is bounded: when the sink
+    falls behind, put() blocks and the simulation waits (backpressure).
+    """
+    _DONE = object()
+
+    def __init__(self, sink: Sink, max_pending_batches: int = 4):
+        self.sink: Sink = sink
+        self.queue: queue.Queue = queue.Queue(maxsize=max_pending_batches)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            batch = self.queue.get()
+            if batch is self._DONE:
+                return
+            if self.error is None:
+                try:
+                    self.sink.write_batch(batch)
+                except BaseException as e:
+                    self.error = e
+
+    def put(self, batch: List[Dict]) -> None:
+        if self.error:
+            raise self.error
+        self.queue.put(batch)
+
+    def close(self) -> None:
+        self.queue.put(self._DONE)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def stream(records: Iterable[Dict], sink: Sink, batch_size: int = 1000, max_pending_batches: int = 0) -> int:
+    """
+    Pull records and write them to the sink in batches of batch_size.
+    With max_pending_batches > 0 writes happen on a background thread with at
+    most that many batches waiting. Returns the number of records written.
+    """
+    count = 0
+    writer = ThreadedWriter(sink, max_pending_batches) if max_pending_batches > 0 else None
+    try:
+        for batch in batched(records, batch_size):
+            if writer:
+                writer.put(batch)
+            else:
+                sink.write_batch(batch)
+            count += len(batch)
+    finally:
+        if writer:
+            writer.close()
+    return count
@@ -0,0 +1,239 @@
+# this file contains the level curves, the XP awards and the campaign simulator
+# Level curves and per-level stat growth come from the progression templates.
+# Each curve is turned once into a table of XP thresholds, so the level of an
+# XP total is one bisect, and each growth into a table of stat bonuses per
+# level, so a hero gaining several levels at once is updated in one step.
+# XP is awarded in one batch at the end of an encounter. The campaign simulator
+# only fights each (hero class, level, encounter) once per sample and reuses the
+# outcomes for every hero that reaches that point, so thousands of heroes cost
+# little more than one.
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+from classes.combatManager import CombatManager
+from classes.creature import Monster
+from classes.spawner import Spawner
+from classes.templateCompiler import GROWTH_STATS
+from classes.templateStore import get_templates
+
+
+class LevelCurve:
+    """
+    XP needed for each level: reaching level L takes base * (L - 1) ** exponent XP in total.
+    """
+    def __init__(self, base: float, exponent: float, max_level: int):
+        self.max_level: int = max_level
+        # thresholds[L - 1] is the XP total needed for level L
+        self.thresholds: Tuple[int, ...] = tuple(round(base * (level - 1) ** exponent) for level in range(1, max_level + 1))
+
+    def level(self, xp: int) -> int:
+        """Level reached with an XP total"""
+        return bisect_right(self.thresholds, xp) or 1
+
+    def xp_for(self, level: int) -> int:
+        """XP total needed to reach a level, capped at the last level"""
+        return self.thresholds[min(max(level, 1), self.max_level) - 1]
+
+    def xp_to_next(self, xp: int) -> int:
+        """XP still needed for the next level, 0 at the last level"""
+        level = self.level(xp)
+        return 0 if level >= self.max_level else self.thresholds[level] - xp
+
+
+class StatGrowth:
+    """
+    Stat bonuses of every level over level 1: per_level * (level - 1), rounded down.
+    """
+    def __init__(self, per_level: Tuple[Tuple[str, float], ...], max_level: int):
+        self.stats: Tuple[str, ...] = tuple(stat for stat, _ in per_level)
+        # bonuses[L - 1] is the bonus of each stat at level L
+        self.bonuses: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(int(growth * (level - 1)) for _, growth in per_level) for level in range(1, max_level + 1)
+        )
+
+    def bonus(self, level: int) -> Tuple[int, ...]:
+        return self.bonuses[min(max(level, 1), len(self.bonuses)) - 1]
+
+
+@lru_cache(maxsize=None)
+def level_curve(base: float, exponent: float, max_level: int) -> LevelCurve:
+    """Shared curve of some parameters, built on first use"""
+    return LevelCurve(base, exponent, max_level)
+
+
+@lru_cache(maxsize=None)
+def stat_growth(per_level: Tuple[Tuple[str, float], ...], max_level: int) -> StatGrowth:
+    """Shared growth table of some parameters, built on first use"""
+    return StatGrowth(per_level, max_level)
+
+
+def progression_of(hero_class: str, templates: dict = None) -> Tuple[LevelCurve, StatGrowth]:
+    """
+    (curve, growth) of a hero class, from the progression templates.
+    Classes without a progression never level up.
+    """
+    templates = get_templates("progression") if templates is None else templates
+    entry = templates.get("classes", {}).get(hero_class)
+    if entry is None:
+        logging.warning(f"No progression for hero class {hero_class}")
+        return level_curve(0, 1, 1), stat_growth((), 1)
+    spec = templates["curves"][entry["curve"]]
+    max_level = spec["max_level"]
+    per_level = tuple(sorted((stat, growth) for stat, growth in entry.get("growth", {}).items() if stat in GROWTH_STATS))
+    return level_curve(spec["base"], spec["exponent"], max_level), stat_growth(per_level, max_level)
+
+
+def set_level(hero, level: int, growth: StatGrowth) -> None:
+    """
+    Move a hero to a level, applying the stat changes of every level in between at once.
+    hp goes up (or down) with max_hp.
+    """
+    before, after = growth.bonus(hero.level), growth.bonus(level)
+    for stat, old, new in zip(growth.stats, before, after):
+        if new != old:
+            setattr(hero, stat, getattr(hero, stat) + new - old)
+            if stat == "max_hp":
+                hero.hp = max(hero.hp + new - old, 1 if hero.is_alive else 0)
+    hero.level = level
+
+
+def award_xp(heroes: Sequence, monsters: Sequence, templates: dict = None) -> Dict[int, int]:
+    """
+    Split the XP of the defeated monsters between the living heroes and level them up,
+    once at the end of an encounter. Returns hero uid -> levels gained.
+    """
+    winners = [hero for hero in heroes if hero.is_alive]
+    xp = sum(monster.xp for monster in monsters if not monster.is_alive)
+    if not winners or not xp:
+        return {}
+    share = xp // len(winners)
+    gained = {}
+    for hero in winners:
+        curve, growth = progression_of(hero.hero_class, templates)
+        hero.exp += share
+        level = min(curve.level(hero.exp), curve.max_level)
+        if level > hero.level:
+            gained[hero.uid] = level - hero.level
+            set_level(hero, level, growth)
+    return gained
+
+
+class CampaignSimulator:
+    """
+    Runs heroes, alone, through a sequence of encounters (lists of monster types), repeated as needed.
+    A hero starts each encounter rested, gains the encounter's XP if it wins and moves on either way.
+    The outcome of each (hero class, level, encounter) is played samples times with the real combat
+    rules and cached, each hero then draws one of the cached outcomes.
+    """
+    def __init__(self, encounters: List[List[str]], samples: int = 50, max_rounds: int = 100,
+                 spawner: Spawner = None, templates: dict = None, seed: int = None):
+        self.encounters: List[List[str]] = encounters
+        self.samples: int = samples
+        self.max_rounds: int = max_rounds
+        self.spawner: Spawner = spawner or Spawner.from_store()
+        self.templates: dict = get_templates("progression") if templates is None else templates
+        self.random: random.Random = random.Random(seed)
+        monster_templates = self.spawner.templates[Monster]
+        # Encounter index -> XP of its monsters
+        self.encounter_xp: List[int] = [
+            sum(monster_templates.get(monster_type, {}).get("xp", 0) for monster_type in encounter)
+            for encounter in encounters
+        ]
+        # (hero class, level, encounter index) -> (wins, rounds) of each sample
+        self.outcomes: Dict[Tuple[str, int, int], Tuple[bytes, Tuple[int, ...]]] = {}
+        self.fights: int = 0  # fights actually played
+
+    def outcome(self, hero_class: str, level: int, encounter: int) -> Tuple[bytes, Tuple[int, ...]]:
+        """
+        Sampled (win flags, rounds) of a hero of a class and level against an encounter, played on first use.
+        """
+        key = (hero_class, level, encounter)
+        outcome = self.outcomes.get(key)
+        if outcome is None:
+            _, growth = progression_of(hero_class, self.templates)
+            wins, rounds = bytearray(), []
+            for _ in range(self.samples):
+                heroes = self.spawner.spawn_heroes(hero_class)
+                monsters = [monster for monster_type in self.encounters[encounter] for monster in self.spawner.spawn_monsters(monster_type)]
+                set_level(heroes[0], level, growth)
+                combat_manager = CombatManager(heroes, monsters, auto_heroes=True, max_rounds=self.max_rounds, batched=True)
+                wins.append(combat_manager.start_combat() == 'heroes')
+                rounds.append(combat_manager.round)
+            self.fights += self.samples
+            outcome = self.outcomes[key] = (bytes(wins), tuple(rounds))
+        return outcome
+
+    def run(self, party: Dict[str, int], length: int) -> Dict:
+        """
+        Play length encounters with party[hero_class] heroes of each class.
+        Returns the level distribution of each class after every encounter, and the wins and rounds played.
+        """
+        draw = self.random.randrange
+        samples = self.samples
+        report = {"length": length, "classes": {}}
+        for hero_class, count in party.items():
+            curve, _ = progression_of(hero_class, self.templates)
+            xp, levels = [0] * count, [1] * count
+            wins = rounds = 0
+            pacing = []
+            for step in range(length):
+                encounter = step % len(self.encounters)
+                reward = self.encounter_xp[encounter]
+                for hero in range(count):
+                    flags, lengths = self.outcome(hero_class, levels[hero], encounter)
+                    sample = draw(samples)
+                    rounds += lengths[sample]
+                    if flags[sample]:
+                        wins += 1
+                        xp[hero] += reward
+                        levels[hero] = min(curve.level(xp[hero]), curve.max_level)
+                pacing.append(dict(sorted(Counter(levels).items())))
+            report["classes"][hero_class] = {
+                "heroes": count,
+                "win_rate": wins / (count * length) if count and length else 0.0,
+                "mean_rounds": rounds / (count * length) if count and length else 0.0,
+                "mean_level": sum(levels) / count if count else 0.0,
+                "levels": pacing
+            }
+        report["fights_played"] = self.fights
+        return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate heroes leveling up through a campaign.")
+    parser.add_argument("--party", nargs="+", default=["Warior=1000", "Mage=1000"], help="hero_class=count pairs")
+    parser.add_argument("--encounters", nargs="+", default=["Goblin", "Goblin,Goblin", "Orc", "Shaman"],
+                        help="comma separated monster types of each encounter, repeated in order")
+    parser.add_argument("--length", type=int, default=100, help="encounters played by each hero")
+    parser.add_argument("--samples", type=int, default=50, help="fights played per hero class, level and encounter")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    party = {}
+    for entry in args.party:
+        hero_class, _, count = entry.partition("=")
+        party[hero_class] = int(count or 1)
+    encounters = [encounter.split(",") for encounter in args.encounters]
+
+    random.seed(args.seed)
+    start = time.perf_counter()
+    simulator = CampaignSimulator(encounters, args.samples, seed=args.seed)
+    report = simulator.run(party, args.length)
+    report["seconds"] = time.perf_counter() - start
+    for hero_class, result in report["classes"].items():
+        # Only print the pacing every tenth encounter
+        result["levels"] = {step + 1: levels for step, levels in enumerate(result["levels"]) if (step + 1) % 10 == 0}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# this file contains the array-backed resource pools
+# The current value, cap and regeneration per turn of every (creature, resource
+# type) pair live in three parallel arrays of a ResourcePool, so regenerating a
+# whole fight is one pass over contiguous columns. A creature sees its own slots
+# through Resources, a mapping of resource type -> current value.
+from array import array
+from collections.abc import MutableMapping
+from itertools import repeat
+from operator import add
+from typing import Dict, Iterator, List, Tuple, Union
+
+from classes.enums import CostType
+
+# Resource type -> (start, cap, regeneration per turn) of every creature
+DEFAULT_RESOURCES: Dict[CostType, Tuple[int, int, int]] = {
+    CostType.MANA: (100, 100, 0),
+    CostType.STAMINA: (100, 100, 0)
+}
+
+
+def resource_spec(template: Dict[str, Dict[str, int]] = None) -> Dict[CostType, Tuple[int, int, int]]:
+    """
+    (start, cap, regen) per resource type from the "resources" field of a creature template, e.g.
+    {"mana": {"max": 120, "regen": 5}, "rage": {"max": 100, "start": 0, "regen": -5}}.
+    Resource types the template does not mention keep their defaults, start defaults to max.
+    """
+    spec = dict(DEFAULT_RESOURCES)
+    for name, values in (template or {}).items():
+        resource_type = CostType.parse(name)
+        if resource_type is None:
+            continue
+        _, default_cap, default_regen = spec.get(resource_type, (0, 0, 0))
+        cap = values.get("max", default_cap)
+        spec[resource_type] = (values.get("start", cap), cap, values.get("regen", default_regen))
+    return spec
+
+
+class ResourcePool:
+    """
+    Parallel arrays of current values, caps and regeneration per turn.
+    Released slots are zeroed and reused by the next allocation. Paused slots, e.g.
+    of dead creatures, do not regenerate: their regeneration is kept aside.
+    """
+    def __init__(self):
+        self.current: array = array('i')
+        self.cap: array = array('i')
+        self.regen: array = array('i')
+        self.free: List[int] = []
+        self.regenerating: int = 0  # slots with a non-zero regeneration
+        self.draining: int = 0  # slots with a negative regeneration
+        # Paused slot -> its regeneration, the regen array holds 0 meanwhile
+        self.paused: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.current) - len(self.free)
+
+    def allocate(self, current: int, cap: int, regen: int = 0) -> int:
+        """
+        Reserve a slot, returns its index.
+        """
+        if current > cap:
+            current = cap
+        if current < 0:
+            current = 0
+        if regen:
+            self.regenerating += 1
+            self.draining += regen < 0
+        if self.free:
+            slot = self.free.pop()
+            self.current[slot], self.cap[slot], self.regen[slot] = current, cap, regen
+            return slot
+        self.current.append(current)
+        self.cap.append(cap)
+        self.regen.append(regen)
+        return len(self.current) - 1
+
+    def release(self, slot: int) -> None:
+        self.paused.pop(slot, None)
+        self.set_regen(slot, 0)
+        self.current[slot] = self.cap[slot] = 0
+        self.free.append(slot)
+
+    def set_regen(self, slot: int, regen: int) -> None:
+        if slot in self.paused:
+            self.paused[slot] = regen
+            return
+        self.store_regen(slot, regen)
+
+    def regen_of(self, slot: int) -> int:
+        """Regeneration per turn of a slot, paused or not"""
+        return self.paused.get(slot, self.regen[slot])
+
+    def pause(self, slot: int) -> None:
+        """Stop regenerating a slot until it is resumed"""
+        if slot not in self.paused:
+            self.paused[slot] = self.regen[slot]
+            self.store_regen(slot, 0)
+
+    def resume(self, slot: int) -> None:
+        regen = self.paused.pop(slot, None)
+        if regen is not None:
+            self.store_regen(slot, regen)
+
+    def store_regen(self, slot: int, regen: int) -> None:
+        previous = self.regen[slot]
+        self.regenerating += (regen != 0) - (previous != 0)
+        self.draining += (regen < 0) - (previous < 0)
+        self.regen[slot] = regen
+
+    def regenerate(self) -> None:
+        """
+        Add one turn of regeneration to every slot, kept between 0 and the cap.
+        """
+        if not self.regenerating:
+            return
+        regenerated = map(min, map(add, self.current, self.regen), self.cap)
+        if self.draining:
+            regenerated = map(max, regenerated, repeat(0))
+        self.current[:] = array('i', regenerated)
+
+
+# Pool of the creatures that are not in a fight
+POOL = ResourcePool()
+
+
+class Resources(MutableMapping):
+    """
+    A creature's resources: resource type -> current value, stored in a ResourcePool.
+    Values are kept between 0 and their cap, setting a resource type the creature does
+    not have adds it with the value as its cap. Names that are no resource type raise KeyError.
+    Resources of a dead creature are paused, they no longer regenerate.
+    """
+    __slots__ = ('pool', 'slots')
+
+    def __init__(self, spec: Dict[CostType, Tuple[int, int, int]] = None, pool: ResourcePool = None):
+        self.pool: ResourcePool = POOL if pool is None else pool
+        # Resource type -> slot in the pool
+        self.slots: Dict[CostType, int] = {
+            resource_type: self.pool.allocate(*values)
+            for resource_type, values in (DEFAULT_RESOURCES if spec is None else spec).items()
+        }
+
+    def key(self, resource_type: Union[CostType, str]) -> CostType:
+        """Resource type of a name or member, KeyError if it is not one"""
+        if isinstance(resource_type, CostType):
+            return resource_type
+        key = CostType.parse(resource_type) if isinstance(resource_type, (str, int)) else None
+        if key is None:
+            raise KeyError(resource_type)
+        return key
+
+    def __getitem__(self, resource_type: CostType) -> int:
+        return self.pool.current[self.slots[self.key(resource_type)]]
+
+    def get(self, resource_type: CostType, default=None):
+        slot = self.slots.get(resource_type)
+        if slot is None:
+            if not isinstance(resource_type, str):
+                return default
+            slot = self.slots.get(CostType.parse(resource_type))
+            if slot is None:
+                return default
+        return self.pool.current[slot]
+
+    def __setitem__(self, resource_type: CostType, value: int) -> None:
+        resource_type = self.key(resource_type)
+        slot = self.slots.get(resource_type)
+        if slot is None:
+            self.slots[resource_type] = self.pool.allocate(value, value)
+            return
+        self.pool.current[slot] = min(max(value, 0), self.pool.cap[slot])
+
+    def __delitem__(self, resource_type: CostType) -> None:
+        self.pool.release(self.slots.pop(self.key(resource_type)))
+
+    def __contains__(self, resource_type) -> bool:
+        try:
+            return self.key(resource_type) in self.slots
+        except (KeyError, ValueError):
+            return False
+
+    def __iter__(self) -> Iterator[CostType]:
+        return iter(self.slots)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __repr__(self) -> str:
+        return f"Resources({ {str(resource_type): value for resource_type, value in self.items()} })"
+
+    def __del__(self) -> None:
+        pool = getattr(self, 'pool', None)
+        if pool is not None:
+            for slot in self.slots.values():
+                pool.release(slot)
+
+    def spend(self, resource_type: CostType, amount: int) -> bool:
+        """
+        Remove amount from a resource if there is enough of it, returns False otherwise.
+        """
+        slot = self.slots.get(resource_type)
+        current = self.pool.current
+        if slot is None or current[slot] < amount:
+            return False
+        current[slot] -= amount
+        return True
+
+    def cap(self, resource_type: CostType) -> int:
+        return self.pool.cap[self.slots[self.key(resource_type)]]
+
+    def regen(self, resource_type: CostType) -> int:
+        return self.pool.regen_of(self.slots[self.key(resource_type)])
+
+    @property
+    def paused(self) -> bool:
+        return any(slot in self.pool.paused for slot in self.slots.values())
+
+    def pause(self) -> None:
+        """Stop regenerating every resource, e.g. when the creature dies"""
+        for slot in self.slots.values():
+            self.pool.pause(slot)
+
+    def resume(self) -> None:
+        for slot in self.slots.values():
+            self.pool.resume(slot)
+
+    def configure(self, resource_type: CostType, cap: int = None, regen: int = None) -> None:
+        """
+        Change the cap and/or regeneration per turn of a resource, adding it if needed.
+        """
+        resource_type = self.key(resource_type)
+        if resource_type not in self.slots:
+            self.slots[resource_type] = self.pool.allocate(cap or 0, cap or 0, regen or 0)
+            return
+        slot = self.slots[resource_type]
+        if cap is not None:
+            self.pool.cap[slot] = cap
+            self.pool.current[slot] = min(self.pool.current[slot], cap)
+        if regen is not None:
+            self.pool.set_regen(slot, regen)
+
+    def spec(self) -> Dict[CostType, Tuple[int, int, int]]:
+        """
+        (current, cap, regen) of every resource.
+        """
+        pool = self.pool
+        return {resource_type: (pool.current[slot], pool.cap[slot], pool.regen_of(slot)) for resource_type, slot in self.slots.items()}
+
+    def copy(self) -> 'Resources':
+        """
+        Independent resources with the same values, in the same pool.
+        """
+        clone = Resources.__new__(Resources)
+        clone.pool = self.pool
+        clone.slots = self.copy_slots(self.pool)
+        return clone
+
+    def copy_slots(self, pool: ResourcePool) -> Dict[CostType, int]:
+        """
+        Allocate a copy of every slot in pool, paused slots stay paused.
+        """
+        source = self.pool
+        current, cap, regen, allocate = source.current, source.cap, source.regen, pool.allocate
+        slots = {resource_type: allocate(current[slot], cap[slot], regen[slot]) for resource_type, slot in self.slots.items()}
+        if source.paused:
+            for resource_type, slot in self.slots.items():
+                if slot in source.paused:
+                    pool.paused[slots[resource_type]] = source.paused[slot]
+        return slots
+
+    def move_to(self, pool: ResourcePool) -> None:
+        """
+        Move the resources into another pool, e.g. the pool of a fight.
+        """
+        if pool is self.pool:
+            return
+        slots = self.copy_slots(pool)
+        release = self.pool.release
+        for slot in self.slots.values():
+            release(slot)
+        self.pool = pool
+        self.slots = slots
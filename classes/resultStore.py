@@ -0,0 +1,241 @@
+# this file contains the columnar store for simulated fight results
+# Each column is an append-only file of fixed-width values, strings are
+# dictionary encoded. Queries memory-map the column files and aggregate over
+# zero-copy views, so a store much larger than RAM can be sliced and grouped.
+import json
+import mmap
+import os
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, Iterable, List, Tuple
+
+from classes.pipeline import Sink
+
+# Column type used for dictionary encoded strings, stored as int32 codes
+STRING = 'str'
+CODE_TYPE = 'i'
+
+# Column name -> array typecode, or STRING
+RESULT_SCHEMA = {
+    "encounter_id": 'q',
+    "seed": 'q',
+    "party": STRING,
+    "monster_types": STRING,
+    "loadout": STRING,
+    "winner": STRING,
+    "win": 'b',
+    "rounds": 'i',
+    "heroes_alive": 'i',
+    "monsters_alive": 'i',
+    "hero_hp_left": 'i',
+    "damage_taken": 'i',
+    "damage_dealt": 'i'
+}
+
+
+class Aggregate:
+    """
+    Statistics of one group, computed from a value -> count histogram
+    """
+    def __init__(self, histogram: Dict[float, int]):
+        self.histogram: Dict[float, int] = histogram
+        self.count: int = sum(histogram.values())
+        self.sum: float = sum(value * count for value, count in histogram.items())
+        self.mean: float = self.sum / self.count if self.count else 0.0
+        self.min = min(histogram) if histogram else None
+        self.max = max(histogram) if histogram else None
+
+    def percentile(self, percent: float):
+        """
+        Smallest value such that percent % of the group is lower or equal to it.
+        """
+        if not self.count:
+            return None
+        rank = max(percent / 100 * self.count, 1)
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if seen >= rank:
+                return value
+        return self.max
+
+    def __repr__(self) -> str:
+        return f"Aggregate(count={self.count}, mean={self.mean:.4f}, min={self.min}, max={self.max})"
+
+
+class ResultStore:
+    """
+    Append-only columnar store backed by one file per column.
+    Appends are buffered and flushed every flush_rows rows; the committed row
+    count lives in meta.json and is only updated after the columns are written.
+    """
+    def __init__(self, directory: str, schema: Dict[str, str] = None, flush_rows: int = 65536):
+        self.directory: str = directory
+        self.flush_rows: int = flush_rows
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            self.schema: Dict[str, str] = meta["schema"]
+            self.rows: int = meta["rows"]
+        else:
+            self.schema = dict(schema or RESULT_SCHEMA)
+            self.rows = 0
+            self.write_meta()
+
+        # String column -> list of values, the code is the position
+        self.dictionaries: Dict[str, List[str]] = {}
+        self.codes: Dict[str, Dict[str, int]] = {}
+        for column, column_type in self.schema.items():
+            if column_type == STRING:
+                path = self.path(column, ".dict")
+                values = []
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as file:
+                        values = json.load(file)
+                self.dictionaries[column] = values
+                self.codes[column] = {value: code for code, value in enumerate(values)}
+        self.buffers: Dict[str, array] = self.new_buffers()
+        self.buffered: int = 0
+
+    def path(self, column: str, suffix: str = ".col") -> str:
+        return os.path.join(self.directory, column + suffix)
+
+    def typecode(self, column: str) -> str:
+        column_type = self.schema[column]
+        return CODE_TYPE if column_type == STRING else column_type
+
+    def new_buffers(self) -> Dict[str, array]:
+        return {column: array(self.typecode(column)) for column in self.schema}
+
+    def write_meta(self) -> None:
+        tmp_path = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({"schema": self.schema, "rows": self.rows}, file)
+        os.replace(tmp_path, os.path.join(self.directory, "meta.json"))
+
+    def append(self, records: Iterable[Dict]) -> None:
+        """
+        Append records, missing numeric fields are stored as 0.
+        """
+        columns = [
+            (column, self.buffers[column].append, self.codes.get(column), self.dictionaries.get(column))
+            for column in self.schema
+        ]
+        for record in records:
+            get = record.get
+            for column, append, codes, dictionary in columns:
+                value = get(column)
+                if codes is None:
+                    append(value or 0)
+                    continue
+                value = "" if value is None else str(value)
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(dictionary)
+                    dictionary.append(value)
+                append(code)
+            self.buffered += 1
+            if self.buffered >= self.flush_rows:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows and commit them.
+        """
+        if not self.buffered:
+            return
+        for column, buffer in self.buffers.items():
+            # Drop anything left past the committed rows by an interrupted flush
+            with open(self.path(column), 'ab') as file:
+                file.truncate(self.rows * buffer.itemsize)
+                buffer.tofile(file)
+        for column, values in self.dictionaries.items():
+            tmp_path = self.path(column, ".dict.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(values, file)
+            os.replace(tmp_path, self.path(column, ".dict"))
+        self.rows += self.buffered
+        self.write_meta()
+        # Cleared in place, append() holds on to the buffers
+        for buffer in self.buffers.values():
+            del buffer[:]
+        self.buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def column(self, column: str) -> memoryview:
+        """
+        Zero-copy view of a column's committed values (codes for string columns).
+        """
+        typecode = self.typecode(column)
+        itemsize = array(typecode).itemsize
+        if not self.rows:
+            return memoryview(array(typecode))
+        with open(self.path(column), 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[:self.rows * itemsize].cast(typecode)
+
+    def decode(self, column: str, code: int) -> str:
+        return self.dictionaries[column][code]
+
+    def selector(self, where: Dict[str, object], start: int, stop: int):
+        """
+        Iterator of booleans selecting the rows of [start, stop) matching every equality in where.
+        """
+        selector = None
+        for column, value in where.items():
+            if self.schema[column] == STRING:
+                if value not in self.codes[column]:
+                    return iter(())
+                value = self.codes[column][value]
+            matches = map(value.__eq__, self.column(column)[start:stop])
+            selector = matches if selector is None else map(bool.__and__, selector, matches)
+        return selector
+
+    def group_by(self, keys: List[str], value: str, where: Dict[str, object] = None, chunk_rows: int = 1 << 22) -> Dict[Tuple, Aggregate]:
+        """
+        Aggregate a column per group of key columns, e.g.
+        group_by(["party"], "win") gives the win rate of each party as the mean.
+        Rows are scanned chunk by chunk, counting (keys, value) pairs, so memory
+        only grows with the number of distinct pairs.
+        """
+        counts = Counter()
+        key_views = [self.column(key) for key in keys]
+        value_view = self.column(value)
+        for start in range(0, self.rows, chunk_rows):
+            stop = min(start + chunk_rows, self.rows)
+            rows = zip(*(view[start:stop] for view in key_views), value_view[start:stop])
+            if where:
+                rows = compress(rows, self.selector(where, start, stop))
+            counts.update(rows)
+
+        histograms: Dict[Tuple, Dict] = {}
+        for row, count in counts.items():
+            histograms.setdefault(row[:-1], {})[row[-1]] = count
+        decoded = {}
+        for group, histogram in histograms.items():
+            group = tuple(
+                self.decode(key, code) if self.schema[key] == STRING else code
+                for key, code in zip(keys, group)
+            )
+            decoded[group] = Aggregate(histogram)
+        return decoded
+
+
+class ColumnarSink(Sink):
+    """
+    Pipeline sink appending records to a ResultStore
+    """
+    def __init__(self, directory: str, schema: Dict[str, str] = None):
+        self.store: ResultStore = ResultStore(directory, schema)
+
+    def write_batch(self, records: List[Dict]) -> None:
+        self.store.append(records)
+
+    def close(self) -> None:
+        self.store.flush()
@@ -0,0 +1,193 @@
+# this file contains the shared-memory templates and the sharded simulation runner
+# The templates are published once into a shared memory block: a header, an
+# index of (offset, length) per entry and one marshal blob per entry. Workers
+# attach to the block and only decode the entries they use, so adding workers
+# barely adds memory. Encounters are sharded across workers by a stable key.
+import marshal
+import struct
+import zlib
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from classes import templateStore
+from classes.pipeline import EncounterSpec, simulate
+from classes.spawner import Spawner
+from classes.templateStore import TEMPLATE_FILES, get_templates
+
+SHARED_MAGIC = b'DNDS'
+SHARED_VERSION = 1
+# magic, version, marshal version, index length
+SHARED_HEADER = struct.Struct('<4sHHI')
+
+
+class SharedKind(Mapping):
+    """
+    Read-only mapping of one template kind, entries are decoded from shared memory on first access
+    """
+    def __init__(self, buffer: memoryview, entries: Dict[str, Tuple[int, int]]):
+        self.buffer: memoryview = buffer  # data section of the block
+        self.entries: Dict[str, Tuple[int, int]] = entries  # name -> (offset in the data section, length)
+        self.decoded: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        value = self.decoded.get(name)
+        if value is None:
+            offset, length = self.entries[name]
+            value = self.decoded[name] = marshal.loads(self.buffer[offset:offset + length])
+        return value
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SharedTemplates:
+    """
+    Templates stored in a shared memory block.
+    The process that publishes the block owns it and must unlink it once the workers are done.
+    """
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool = False):
+        self.memory: shared_memory.SharedMemory = memory
+        self.owner: bool = owner
+        self.buffer: memoryview = memory.buf.toreadonly()
+        magic, version, marshal_version, index_length = SHARED_HEADER.unpack_from(self.buffer)
+        if magic != SHARED_MAGIC or version != SHARED_VERSION or marshal_version != marshal.version:
+            self.close()
+            raise ValueError(f"Shared memory {memory.name} does not hold compatible templates")
+        data_start = SHARED_HEADER.size + index_length
+        index = marshal.loads(self.buffer[SHARED_HEADER.size:data_start])
+        self.data: memoryview = self.buffer[data_start:]
+        self.kinds: Dict[str, SharedKind] = {kind: SharedKind(self.data, entries) for kind, entries in index.items()}
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @classmethod
+    def publish(cls, templates: Dict[str, dict] = None, name: str = None) -> 'SharedTemplates':
+        """
+        Copy templates (every kind of the template store by default) into a new shared memory block.
+        """
+        if templates is None:
+            templates = {kind: get_templates(kind) for kind in TEMPLATE_FILES}
+        blobs, index, offset = [], {}, 0
+        for kind, entries in templates.items():
+            index[kind] = {}
+            for entry_name, entry in entries.items():
+                blob = marshal.dumps(entry)
+                index[kind][entry_name] = (offset, len(blob))
+                blobs.append(blob)
+                offset += len(blob)
+        index_blob = marshal.dumps(index)
+        start = SHARED_HEADER.size + len(index_blob)
+
+        memory = shared_memory.SharedMemory(name=name, create=True, size=max(start + offset, 1))
+        SHARED_HEADER.pack_into(memory.buf, 0, SHARED_MAGIC, SHARED_VERSION, marshal.version, len(index_blob))
+        memory.buf[SHARED_HEADER.size:start] = index_blob
+        position = start
+        for blob in blobs:
+            memory.buf[position:position + len(blob)] = blob
+            position += len(blob)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedTemplates':
+        """
+        Read-only access to templates published by another process.
+        """
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def close(self) -> None:
+        for kind in getattr(self, 'kinds', {}).values():
+            kind.decoded.clear()
+        if hasattr(self, 'data'):
+            self.data.release()
+        self.buffer.release()
+        self.memory.close()
+
+    def unlink(self) -> None:
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self) -> 'SharedTemplates':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+        self.unlink()
+
+
+def shard_key(spec: EncounterSpec) -> str:
+    """
+    Encounters of the same party against the same monsters land on the same worker,
+    which then only compiles the prototypes it needs.
+    """
+    return "+".join(sorted(spec.heroes)) + "|" + "+".join(sorted(spec.monsters))
+
+
+def shard(key: str, workers: int) -> int:
+    """
+    Worker of a key, stable across runs and processes (unlike hash()).
+    """
+    return zlib.crc32(key.encode('utf-8')) % workers
+
+
+# State of a worker process
+_shared: Optional[SharedTemplates] = None
+_spawner: Optional[Spawner] = None
+
+
+def attach_worker(name: str) -> None:
+    """
+    Worker initializer: use the shared templates for the life of the process.
+    """
+    global _shared, _spawner
+    _shared = SharedTemplates.attach(name)
+    templateStore.set_templates(_shared.kinds)
+    _spawner = Spawner.from_store()
+
+
+def simulate_chunk(specs: List[EncounterSpec], max_rounds: int = 100) -> List[Dict]:
+    return list(simulate(specs, _spawner, max_rounds))
+
+
+def run_sharded(specs: Iterable[EncounterSpec], workers: int = 2, max_rounds: int = 100, chunk_size: int = 1000,
+                templates: Dict[str, dict] = None) -> Iterator[Dict]:
+    """
+    Simulate encounters on worker processes sharing one copy of the templates, yielding summary records.
+    Each shard of encounters always runs on the same worker, in chunks of chunk_size.
+    Records come back chunk by chunk, not in the order of specs.
+    """
+    with SharedTemplates.publish(templates) as shared:
+        executors = [
+            ProcessPoolExecutor(1, initializer=attach_worker, initargs=(shared.name,))
+            for _ in range(workers)
+        ]
+        try:
+            pending = deque()
+            chunks: List[List[EncounterSpec]] = [[] for _ in range(workers)]
+            for spec in specs:
+                worker = shard(shard_key(spec), workers)
+                chunks[worker].append(spec)
+                if len(chunks[worker]) >= chunk_size:
+                    pending.append(executors[worker].submit(simulate_chunk, chunks[worker], max_rounds))
+                    chunks[worker] = []
+                    # Bound the number of chunks in flight
+                    while len(pending) > 2 * workers:
+                        yield from pending.popleft().result()
+            for worker, chunk in enumerate(chunks):
+                if chunk:
+                    pending.append(executors[worker].submit(simulate_chunk, chunk, max_rounds))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for executor in executors:
+                executor.shutdown(cancel_futures=True)
@@ -0,0 +1,124 @@
+# this file contains the Spawner class used to create creatures in bulk from templates
+import logging
+from typing import Dict, List, Tuple, Type, Union
+
+from classes.creature import Creature, Hero, Monster
+from classes.dice import Dice
+from classes.templateStore import TEMPLATE_DIR, TemplateSnapshot, get_templates, load_json
+
+
+def roll(value: int, spread: int) -> int:
+    """A stat rolled uniformly in [value - spread, value + spread]"""
+    return value + Dice.roll(2 * spread + 1) - spread - 1
+
+
+class Spawner:
+    """
+    Spawns creatures in bulk.
+    Each template is compiled once into a prototype creature, every spawned
+    instance is a clone of that prototype with its variance rolled on top.
+    """
+    def __init__(self,
+        monster_templates: dict = None,
+        hero_templates: dict = None,
+        ability_templates: dict = None,
+        item_templates: dict = None):
+        self.templates: Dict[type, dict] = {
+            Monster: monster_templates or {},
+            Hero: hero_templates or {}
+        }
+        self.ability_templates: dict = ability_templates
+        self.item_templates: dict = item_templates
+        # (creature class, template name) -> (prototype, variance)
+        self.prototypes: Dict[Tuple[type, str], Tuple[Creature, List[Tuple[str, int]]]] = {}
+
+    @classmethod
+    def from_files(cls, template_dir: str = TEMPLATE_DIR) -> 'Spawner':
+        """
+        Create a spawner from the JSON template files of a directory.
+        """
+        return cls(
+            monster_templates=load_json("creatures", template_dir),
+            hero_templates=load_json("heroes", template_dir),
+            ability_templates=load_json("abilities", template_dir),
+            item_templates=load_json("items", template_dir)
+        )
+
+    @classmethod
+    def from_store(cls) -> 'Spawner':
+        """
+        Create a spawner using the templates of the template store.
+        """
+        return cls(
+            monster_templates=get_templates("creatures"),
+            hero_templates=get_templates("heroes"),
+            ability_templates=get_templates("abilities"),
+            item_templates=get_templates("items")
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: TemplateSnapshot) -> 'Spawner':
+        """
+        Create a spawner using the templates of a snapshot, e.g. one spawner per template version.
+        """
+        return cls(
+            monster_templates=snapshot["creatures"],
+            hero_templates=snapshot["heroes"],
+            ability_templates=snapshot["abilities"],
+            item_templates=snapshot["items"]
+        )
+
+    def compile(self, creature_class: Type[Union[Hero, Monster]], template_name: str) -> Union[Creature, None]:
+        """
+        Compile a template into a prototype, or return the cached one.
+        Returns None if the template does not exist.
+        """
+        key = (creature_class, template_name)
+        if key in self.prototypes:
+            return self.prototypes[key][0]
+
+        template = self.templates[creature_class].get(template_name)
+        if template is None:
+            logging.error(f"{creature_class.__name__} template not found for {template_name}.")
+            return None
+
+        if creature_class is Hero:
+            prototype = Hero.create_hero(template_name, template_name, self.templates[Hero], self.ability_templates, self.item_templates)
+        else:
+            prototype = Monster.create_monster(template_name, template_name, self.templates[Monster], self.ability_templates)
+        variance = [(stat, spread) for stat, spread in template.get("variance", {}).items() if spread > 0]
+        self.prototypes[key] = (prototype, variance)
+        return prototype
+
+    def spawn(self, creature_class: Type[Union[Hero, Monster]], template_name: str, count: int = 1, name: str = None) -> List[Creature]:
+        """
+        Spawn count creatures from a template.
+        When several creatures are spawned they are numbered after their name.
+        """
+        prototype = self.compile(creature_class, template_name)
+        if prototype is None:
+            return []
+        variance = self.prototypes[(creature_class, template_name)][1]
+        base_name = name or prototype.name
+
+        creatures = []
+        for index in range(count):
+            creature = prototype.clone()
+            creature.name = f"{base_name} {index + 1}" if count > 1 else base_name
+            for stat, spread in variance:
+                setattr(creature, stat, roll(getattr(creature, stat), spread))
+            creature.hp = creature.max_hp
+            creatures.append(creature)
+        return creatures
+
+    def spawn_monsters(self, monster_type: str, count: int = 1, name: str = None) -> List[Monster]:
+        """
+        Spawn a wave of monsters of the same type.
+        """
+        return self.spawn(Monster, monster_type, count, name)
+
+    def spawn_heroes(self, hero_class: str, count: int = 1, name: str = None) -> List[Hero]:
+        """
+        Spawn heroes of the same class.
+        """
+        return self.spawn(Hero, hero_class, count, name)
@@ -0,0 +1,463 @@
+# this file contains the ahead-of-time template compiler
+# It validates every template file, checks the references between them and
+# writes the result as a compact binary bundle that loads in milliseconds.
+import argparse
+import difflib
+import json
+import logging
+import marshal
+import os
+import struct
+import sys
+import zlib
+from typing import Any, Dict, List
+
+from classes.enums import ARMOR_SLOTS, CostType, DamageType, TargetType
+from classes.templateStore import BUNDLE_FILE, TEMPLATE_DIR, TEMPLATE_FILES
+
+BUNDLE_MAGIC = b'DNDT'
+BUNDLE_VERSION = 1
+# magic, bundle version, marshal version, payload crc32
+BUNDLE_HEADER = struct.Struct('<4sHHI')
+
+NUMBER = (int, float)
+
+# Field name -> (accepted types, required)
+CREATURE_SCHEMA = {
+    "description": (str, True),
+    "level": (int, False),
+    "max_hp": (int, True),
+    "defense": (int, True),
+    "initiative": (int, True),
+    "abilities": (list, False),
+    "damage_type": (str, False),
+    "resistances": (list, False),
+    "weaknesses": (list, False),
+    "max_attack": (int, True),
+    "min_attack": (int, True),
+    "attack_bonus": (int, False),
+    "resources": (dict, False)
+}
+
+SCHEMAS = {
+    "ability": {
+        "description": (str, True),
+        "power": (int, False),
+        "cost": (int, False),
+        "cost_type": (str, False),
+        "cooldown": (int, False),
+        "power_type": (str, False),
+        "target_type": (str, False),
+        "is_offensive": (bool, False),
+        "effect_multiplier": (NUMBER, False),
+        "effects": (list, False),
+        "power_modifiers": (list, False)
+    },
+    "ability_effect": {
+        "effect_class": (str, True),
+        "effect_name": (str, True)
+    },
+    "DamageOverTimeEffect": {
+        "duration": (int, True),
+        "potency": (NUMBER, True),
+        "damage_type": (str, True),
+        "description": (str, False),
+        "potency_modifier": (dict, False)
+    },
+    "HealOverTimeEffect": {
+        "duration": (int, True),
+        "potency": (NUMBER, True),
+        "description": (str, False),
+        "potency_modifier": (dict, False)
+    },
+    "StatModifierEffect": {
+        "duration": (int, True),
+        "potency": (NUMBER, True),
+        "stat_to_modify": (str, True),
+        "description": (str, False),
+        "potency_modifier": (dict, False)
+    },
+    "Armor": {
+        "weight": (NUMBER, True),
+        "defense": (NUMBER, True),
+        "description": (str, True)
+    },
+    "Weapon": {
+        "attack": (NUMBER, True),
+        "weight": (NUMBER, True),
+        "description": (str, True)
+    },
+    "Consumable": {
+        "description": (str, True),
+        "weight": (NUMBER, True),
+        "power": (int, False),
+        "target": (str, False),
+        "is_damage": (bool, False),
+        "is_energy": (bool, False),
+        "energy_type": (str, False),
+        "effect": (list, False)
+    },
+    "resource": {
+        "max": (int, False),
+        "start": (int, False),
+        "regen": (int, False)
+    },
+    "hero": {
+        **CREATURE_SCHEMA,
+        "max_weight": (NUMBER, False),
+        "Weapon": (str, False),
+        "Armor": (list, False)
+    },
+    "creature": {
+        **CREATURE_SCHEMA,
+        "xp": (int, False),
+        "drop_table": (dict, False),
+        "variance": (dict, False)
+    },
+    "curve": {
+        "base": (NUMBER, True),
+        "exponent": (NUMBER, True),
+        "max_level": (int, True)
+    },
+    "progression": {
+        "curve": (str, True),
+        "growth": (dict, True)
+    }
+}
+
+# Hero stats a progression can grow with each level
+GROWTH_STATS = ("max_hp", "defense", "initiative", "max_attack", "min_attack", "attack_bonus")
+
+# Field name -> allowed values, for lists every element must be allowed
+CHOICES = {
+    "cost_type": CostType.names(),
+    "energy_type": CostType.names(),
+    "target_type": TargetType.names(),
+    "damage_type": DamageType.names(),
+    "power_type": DamageType.names(),
+    "resistances": DamageType.names(),
+    "weaknesses": DamageType.names()
+}
+
+ARMOR_CATEGORIES = tuple(str(slot) for slot in ARMOR_SLOTS)
+
+
+class TemplateValidationError(Exception):
+    """Raised when the templates contain errors."""
+    def __init__(self, errors: List[str]):
+        self.errors: List[str] = errors
+        super().__init__(f"TemplateValidationError: {len(errors)} error(s)\n" + "\n".join(errors))
+
+
+def check_fields(where: str, entry: Any, schema: Dict[str, tuple], errors: List[str]) -> bool:
+    """
+    Check one template entry against its schema.
+    Appends a message to errors for every problem, returns False if the entry is not a dict.
+    """
+    if not isinstance(entry, dict):
+        errors.append(f"{where}: expected an object, got {type(entry).__name__}")
+        return False
+
+    for field, value in entry.items():
+        if field not in schema:
+            message = f"{where}: unknown field '{field}'"
+            suggestion = difflib.get_close_matches(field, schema, n=1)
+            if suggestion:
+                message += f" (did you mean '{suggestion[0]}'?)"
+            errors.append(message)
+            continue
+        types = schema[field][0]
+        # bool is an int subclass, only accept it where bool is expected
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            expected = " or ".join(t.__name__ for t in types) if isinstance(types, tuple) else types.__name__
+            errors.append(f"{where}: field '{field}' should be {expected}, got {type(value).__name__}")
+        elif field in CHOICES:
+            for choice in value if isinstance(value, list) else [value]:
+                if choice not in CHOICES[field]:
+                    errors.append(f"{where}: field '{field}' has unknown value '{choice}' (expected one of {', '.join(CHOICES[field])})")
+
+    for field, (_, required) in schema.items():
+        if required and field not in entry:
+            errors.append(f"{where}: missing required field '{field}'")
+    return True
+
+
+def group(where: str, value: Any, errors: List[str]) -> dict:
+    """
+    A group of templates (name -> template), empty with an error if it is not an object.
+    """
+    if isinstance(value, dict):
+        return value
+    errors.append(f"{where}: expected an object, got {type(value).__name__}")
+    return {}
+
+
+def checked(entry: dict, field: str, schema: Dict[str, tuple], default: Any = None) -> Any:
+    """
+    Value of a field if it has its schema type, default otherwise: check_fields already reported it,
+    or it is not in the schema. The cross-field and cross-reference checks only look at checked values.
+    """
+    if field not in schema:
+        return default
+    value = entry.get(field, default)
+    types = schema[field][0]
+    if isinstance(value, types) and (not isinstance(value, bool) or types is bool):
+        return value
+    return default
+
+
+def names(values: list) -> List[str]:
+    """The strings of a list of names, other values can not name anything"""
+    return [value for value in values if isinstance(value, str)]
+
+
+def build_item_index(items: dict) -> Dict[str, tuple]:
+    """
+    Map every item name to its (item type, armor category or None).
+    """
+    index = {}
+    for item_type, entries in items.items():
+        if not isinstance(entries, dict):
+            continue
+        if item_type == 'Armor':
+            for category, armors in entries.items():
+                if isinstance(armors, dict):
+                    for name in armors:
+                        index[name] = (item_type, category)
+        else:
+            for name in entries:
+                index[name] = (item_type, None)
+    return index
+
+
+def validate(templates: Dict[str, dict]) -> List[str]:
+    """
+    Validate all templates and the references between them.
+    Returns the list of errors, empty if the templates are valid.
+    """
+    errors: List[str] = []
+    abilities = group("abilities", templates.get("abilities", {}), errors)
+    effects = group("effects", templates.get("effects", {}), errors)
+    items = group("items", templates.get("items", {}), errors)
+
+    # Effects, grouped by effect class
+    for effect_class, entries in effects.items():
+        if effect_class not in SCHEMAS:
+            errors.append(f"effects: unknown effect class '{effect_class}'")
+            continue
+        for name, entry in group(f"effects: {effect_class}", entries, errors).items():
+            check_fields(f"effects: {effect_class}: {name}", entry, SCHEMAS[effect_class], errors)
+
+    # Items, armors are grouped by category
+    for item_type, entries in items.items():
+        if item_type not in ("Armor", "Weapon", "Consumable"):
+            errors.append(f"items: unknown item type '{item_type}'")
+            continue
+        entries = group(f"items: {item_type}", entries, errors)
+        if item_type == "Armor":
+            for category, armors in entries.items():
+                if category not in ARMOR_CATEGORIES:
+                    errors.append(f"items: Armor: unknown category '{category}'")
+                    continue
+                for name, entry in group(f"items: Armor: {category}", armors, errors).items():
+                    check_fields(f"items: Armor: {category}: {name}", entry, SCHEMAS["Armor"], errors)
+        else:
+            for name, entry in entries.items():
+                check_fields(f"items: {item_type}: {name}", entry, SCHEMAS[item_type], errors)
+    item_index = build_item_index(items)
+
+    # Abilities and the effects they apply
+    for name, entry in abilities.items():
+        where = f"abilities: {name}"
+        if not check_fields(where, entry, SCHEMAS["ability"], errors):
+            continue
+        for position, effect in enumerate(checked(entry, "effects", SCHEMAS["ability"], [])):
+            effect_where = f"{where}: effects[{position}]"
+            if not check_fields(effect_where, effect, SCHEMAS["ability_effect"], errors):
+                continue
+            effect_class = checked(effect, "effect_class", SCHEMAS["ability_effect"])
+            effect_name = checked(effect, "effect_name", SCHEMAS["ability_effect"])
+            if effect_class is None or effect_name is None:
+                continue
+            if not isinstance(effects.get(effect_class), dict):
+                errors.append(f"{effect_where}: unknown effect class '{effect_class}'")
+            elif effect_name not in effects[effect_class]:
+                message = f"{effect_where}: unknown {effect_class} '{effect_name}'"
+                suggestion = difflib.get_close_matches(effect_name, effects[effect_class], n=1)
+                if suggestion:
+                    message += f" (did you mean '{suggestion[0]}'?)"
+                errors.append(message)
+
+    # Heroes and creatures reference abilities and items
+    for kind, schema_name in (("heroes", "hero"), ("creatures", "creature")):
+        schema = SCHEMAS[schema_name]
+        for name, entry in group(kind, templates.get(kind, {}), errors).items():
+            where = f"{kind}: {name}"
+            if not check_fields(where, entry, schema, errors):
+                continue
+            for ability_name in names(checked(entry, "abilities", schema, [])):
+                if ability_name not in abilities:
+                    errors.append(f"{where}: unknown ability '{ability_name}'")
+            for resource_name, resource in checked(entry, "resources", schema, {}).items():
+                if resource_name not in CostType.names():
+                    errors.append(f"{where}: unknown resource '{resource_name}' (expected one of {', '.join(CostType.names())})")
+                else:
+                    check_fields(f"{where}: resources: {resource_name}", resource, SCHEMAS["resource"], errors)
+            if checked(entry, "min_attack", schema, 0) > checked(entry, "max_attack", schema, 0):
+                errors.append(f"{where}: min_attack is greater than max_attack")
+            weapon = checked(entry, "Weapon", schema)
+            if weapon is not None and item_index.get(weapon, (None,))[0] != "Weapon":
+                errors.append(f"{where}: unknown weapon '{weapon}'")
+            for armor_name in names(checked(entry, "Armor", schema, [])):
+                if item_index.get(armor_name, (None,))[0] != "Armor":
+                    errors.append(f"{where}: unknown armor '{armor_name}'")
+            for item_name in checked(entry, "drop_table", schema, {}):
+                if item_name not in item_index:
+                    errors.append(f"{where}: drop_table references unknown item '{item_name}'")
+
+    # Level curves and the growth of each hero class
+    progression = group("progression", templates.get("progression", {}), errors)
+    for section in progression:
+        if section not in ("curves", "classes"):
+            errors.append(f"progression: unknown section '{section}'")
+    curves = group("progression: curves", progression.get("curves", {}), errors)
+    for name, entry in curves.items():
+        where = f"progression: curves: {name}"
+        if check_fields(where, entry, SCHEMAS["curve"], errors) and checked(entry, "max_level", SCHEMAS["curve"], 1) < 1:
+            errors.append(f"{where}: max_level should be at least 1")
+    for hero_class, entry in group("progression: classes", progression.get("classes", {}), errors).items():
+        where = f"progression: classes: {hero_class}"
+        if not check_fields(where, entry, SCHEMAS["progression"], errors):
+            continue
+        if hero_class not in group("heroes", templates.get("heroes", {}), []):
+            errors.append(f"{where}: unknown hero class '{hero_class}'")
+        curve = checked(entry, "curve", SCHEMAS["progression"])
+        if curve is not None and curve not in curves:
+            errors.append(f"{where}: unknown curve '{curve}'")
+        for stat, per_level in checked(entry, "growth", SCHEMAS["progression"], {}).items():
+            if stat not in GROWTH_STATS:
+                errors.append(f"{where}: growth of unknown stat '{stat}' (expected one of {', '.join(GROWTH_STATS)})")
+            elif not isinstance(per_level, NUMBER) or isinstance(per_level, bool):
+                errors.append(f"{where}: growth of '{stat}' should be a number, got {type(per_level).__name__}")
+    return errors
+
+
+def intern_strings(value: Any) -> Any:
+    """
+    Recursively intern every string of a template structure.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(key): intern_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_strings(item) for item in value]
+    return value
+
+
+def load_sources(template_dir: str = TEMPLATE_DIR) -> Dict[str, dict]:
+    """
+    Read every JSON template file of a directory.
+    Raises TemplateValidationError if a file is missing or not valid JSON.
+    """
+    templates, errors = {}, []
+    for kind, file_name in TEMPLATE_FILES.items():
+        path = os.path.join(template_dir, file_name)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                content = file.read()
+            templates[kind] = json.loads(content) if content.strip() else {}
+        except FileNotFoundError:
+            errors.append(f"{file_name}: file not found")
+        except json.JSONDecodeError as e:
+            errors.append(f"{file_name}: invalid JSON ({e})")
+    if errors:
+        raise TemplateValidationError(errors)
+    return templates
+
+
+def source_fingerprint(template_dir: str = TEMPLATE_DIR) -> Dict[str, tuple]:
+    """
+    Size and modification time of every template file, used to detect stale bundles.
+    """
+    fingerprint = {}
+    for file_name in TEMPLATE_FILES.values():
+        try:
+            stat = os.stat(os.path.join(template_dir, file_name))
+            fingerprint[file_name] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            fingerprint[file_name] = None
+    return fingerprint
+
+
+def compile_templates(template_dir: str = TEMPLATE_DIR, bundle_path: str = None) -> Dict[str, Any]:
+    """
+    Validate the templates of a directory and write them as a binary bundle.
+    Returns the compiled bundle, raises TemplateValidationError if the templates are invalid.
+    """
+    fingerprint = source_fingerprint(template_dir)
+    templates = load_sources(template_dir)
+    errors = validate(templates)
+    if errors:
+        raise TemplateValidationError(errors)
+
+    bundle = intern_strings({
+        "templates": templates,
+        "index": {"items": {name: list(location) for name, location in build_item_index(templates["items"]).items()}}
+    })
+    bundle["sources"] = fingerprint
+
+    payload = marshal.dumps(bundle)
+    bundle_path = bundle_path or os.path.join(template_dir, BUNDLE_FILE)
+    tmp_path = bundle_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, marshal.version, zlib.crc32(payload)))
+        file.write(payload)
+    os.replace(tmp_path, bundle_path)
+    logging.info(f"Compiled templates into {bundle_path} ({BUNDLE_HEADER.size + len(payload)} bytes).")
+    return bundle
+
+
+def load_bundle(bundle_path: str = None) -> Dict[str, Any]:
+    """
+    Load a compiled bundle.
+    Raises ValueError if the file is not a bundle this version can read.
+    """
+    bundle_path = bundle_path or os.path.join(TEMPLATE_DIR, BUNDLE_FILE)
+    with open(bundle_path, 'rb') as file:
+        data = file.read()
+    if len(data) < BUNDLE_HEADER.size:
+        raise ValueError(f"{bundle_path} is not a template bundle")
+    magic, version, marshal_version, crc = BUNDLE_HEADER.unpack_from(data)
+    if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION or marshal_version != marshal.version:
+        raise ValueError(f"{bundle_path} is not a compatible template bundle")
+    payload = memoryview(data)[BUNDLE_HEADER.size:]
+    if zlib.crc32(payload) != crc:
+        raise ValueError(f"{bundle_path} is corrupted")
+    return marshal.loads(payload)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate the game templates and compile them into a binary bundle.")
+    parser.add_argument("template_dir", nargs="?", default=TEMPLATE_DIR, help="directory containing the JSON templates")
+    parser.add_argument("-o", "--output", help="bundle path (defaults to templates.bundle in the template directory)")
+    parser.add_argument("--check", action="store_true", help="only validate, do not write the bundle")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            errors = validate(load_sources(args.template_dir))
+            if errors:
+                raise TemplateValidationError(errors)
+            print("Templates are valid.")
+        else:
+            compile_templates(args.template_dir, args.output)
+            print(f"Templates compiled to {args.output or os.path.join(args.template_dir, BUNDLE_FILE)}")
+    except TemplateValidationError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
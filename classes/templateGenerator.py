@@ -0,0 +1,276 @@
+# this file contains the synthetic template generator and the template scale harness
+# The generator builds ability, effect, item, hero, creature and progression
+# templates of any size that pass the template compiler, references included,
+# from a seed so that runs can be compared. The harness writes sets of growing
+# size to a directory and measures, for each one, the JSON and bundle load
+# times, the memory the loaded templates take and the latency of the lookups
+# the game makes in them.
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from classes import templateStore
+from classes.abilities import Ability
+from classes.balanceTuner import write_templates
+from classes.effects import EffectFactory
+from classes.enums import ARMOR_SLOTS, CostType, DamageType, TargetType
+from classes.inventory import Item
+from classes.itemCatalog import item_catalog
+from classes.templateCompiler import GROWTH_STATS, compile_templates, load_bundle, load_sources, validate
+
+EFFECT_CLASSES = ("DamageOverTimeEffect", "HealOverTimeEffect", "StatModifierEffect")
+ARMOR_CATEGORIES = tuple(str(slot) for slot in ARMOR_SLOTS)
+DAMAGE_TYPES = DamageType.names()
+STATS = ("strength", "intelligence", "agility")
+
+PREFIXES = ("Ancient", "Burning", "Cursed", "Frozen", "Gilded", "Hollow", "Iron", "Lunar", "Silent", "Storm", "Venom", "Wild")
+NOUNS = {
+    "abilities": ("Strike", "Nova", "Bolt", "Ward", "Surge", "Howl"),
+    "effects": ("Blight", "Ember", "Mending", "Vigor", "Rot", "Focus"),
+    "Armor": ("Helm", "Plate", "Greaves", "Cowl", "Hauberk", "Leggings"),
+    "Weapon": ("Blade", "Maul", "Staff", "Bow", "Spear", "Dagger"),
+    "Consumable": ("Tonic", "Ration", "Elixir", "Draught", "Salve", "Bomb"),
+    "heroes": ("Knight", "Ranger", "Sorcerer", "Cleric", "Rogue", "Warden"),
+    "creatures": ("Ghoul", "Wyrm", "Kobold", "Troll", "Wraith", "Spider")
+}
+
+
+def entry_name(rng: random.Random, group: str, index: int) -> str:
+    """Unique, readable name of the index-th entry of a group"""
+    return f"{rng.choice(PREFIXES)} {rng.choice(NOUNS[group])} {index}"
+
+
+def scaled_sizes(size: int) -> Dict[str, int]:
+    """Entries of each kind for a template set of a given size, heroes are fewer"""
+    return {"abilities": size, "effects": size, "items": size, "heroes": max(size // 10, 1), "creatures": size}
+
+
+def generate_templates(sizes: Dict[str, int], seed: int = 0) -> Dict[str, dict]:
+    """
+    Valid templates of every kind with sizes[kind] entries (see scaled_sizes).
+    Items are split between the armor categories, weapons and consumables, and
+    effects between the effect classes.
+    """
+    rng = random.Random(seed)
+
+    effects = {effect_class: {} for effect_class in EFFECT_CLASSES}
+    effect_names: List[Tuple[str, str]] = []
+    for index in range(max(sizes.get("effects", 0), 1)):
+        effect_class = EFFECT_CLASSES[index % len(EFFECT_CLASSES)]
+        name = entry_name(rng, "effects", index)
+        entry = {
+            "duration": rng.randint(1, 6),
+            "potency": rng.randint(1, 12),
+            "description": f"{name}, generated.",
+            "potency_modifier": {stat: round(rng.uniform(0, 0.2), 2) for stat in rng.sample(STATS, 2)}
+        }
+        if effect_class == "DamageOverTimeEffect":
+            entry["damage_type"] = rng.choice(DAMAGE_TYPES)
+        elif effect_class == "StatModifierEffect":
+            entry["stat_to_modify"] = rng.choice(STATS)
+        effects[effect_class][name] = entry
+        effect_names.append((effect_class, name))
+
+    items = {"Armor": {category: {} for category in ARMOR_CATEGORIES}, "Weapon": {}, "Consumable": {}}
+    armors: Dict[str, List[str]] = {category: [] for category in ARMOR_CATEGORIES}
+    weapons: List[str] = []
+    item_names: List[str] = []
+    for index in range(max(sizes.get("items", 0), 4)):
+        if index % 4 < 2 or index < len(ARMOR_CATEGORIES):
+            category = ARMOR_CATEGORIES[index % len(ARMOR_CATEGORIES)]
+            name = entry_name(rng, "Armor", index)
+            items["Armor"][category][name] = {"weight": rng.randint(1, 20), "defense": rng.randint(1, 15), "description": f"{name}, generated."}
+            armors[category].append(name)
+        elif index % 4 == 2:
+            name = entry_name(rng, "Weapon", index)
+            items["Weapon"][name] = {"attack": rng.randint(4, 20), "weight": rng.randint(2, 15), "description": f"{name}, generated."}
+            weapons.append(name)
+        else:
+            name = entry_name(rng, "Consumable", index)
+            entry = {"description": f"{name}, generated.", "weight": rng.randint(1, 3), "power": rng.randint(5, 40)}
+            kind = rng.random()
+            if kind < 0.3:
+                entry["is_damage"] = True
+            elif kind < 0.5:
+                entry.update(is_energy=True, energy_type=rng.choice(CostType.names()))
+            items["Consumable"][name] = entry
+        item_names.append(name)
+    if not weapons:
+        name = entry_name(rng, "Weapon", len(item_names))
+        items["Weapon"][name] = {"attack": 8, "weight": 5, "description": f"{name}, generated."}
+        weapons.append(name)
+
+    abilities = {}
+    for index in range(max(sizes.get("abilities", 0), 1)):
+        name = entry_name(rng, "abilities", index)
+        target_type = rng.choice(TargetType.names())
+        abilities[name] = {
+            "description": f"{name}, generated.",
+            "power": rng.randint(0, 40),
+            "cost": rng.randint(0, 30),
+            "cost_type": rng.choice(CostType.names()),
+            "cooldown": rng.randint(0, 5),
+            "power_type": rng.choice(DAMAGE_TYPES),
+            "target_type": target_type,
+            "is_offensive": target_type != "self",
+            "effect_multiplier": round(rng.uniform(0.5, 1.5), 2),
+            "effects": [
+                {"effect_class": effect_class, "effect_name": effect_name}
+                for effect_class, effect_name in rng.sample(effect_names, min(rng.randint(0, 2), len(effect_names)))
+            ]
+        }
+    ability_names = list(abilities)
+
+    def creature(name: str, level: int) -> dict:
+        max_attack = rng.randint(6, 20)
+        return {
+            "description": f"{name}, generated.",
+            "level": level,
+            "max_hp": rng.randint(20, 150),
+            "defense": rng.randint(2, 14),
+            "initiative": rng.randint(5, 15),
+            "abilities": rng.sample(ability_names, min(rng.randint(0, 3), len(ability_names))),
+            "damage_type": rng.choice(DAMAGE_TYPES),
+            "resistances": rng.sample(DAMAGE_TYPES, rng.randint(0, 1)),
+            "weaknesses": rng.sample(DAMAGE_TYPES, rng.randint(0, 1)),
+            "max_attack": max_attack,
+            "min_attack": rng.randint(1, max_attack),
+            "attack_bonus": rng.randint(0, 5),
+            "resources": {resource: {"max": 100, "regen": rng.randint(0, 10)} for resource in rng.sample(CostType.names(), rng.randint(1, 2))}
+        }
+
+    heroes = {}
+    for index in range(max(sizes.get("heroes", 0), 1)):
+        name = entry_name(rng, "heroes", index)
+        heroes[name] = dict(
+            creature(name, 1),
+            max_weight=rng.randint(60, 150),
+            Weapon=rng.choice(weapons),
+            Armor=[rng.choice(names) for names in armors.values() if names]
+        )
+
+    creatures = {}
+    for index in range(max(sizes.get("creatures", 0), 1)):
+        name = entry_name(rng, "creatures", index)
+        creatures[name] = dict(
+            creature(name, rng.randint(1, 20)),
+            xp=rng.randint(5, 200),
+            drop_table={item: round(rng.uniform(0.01, 0.5), 2) for item in rng.sample(item_names, min(rng.randint(0, 3), len(item_names)))},
+            variance={"max_hp": rng.randint(0, 10), "initiative": rng.randint(0, 2)}
+        )
+
+    progression = {
+        "curves": {"generated": {"base": 100, "exponent": 1.5, "max_level": 30}},
+        "classes": {
+            name: {"curve": "generated", "growth": {stat: round(rng.uniform(0, 3), 2) for stat in rng.sample(GROWTH_STATS, 3)}}
+            for name in heroes
+        }
+    }
+    return {
+        "abilities": abilities,
+        "effects": effects,
+        "items": items,
+        "heroes": heroes,
+        "creatures": creatures,
+        "progression": progression
+    }
+
+
+def timed(function: Callable, *args) -> Tuple[object, float]:
+    """(result, seconds) of a call"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def lookup_latency(function: Callable, keys: List[tuple]) -> float:
+    """Mean microseconds of function(*key) over keys"""
+    start = time.perf_counter()
+    for key in keys:
+        function(*key)
+    return (time.perf_counter() - start) / max(len(keys), 1) * 1e6
+
+
+def measure(size: int, lookups: int = 10000, seed: int = 0) -> Dict[str, float]:
+    """
+    Generate a template set of a size, write it to a temporary directory and measure it. Raises ValueError if the generated templates do not validate.
+    """
+    sizes = scaled_sizes(size)
+    templates, generate_seconds = timed(generate_templates, sizes, seed)
+    errors, validate_seconds = timed(validate, templates)
+    if errors:
+        raise ValueError(f"Generated templates are invalid: {errors[:5]}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_templates(templates, directory)
+        tracemalloc.start()
+        try:
+            loaded, json_seconds = timed(load_sources, directory)
+            memory = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del loaded
+        _, compile_seconds = timed(compile_templates, directory)
+        bundle, bundle_seconds = timed(load_bundle, f"{directory}/{templateStore.BUNDLE_FILE}")
+
+    rng = random.Random(seed)
+    item_templates = templates["items"]
+    items = [("Armor", name, item_templates) for category in item_templates["Armor"].values() for name in category]
+    items += [(item_type, name, item_templates) for item_type in ("Weapon", "Consumable") for name in item_templates[item_type]]
+    effects = [(effect_class, name, "environment") for effect_class, entries in templates["effects"].items() for name in entries]
+    abilities = [(name, templates["abilities"][name]) for name in templates["abilities"]]
+    with templateStore.override(bundle["templates"]):
+        _, catalog_seconds = timed(item_catalog, item_templates)
+        result = {
+            "size": size,
+            "entries": sum(sizes.values()),
+            "generate_s": generate_seconds,
+            "validate_s": validate_seconds,
+            "json_load_s": json_seconds,
+            "compile_s": compile_seconds,
+            "bundle_load_s": bundle_seconds,
+            "memory_kib": memory / 1024,
+            "catalog_s": catalog_seconds,
+            "create_item_us": lookup_latency(Item.create_item, rng.choices(items, k=lookups)),
+            "create_effect_us": lookup_latency(EffectFactory.create_effect, rng.choices(effects, k=lookups)),
+            "create_ability_us": lookup_latency(Ability.create_ability, rng.choices(abilities, k=lookups))
+        }
+    return result
+
+
+def run(sizes: List[int], lookups: int = 10000, seed: int = 0) -> List[Dict[str, float]]:
+    return [measure(size, lookups, seed) for size in sizes]
+
+
+def format_results(results: List[Dict[str, float]]) -> str:
+    columns = list(results[0]) if results else []
+    lines = ["  ".join(f"{column:>16}" for column in columns)]
+    for result in results:
+        lines.append("  ".join(f"{result[column]:>16.4g}" if isinstance(result[column], float) else f"{result[column]:>16}" for column in columns))
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate synthetic templates of growing size and measure them.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="entries per template kind")
+    parser.add_argument("--lookups", type=int, default=10000, help="lookups timed per kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write", metavar="DIR", help="only write the templates of the first size to DIR")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.write:
+        write_templates(generate_templates(scaled_sizes(args.sizes[0]), args.seed), args.write)
+        return 0
+    results = run(args.sizes, args.lookups, args.seed)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
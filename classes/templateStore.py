@@ -0,0 +1,289 @@
+# this file contains the lazy template store
+# Nothing is read when the package is imported: templates are loaded the first
+# time they are requested, from the compiled bundle when it is up to date with
+# the JSON files, and from the JSON files otherwise.
+# A running server can reload the JSON files into a new immutable, versioned
+# snapshot: fights keep the snapshot they started with, new fights use the new
+# one, and a snapshot is freed when the last fight using it is gone.
+import logging
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+BUNDLE_FILE = 'templates.bundle'
+
+# Template kind -> file name inside the template directory
+TEMPLATE_FILES = {
+    "abilities": "abilitiesTemplates.json",
+    "effects": "effectsTemplates.json",
+    "items": "items.json",
+    "heroes": "heroTemplate.json",
+    "creatures": "creatureTemplates.json",
+    "progression": "progressionTemplates.json"
+}
+
+# Template kind -> loaded templates
+_templates: Dict[str, dict] = {}
+_bundle_checked: bool = False
+
+
+class TemplateSnapshot:
+    """
+    Read-only, versioned view of every template kind.
+    Kinds and their entries can not be replaced, the entries themselves must not be modified.
+    """
+    def __init__(self, version: int, templates: Dict[str, Mapping], fingerprint: Dict[str, tuple] = None):
+        self.version: int = version
+        self.kinds: Mapping[str, Mapping] = MappingProxyType({
+            kind: MappingProxyType(entries) if isinstance(entries, dict) else entries
+            for kind, entries in templates.items()
+        })
+        self.fingerprint: Optional[Dict[str, tuple]] = fingerprint  # source files the snapshot was loaded from
+
+    def __getitem__(self, kind: str) -> Mapping:
+        return self.kinds[kind]
+
+    def __contains__(self, kind: str) -> bool:
+        return kind in self.kinds
+
+    def __repr__(self) -> str:
+        return f"TemplateSnapshot(version={self.version})"
+
+    @contextmanager
+    def activate(self) -> Iterator['TemplateSnapshot']:
+        """
+        Serve get_templates from this snapshot in the current thread or task, e.g. for the length of a fight.
+        """
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+
+# Snapshot that new fights use, built from the loaded templates on first use
+_current: Optional[TemplateSnapshot] = None
+_version: int = 0
+# Snapshot activated in the current thread or task
+_active: ContextVar[Optional[TemplateSnapshot]] = ContextVar("active_templates", default=None)
+# Version -> snapshot, for every snapshot still referenced somewhere
+_live: 'weakref.WeakValueDictionary[int, TemplateSnapshot]' = weakref.WeakValueDictionary()
+# Only writers take the lock, readers just read _current
+_reload_lock = threading.Lock()
+
+
+def load_bundle_if_fresh(template_dir: str = TEMPLATE_DIR) -> bool:
+    """
+    Load every template kind from the compiled bundle if it matches the JSON files.
+    Returns True if the bundle was used.
+    """
+    bundle_path = os.path.join(template_dir, BUNDLE_FILE)
+    if not os.path.exists(bundle_path):
+        return False
+
+    from classes.templateCompiler import load_bundle, source_fingerprint
+    try:
+        bundle = load_bundle(bundle_path)
+    except (OSError, ValueError, EOFError) as e:
+        logging.warning(f"Ignoring template bundle {bundle_path}: {e}")
+        return False
+    if bundle.get("sources") != source_fingerprint(template_dir):
+        logging.info(f"Template bundle {bundle_path} is out of date, loading JSON templates.")
+        return False
+    _templates.update(bundle["templates"])
+    return True
+
+
+def load_json(kind: str, template_dir: str = TEMPLATE_DIR) -> dict:
+    """
+    Load one template kind from its JSON file.
+    Returns an empty dict if the file is missing or invalid.
+    """
+    import json
+
+    file_name = TEMPLATE_FILES[kind]
+    try:
+        with open(os.path.join(template_dir, file_name), 'r', encoding='utf-8') as file:
+            content = file.read()
+        return json.loads(content) if content.strip() else {}
+    except FileNotFoundError:
+        logging.error(f"Templates file {file_name} not found.")
+    except json.JSONDecodeError:
+        logging.error(f"Error decoding JSON from templates file {file_name}.")
+    return {}
+
+
+def get_templates(kind: str) -> dict:
+    """
+    Return the templates of a kind ('abilities', 'effects', 'items', 'heroes', 'creatures' or 'progression'),
+    loading them on first use. Inside TemplateSnapshot.activate() the snapshot's templates are returned.
+    """
+    global _bundle_checked
+    active = _active.get()
+    if active is not None:
+        return active.kinds[kind]
+    templates = _templates.get(kind)
+    if templates is None:
+        if not _bundle_checked:
+            _bundle_checked = True
+            if load_bundle_if_fresh() and kind in _templates:
+                return _templates[kind]
+        templates = _templates[kind] = load_json(kind)
+    return templates
+
+
+def set_templates(templates: Dict[str, dict]) -> None:
+    """
+    Replace some template kinds for the rest of the process, e.g. with shared ones in a worker.
+    """
+    global _bundle_checked, _current
+    # Loading the bundle later would overwrite them
+    _bundle_checked = True
+    _templates.update(templates)
+    _current = None
+
+
+def clear() -> None:
+    """
+    Forget every loaded template, the next access reloads them.
+    """
+    global _bundle_checked, _current
+    _templates.clear()
+    _bundle_checked = False
+    _current = None
+
+
+@contextmanager
+def override(templates: Dict[str, dict]) -> Iterator[None]:
+    """
+    Temporarily replace some template kinds, e.g. to evaluate patched templates.
+    Fights started meanwhile use a snapshot of the replaced templates.
+    """
+    global _current
+    saved = {kind: _templates.get(kind) for kind in templates}
+    saved_snapshot = _current
+    _templates.update(templates)
+    _current = None
+    try:
+        yield
+    finally:
+        for kind, previous in saved.items():
+            if previous is None:
+                _templates.pop(kind, None)
+            else:
+                _templates[kind] = previous
+        _current = saved_snapshot
+
+
+def _publish(templates: Dict[str, Mapping], fingerprint: Dict[str, tuple] = None) -> TemplateSnapshot:
+    global _current, _version
+    _version += 1
+    snapshot = TemplateSnapshot(_version, templates, fingerprint)
+    _live[snapshot.version] = snapshot
+    _current = snapshot
+    return snapshot
+
+
+def snapshot() -> TemplateSnapshot:
+    """
+    Snapshot a fight should keep for its whole length: the active one if any, the current one otherwise.
+    """
+    active = _active.get()
+    if active is not None:
+        return active
+    current = _current
+    if current is None:
+        with _reload_lock:
+            current = _current
+            if current is None:
+                current = _publish({kind: get_templates(kind) for kind in TEMPLATE_FILES})
+    return current
+
+
+def reload(template_dir: str = TEMPLATE_DIR, force: bool = False) -> Optional[TemplateSnapshot]:
+    """
+    Load and validate the JSON templates into a new current snapshot, unless the files did not
+    change since the current snapshot was loaded. Kinds whose file did not change are shared
+    with the previous snapshot. In-flight fights keep their snapshot.
+    Returns the current snapshot, or None if the templates are invalid (the current snapshot is kept).
+    """
+    global _bundle_checked
+    from classes.templateCompiler import TemplateValidationError, load_sources, source_fingerprint, validate
+
+    with _reload_lock:
+        previous = _current
+        try:
+            fingerprint = source_fingerprint(template_dir)
+            if not force and previous is not None and previous.fingerprint == fingerprint:
+                return previous
+            templates = load_sources(template_dir)
+            errors = validate(templates)
+        except TemplateValidationError as e:
+            logging.error(f"Templates not reloaded: {e}")
+            return None
+        except Exception:
+            # A half-written file or a validator bug must not take down the caller, e.g. the watcher
+            logging.exception(f"Templates not reloaded from {template_dir}")
+            return None
+        if errors:
+            logging.error(f"Templates not reloaded: {TemplateValidationError(errors)}")
+            return None
+        changed = dict(templates)
+        if previous is not None and previous.fingerprint is not None:
+            for kind, file_name in TEMPLATE_FILES.items():
+                if fingerprint[file_name] == previous.fingerprint.get(file_name):
+                    templates[kind] = previous.kinds[kind]
+                    del changed[kind]
+        snapshot = _publish(templates, fingerprint)
+        if template_dir == TEMPLATE_DIR:
+            # Code reading templates outside of a fight sees the reload too
+            _bundle_checked = True
+            _templates.update(changed)
+        return snapshot
+
+
+def live_versions() -> List[int]:
+    """
+    Versions of the snapshots still referenced, by the current fights or the store.
+    """
+    return sorted(_live.keys())
+
+
+class TemplateWatcher:
+    """
+    Background thread reloading the templates when their files change.
+    """
+    def __init__(self, template_dir: str = TEMPLATE_DIR, interval: float = 1.0):
+        self.template_dir: str = template_dir
+        self.interval: float = interval
+        self.stopped: threading.Event = threading.Event()
+        self.thread: threading.Thread = threading.Thread(target=self.run, name="template-watcher", daemon=True)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                reload(self.template_dir)
+            except Exception:
+                # The watcher lives as long as the server, the next change gets another try
+                logging.exception("Template watcher failed to reload")
+
+    def start(self) -> 'TemplateWatcher':
+        reload(self.template_dir)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def __enter__(self) -> 'TemplateWatcher':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,266 @@
+# this file contains the threat tables that monsters pick their targets from
+# Every monster keeps the threat of each hero in an indexed max-heap, so the
+# highest threat is read in O(1), updated in O(log n) and the top k are read in
+# O(k log k) without scanning every hero. Threat decays each turn: instead of
+# multiplying every entry, new threat is scaled up by the decay accumulated so
+# far, which keeps the heap order and makes a turn O(1). Damage and heals are
+# reported through the creatures' hooks and applied in batches, so an area
+# ability touching many monsters updates each (monster, hero) pair once.
+from collections import defaultdict
+from heapq import heappop, heappush
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+DAMAGE_THREAT = 1.0  # threat per point of damage dealt to a monster
+HEAL_THREAT = 0.5  # threat per point healed, against every monster of the fight
+DECAY = 0.9  # fraction of the threat kept at the end of each turn
+# Stored threats are rescaled once the accumulated decay reaches this factor
+MAX_SCALE = 1e12
+
+
+class IndexedHeap:
+    """
+    Max-heap of keys by priority, with a key -> position index so that any key
+    can be updated or removed in O(log n).
+    """
+    def __init__(self):
+        self.keys: List[Hashable] = []
+        self.priorities: List[float] = []
+        # key -> position in the heap
+        self.index: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.index
+
+    def get(self, key: Hashable, default: float = None) -> float:
+        position = self.index.get(key)
+        return default if position is None else self.priorities[position]
+
+    def items(self) -> List[Tuple[Hashable, float]]:
+        """(key, priority) pairs in heap order"""
+        return list(zip(self.keys, self.priorities))
+
+    def _swap(self, i: int, j: int) -> None:
+        keys, priorities = self.keys, self.priorities
+        keys[i], keys[j] = keys[j], keys[i]
+        priorities[i], priorities[j] = priorities[j], priorities[i]
+        self.index[keys[i]] = i
+        self.index[keys[j]] = j
+
+    def _sift_up(self, position: int) -> None:
+        priorities = self.priorities
+        while position:
+            parent = (position - 1) >> 1
+            if priorities[parent] >= priorities[position]:
+                break
+            self._swap(position, parent)
+            position = parent
+
+    def _sift_down(self, position: int) -> None:
+        priorities = self.priorities
+        size = len(priorities)
+        while True:
+            largest = position
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size and priorities[child] > priorities[largest]:
+                    largest = child
+            if largest == position:
+                return
+            self._swap(position, largest)
+            position = largest
+
+    def set(self, key: Hashable, priority: float) -> None:
+        """Insert key, or move it to its new priority"""
+        position = self.index.get(key)
+        if position is None:
+            position = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.priorities.append(priority)
+            self._sift_up(position)
+            return
+        previous = self.priorities[position]
+        self.priorities[position] = priority
+        if priority > previous:
+            self._sift_up(position)
+        else:
+            self._sift_down(position)
+
+    def add(self, key: Hashable, amount: float) -> None:
+        """Add amount to the priority of key, inserted at amount if missing"""
+        self.set(key, self.get(key, 0.0) + amount)
+
+    def peek(self) -> Tuple[Hashable, float]:
+        """(key, priority) of the highest priority, IndexError if empty"""
+        return self.keys[0], self.priorities[0]
+
+    def remove(self, key: Hashable) -> float:
+        """Remove key, returns its priority. KeyError if missing"""
+        position = self.index.pop(key)
+        priority = self.priorities[position]
+        key = self.keys.pop()
+        last = self.priorities.pop()
+        if position < len(self.keys):
+            # The last entry fills the hole, then moves whichever way its priority requires
+            self.keys[position], self.priorities[position] = key, last
+            self.index[key] = position
+            self._sift_up(position)
+            self._sift_down(self.index[key])
+        return priority
+
+    def pop(self) -> Tuple[Hashable, float]:
+        """Remove and return the (key, priority) of the highest priority"""
+        key, priority = self.peek()
+        self.remove(key)
+        return key, priority
+
+    def top(self, k: int) -> List[Tuple[Hashable, float]]:
+        """
+        The k (key, priority) of highest priority, highest first, without changing the heap.
+        Only the heap entries above the k-th are visited, O(k log k).
+        """
+        keys, priorities = self.keys, self.priorities
+        size = len(keys)
+        result = []
+        frontier = [(-priorities[0], 0)] if size and k > 0 else []
+        while frontier and len(result) < k:
+            _, position = heappop(frontier)
+            result.append((keys[position], priorities[position]))
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size:
+                    heappush(frontier, (-priorities[child], child))
+        return result
+
+    def scale(self, factor: float) -> None:
+        """Multiply every priority by a positive factor, the order is kept"""
+        self.priorities = [priority * factor for priority in self.priorities]
+
+
+class ThreatTable:
+    """
+    Threat of the heroes against one monster.
+    Threats are stored multiplied by scale, which grows by 1 / decay every turn.
+    """
+    def __init__(self, decay: float = DECAY):
+        self.decay: float = decay
+        self.scale: float = 1.0
+        # creature uid -> stored threat
+        self.heap: IndexedHeap = IndexedHeap()
+        # creature uid -> creature
+        self.creatures: Dict[int, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def add(self, creature, amount: float) -> None:
+        self.creatures[creature.uid] = creature
+        self.heap.add(creature.uid, amount * self.scale)
+
+    def threat(self, creature) -> float:
+        return self.heap.get(creature.uid, 0.0) / self.scale
+
+    def end_turn(self) -> None:
+        """Decay every threat, in O(1) until a rescale is due"""
+        self.scale /= self.decay
+        if self.scale > MAX_SCALE:
+            self.heap.scale(1 / self.scale)
+            self.scale = 1.0
+
+    def remove(self, creature) -> None:
+        if creature.uid in self.heap:
+            self.heap.remove(creature.uid)
+            del self.creatures[creature.uid]
+
+    def target(self):
+        """Living creature with the highest threat, None if there is none. Dead ones are dropped"""
+        heap = self.heap
+        while heap:
+            uid, _ = heap.peek()
+            creature = self.creatures[uid]
+            if creature.is_alive:
+                return creature
+            self.remove(creature)
+        return None
+
+    def top(self, k: int) -> List[Tuple[object, float]]:
+        """(creature, threat) of the k highest threats, dead creatures included"""
+        return [(self.creatures[uid], stored / self.scale) for uid, stored in self.heap.top(k)]
+
+
+class ThreatBoard:
+    """
+    Threat tables of the monsters of a fight, fed by the damage and heal hooks of the combatants.
+    Threat is queued as it is generated and applied by flush(), which every query does first:
+    an area ability adds one entry per (monster, source) however many hits it deals.
+    """
+    def __init__(self, monsters: Iterable, heroes: Iterable, damage_threat: float = DAMAGE_THREAT,
+                 heal_threat: float = HEAL_THREAT, decay: float = DECAY):
+        self.damage_threat: float = damage_threat
+        self.heal_threat: float = heal_threat
+        # monster uid -> its table
+        self.tables: Dict[int, ThreatTable] = {monster.uid: ThreatTable(decay) for monster in monsters}
+        self.monsters: List = list(monsters)
+        # (monster uid, source uid) -> threat waiting for flush
+        self.pending: Dict[Tuple[int, int], float] = defaultdict(float)
+        # source uid -> source
+        self.sources: Dict[int, object] = {}
+        self.combatants: List = self.monsters + list(heroes)
+        for creature in self.combatants:
+            creature.on_damage = self.damaged
+            creature.on_heal = self.healed
+
+    def damaged(self, creature, attacker, damage: int) -> None:
+        """Damage hook: the attacker gains threat against the monster it hurt"""
+        if creature.uid in self.tables and attacker is not None and damage > 0:
+            self.sources[attacker.uid] = attacker
+            self.pending[creature.uid, attacker.uid] += damage * self.damage_threat
+
+    def healed(self, creature, healer, heal: int) -> None:
+        """Heal hook: the healer gains threat against every living monster"""
+        if healer is None or heal <= 0 or healer.uid in self.tables:
+            return
+        self.sources[healer.uid] = healer
+        threat = heal * self.heal_threat
+        pending = self.pending
+        for monster in self.monsters:
+            if monster.is_alive:
+                pending[monster.uid, healer.uid] += threat
+
+    def add_threat(self, monsters: Iterable, source, amount: float) -> None:
+        """Queue the same threat from source against many monsters, e.g. a taunt"""
+        self.sources[source.uid] = source
+        for monster in monsters:
+            if monster.uid in self.tables:
+                self.pending[monster.uid, source.uid] += amount
+
+    def flush(self) -> None:
+        """Apply the queued threat, one heap update per (monster, source)"""
+        if not self.pending:
+            return
+        tables, sources = self.tables, self.sources
+        for (monster_uid, source_uid), amount in self.pending.items():
+            tables[monster_uid].add(sources[source_uid], amount)
+        self.pending.clear()
+
+    def table(self, monster) -> ThreatTable:
+        self.flush()
+        return self.tables[monster.uid]
+
+    def target(self, monster):
+        """Highest-threat living hero of monster, None if no living hero has threat"""
+        return self.table(monster).target()
+
+    def top(self, monster, k: int) -> List[Tuple[object, float]]:
+        return self.table(monster).top(k)
+
+    def end_turn(self) -> None:
+        self.flush()
+        for table in self.tables.values():
+            table.end_turn()
+
+    def release(self) -> None:
+        """Remove the hooks, so that the combatants do not keep the board alive"""
+        for creature in self.combatants:
+            creature.on_damage = None
+            creature.on_heal = None
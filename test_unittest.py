@@ -1,8 +1,50 @@
 import unittest
+import csv
+import asyncio
+import copy
+import gc
+import itertools
 import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from fractions import Fraction
+from unittest import mock
 from classes.effects import EffectManager, EffectFactory
 from classes.abilities import Ability
 from classes.inventory import Item, Armor, Weapon, Consumable
+from classes.itemCatalog import ItemCatalog, item_catalog
+from classes.hydration import DormantWorld, dehydrate, hydrate
+from classes.loadout import auto_equip, auto_equip_all, best_loadout, equipment_budget, optimize
+from classes.creature import Hero, Monster
+from classes.spawner import Spawner
+from classes.damageDistribution import Distribution, attack_damage, damage_per_turn, turns_to_kill
+from classes.effects import DamageOverTimeEffect
+from classes.enums import CostType, DamageType, EquipmentSlot, TargetType
+from classes.changeTracking import COOLDOWNS, EFFECTS, HP, DeltaTracker, encode
+from classes.combatManager import CombatManager
+from classes.gameServer import Connection, GameServer, load_test
+from classes.encounterSolver import EncounterSolver
+from classes.actionQueue import ABILITY, ATTACK, DEFEND, USE_ITEM, ActionQueue, encode_action
+from classes.attackResolution import CRITICAL, HIT, MISS, outcome, outcome_counts, outcome_table, resolve_attack
+from classes.actions import AbilityAction, AttackAction, DefendAction, UseItemAction, WaitAction
+from classes.balanceTuner import BalanceTuner, Parameter, evaluate, patch_templates, write_templates
+from classes.resources import ResourcePool, Resources, resource_spec
+from classes.massCombat import MassCombatManager
+from classes.threat import IndexedHeap, ThreatBoard, ThreatTable
+from classes.heroStore import ConnectionPool, HeroStore
+from classes.templateGenerator import generate_templates, measure, scaled_sizes
+from classes.progression import CampaignSimulator, LevelCurve, award_xp, level_curve, progression_of
+from classes.memoryAccounting import LeakTracker, MemoryAccountant
+from classes.resultStore import ColumnarSink, ResultStore
+from classes.sharedTemplates import SharedTemplates, run_sharded, shard, shard_key
+from classes.pipeline import BinarySink, CsvSink, EncounterSpec, JsonlSink, Sink, read_binary, run_encounter, simulate, stream, sweep
+from classes import templateStore
+from classes.coldStart import probe
+from classes.templateCompiler import TemplateValidationError, compile_templates, load_bundle, load_sources, validate
 
 class Creature:
     def __init__(self, name, level = 10, stats = {}):
@@ -31,9 +73,9 @@ class TestEffects(unittest.TestCase):
         self.assertEqual(effect.potency, 15)  # Assuming base potency is 7 and modifier is 2.0 with the stats modifier of the creature added
 
     def test_create_stat_modifier_effect(self):
-        effect = EffectFactory.create_effect("StatModifierEffect", "Strength Boost", source_type="creature", applier=self.creature, potency_modifier=1.0)
+        effect = EffectFactory.create_effect("StatModifierEffect", "StrengthBoost", source_type="creature", applier=self.creature, potency_modifier=1.0)
         self.assertIsNotNone(effect)
-        self.assertEqual(effect.name, "Strength Boost")
+        self.assertEqual(effect.name, "StrengthBoost")
         self.assertEqual(effect.duration, 3)
         self.assertEqual(effect.potency, 3)
         self.assertEqual(effect.stat_to_modify, "strength")
@@ -56,13 +98,13 @@ class TestAbility(unittest.TestCase):
         self.assertEqual(ability.description, template["description"])
         self.assertEqual(ability.base_power, template["power"])
         self.assertEqual(ability.cost, template["cost"])
-        self.assertEqual(ability.cost_type, template["cost_type"])
+        self.assertEqual(ability.cost_type, CostType.parse(template["cost_type"]))
         self.assertEqual(ability.max_cooldown, template["cooldown"])
-        self.assertEqual(ability.power_type, template["power_type"])
-        self.assertEqual(ability.target_type, template["target_type"])
+        self.assertEqual(ability.power_type, DamageType.parse(template["power_type"]))
+        self.assertEqual(ability.target_type, TargetType.parse(template["target_type"]))
         
         # Check effects
-        effect_template = ability.effects
+        effect_template = ability.effects[0]
         self.assertEqual(effect_template["effect_class"], "DamageOverTimeEffect")
         self.assertEqual(effect_template["effect_name"], "Burning")
 
@@ -74,13 +116,13 @@ class TestAbility(unittest.TestCase):
         self.assertEqual(ability.description, template["description"])
         self.assertEqual(ability.base_power, template.get("power", 0))
         self.assertEqual(ability.cost, template["cost"])
-        self.assertEqual(ability.cost_type, template["cost_type"])
+        self.assertEqual(ability.cost_type, CostType.parse(template["cost_type"]))
         self.assertEqual(ability.max_cooldown, template["cooldown"])
-        self.assertEqual(ability.power_type, template["power_type"])
-        self.assertEqual(ability.target_type, template["target_type"])
+        self.assertEqual(ability.power_type, DamageType.parse(template["power_type"]))
+        self.assertEqual(ability.target_type, TargetType.parse(template["target_type"]))
         
         # Check effects
-        effect_template = ability.effects
+        effect_template = ability.effects[0]
         self.assertEqual(effect_template["effect_class"], "HealOverTimeEffect")
         self.assertEqual(effect_template["effect_name"], "Regeneration")
 
@@ -92,13 +134,13 @@ class TestAbility(unittest.TestCase):
         self.assertEqual(ability.description, template["description"])
         self.assertEqual(ability.base_power, template.get("power", 0))
         self.assertEqual(ability.cost, template["cost"])
-        self.assertEqual(ability.cost_type, template["cost_type"])
+        self.assertEqual(ability.cost_type, CostType.parse(template["cost_type"]))
         self.assertEqual(ability.max_cooldown, template["cooldown"])
-        self.assertEqual(ability.power_type, template["power_type"])
-        self.assertEqual(ability.target_type, template["target_type"])
+        self.assertEqual(ability.power_type, DamageType.parse(template["power_type"]))
+        self.assertEqual(ability.target_type, TargetType.parse(template["target_type"]))
         
         # Check effects
-        effect_template = ability.effects
+        effect_template = ability.effects[0]
         self.assertEqual(effect_template["effect_class"], "StatModifierEffect")
         self.assertEqual(effect_template["effect_name"], "StrengthBoost")
 
@@ -161,5 +203,1518 @@ class TestItemCreation(unittest.TestCase):
         self.assertEqual(item.weight, 1)
 
 
+class TestSpawner(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+
+    def test_create_hero_resolves_equipment(self):
+        hero = Hero.create_hero("Jean Luc", "Warior", self.spawner.templates[Hero], self.spawner.ability_templates, self.spawner.item_templates)
+        self.assertEqual(hero.name, "Jean Luc")
+        self.assertEqual(hero.weaknesses, DamageType.MAGICAL)
+        self.assertEqual(hero.equipment_manager.equipped_items[EquipmentSlot.WEAPON].name, "Sword")
+        self.assertEqual(hero.equipment_manager.equipped_items[EquipmentSlot.CHEST].name, "Chainmail")
+        self.assertEqual(len(hero.inventory.items), 4)
+        self.assertEqual([ability.name for ability in hero.abilities], ["Fireball"])
+
+    def test_spawn_wave_with_variance(self):
+        goblins = self.spawner.spawn_monsters("Goblin", 500)
+        self.assertEqual(len(goblins), 500)
+        self.assertEqual(goblins[0].name, "Goblin 1")
+        for goblin in goblins:
+            self.assertTrue(25 <= goblin.max_hp <= 35)
+            self.assertEqual(goblin.hp, goblin.max_hp)
+            self.assertTrue(10 <= goblin.initiative <= 14)
+        # Clones share no mutable state
+        goblins[0].weaknesses |= DamageType.POISON
+        self.assertEqual(goblins[1].weaknesses, DamageType.FIRE)
+        self.assertIsNot(goblins[0].effect_manager, goblins[1].effect_manager)
+        self.assertIs(goblins[0].effect_manager.owner, goblins[0])
+
+    def test_spawned_heroes_have_own_inventory(self):
+        first, second = self.spawner.spawn_heroes("Mage", 2)
+        self.assertIsNot(first.inventory, second.inventory)
+        self.assertIsNot(first.abilities[0], second.abilities[0])
+        first.equipment_manager.unequip_item("head")
+        self.assertEqual(second.equipment_manager.equipped_items[EquipmentSlot.HEAD].name, "Crown")
+
+    def test_unknown_template(self):
+        self.assertEqual(self.spawner.spawn_monsters("Dragon", 3), [])
+
+
+class TestTemplateCompiler(unittest.TestCase):
+    def setUp(self):
+        self.templates = load_sources('./classes/templates')
+
+    def test_shipped_templates_are_valid(self):
+        self.assertEqual(validate(self.templates), [])
+
+    def test_detects_typos_and_broken_references(self):
+        self.templates["abilities"]["Fireball"]["effect_mutliplier"] = 0.5
+        self.templates["abilities"]["Fireball"]["effects"] = [{"effect_class": "StatModifierEffect", "effect_name": "Strength Boost"}]
+        self.templates["heroes"]["Warior"]["weaknessses"] = ["magical"]
+        self.templates["creatures"]["Goblin"]["drop_table"]["Cake"] = 0.1
+        errors = validate(self.templates)
+        self.assertIn("abilities: Fireball: unknown field 'effect_mutliplier' (did you mean 'effect_multiplier'?)", errors)
+        self.assertIn("abilities: Fireball: effects[0]: unknown StatModifierEffect 'Strength Boost' (did you mean 'StrengthBoost'?)", errors)
+        self.assertIn("heroes: Warior: unknown field 'weaknessses' (did you mean 'weaknesses'?)", errors)
+        self.assertIn("creatures: Goblin: drop_table references unknown item 'Cake'", errors)
+
+    def test_effects_must_be_a_list(self):
+        self.templates["abilities"]["Fireball"]["effects"] = {"effect_class": "DamageOverTimeEffect", "effect_name": "Burning"}
+        self.assertIn("abilities: Fireball: field 'effects' should be list, got dict", validate(self.templates))
+
+    def test_wrong_types_are_reported(self):
+        self.templates["heroes"]["Warior"]["max_attack"] = "5"
+        self.templates["heroes"]["Mage"]["resources"] = ["mana"]
+        self.templates["heroes"]["Mage"]["Weapon"] = ["Axe"]
+        self.templates["creatures"]["Goblin"]["abilities"] = [{"name": "Fireball"}]
+        self.templates["effects"]["DamageOverTimeEffect"] = []
+        self.templates["items"]["Armor"]["head"] = ["Helmet"]
+        self.templates["abilities"]["Fireball"]["effects"] = [{"effect_class": "HealOverTimeEffect", "effect_name": ["Regeneration"]}]
+        self.templates["progression"]["classes"]["Mage"]["curve"] = ["steep"]
+        errors = validate(self.templates)
+        self.assertIn("heroes: Warior: field 'max_attack' should be int, got str", errors)
+        self.assertIn("heroes: Mage: field 'resources' should be dict, got list", errors)
+        self.assertIn("heroes: Mage: field 'Weapon' should be str, got list", errors)
+        self.assertIn("effects: DamageOverTimeEffect: expected an object, got list", errors)
+        self.assertIn("items: Armor: head: expected an object, got list", errors)
+        self.assertIn("abilities: Fireball: effects[0]: field 'effect_name' should be str, got list", errors)
+        self.assertIn("progression: classes: Mage: field 'curve' should be str, got list", errors)
+
+    def test_compile_and_load_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bundle_path = os.path.join(tmp_dir, "templates.bundle")
+            compiled = compile_templates('./classes/templates', bundle_path)
+            bundle = load_bundle(bundle_path)
+        self.assertEqual(bundle["templates"], self.templates)
+        self.assertEqual(bundle["templates"], compiled["templates"])
+        self.assertEqual(bundle["index"]["items"]["Helmet"], ["Armor", "head"])
+
+    def test_invalid_templates_are_not_compiled(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file_name in os.listdir('./classes/templates'):
+                if file_name.endswith('.json'):
+                    shutil.copy(os.path.join('./classes/templates', file_name), tmp_dir)
+            with open(os.path.join(tmp_dir, "heroTemplate.json"), 'w') as file:
+                json.dump({"Warior": {"description": "no stats"}}, file)
+            with self.assertRaises(TemplateValidationError):
+                compile_templates(tmp_dir)
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, "templates.bundle")))
+
+
+class TestColdStart(unittest.TestCase):
+    def test_import_does_no_io(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = probe(cwd=tmp_dir)
+        self.assertEqual(report["opened"], [])
+        self.assertEqual(report["logging_handlers"], 0)
+
+    def test_templates_load_lazily_from_any_directory(self):
+        templateStore.clear()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                self.assertIn("Fireball", templateStore.get_templates("abilities"))
+                effect = EffectFactory.create_effect("DamageOverTimeEffect", "Poison", source_type="environment")
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(effect.duration, 5)
+
+    def test_stale_bundle_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file_name in os.listdir('./classes/templates'):
+                if file_name.endswith('.json'):
+                    shutil.copy(os.path.join('./classes/templates', file_name), tmp_dir)
+            compile_templates(tmp_dir)
+            templateStore.clear()
+            self.assertTrue(templateStore.load_bundle_if_fresh(tmp_dir))
+            with open(os.path.join(tmp_dir, "items.json"), 'a') as file:
+                file.write("\n")
+            templateStore.clear()
+            self.assertFalse(templateStore.load_bundle_if_fresh(tmp_dir))
+        templateStore.clear()
+
+
+class TestDamageDistribution(unittest.TestCase):
+    def test_dice_sum(self):
+        distribution = Distribution.dice(6, 2)
+        self.assertEqual(distribution.probability(7), Fraction(1, 6))
+        self.assertEqual(distribution.probability(2), Fraction(1, 36))
+        self.assertEqual(distribution.mass(), 1)
+        self.assertEqual(distribution.mean(), 7)
+
+    def test_attack_damage_applies_take_damage_rules(self):
+        attacker = Monster(min_attack=1, max_attack=10, damage_type='fire')
+        target = Hero(hp=50, defense=4, resistances=['fire'])
+        distribution = attack_damage(attacker, target)
+        # d20 faces 1 to 3 miss, 4 to 19 hit for int(roll * 0.5), 20 is critical for roll
+        self.assertEqual(distribution.probability(0), Fraction(3 * 10 + 16, 200))
+        self.assertEqual(distribution.probability(5), Fraction(16 + 1, 200))
+        self.assertEqual(distribution.probability(10), Fraction(1, 200))
+        self.assertEqual(distribution.mass(), 1)
+
+    def test_damage_over_time_ticks_while_effect_lasts(self):
+        attacker = Monster(min_attack=2, max_attack=2)
+        target = Hero(hp=50, defense=0)
+        burning = DamageOverTimeEffect("Burning", 2, 3, 'fire')
+        # A natural 1 misses, a natural 20 doubles the damage
+        self.assertEqual(damage_per_turn(attacker, target, [burning], turn=2).probabilities(),
+                         {3: Fraction(1, 20), 5: Fraction(18, 20), 7: Fraction(1, 20)})
+        self.assertEqual(damage_per_turn(attacker, target, [burning], turn=3).probabilities(),
+                         {0: Fraction(1, 20), 2: Fraction(18, 20), 4: Fraction(1, 20)})
+
+    def test_turns_to_kill_matches_enumeration(self):
+        attacker = Monster(min_attack=1, max_attack=6, damage_type='fire')
+        target = Hero(hp=9, defense=1, weaknesses=['fire'])
+        burning = DamageOverTimeEffect("Burning", 2, 2, 'fire')
+        distribution = turns_to_kill(attacker, target, [burning])
+
+        expected = {}
+        states = {9: Fraction(1)}
+        for turn in range(1, 6):
+            next_states = {}
+            for hp, probability in states.items():
+                for face, roll in itertools.product(range(1, 21), range(1, 7)):
+                    left = hp - target.compute_damage(roll * outcome(face, 0, target.defense), 'fire', "attack")
+                    if turn <= 2:
+                        left -= target.compute_damage(2, 'fire', "effect")
+                    if left <= 0:
+                        expected[turn] = expected.get(turn, 0) + probability / 120
+                    else:
+                        next_states[left] = next_states.get(left, 0) + probability / 120
+            states = next_states
+        for turn, probability in expected.items():
+            self.assertEqual(distribution.probability(turn), probability)
+
+        approximate = turns_to_kill(attacker, target, [burning], exact=False)
+        for turn, probability in approximate.items():
+            self.assertAlmostEqual(probability, float(distribution.probability(turn)))
+
+
+class TestEncounterSolver(unittest.TestCase):
+    def test_duel_matches_turns_to_kill(self):
+        hero = Hero(name="Hero", hp=30, defense=2, initiative=12, min_attack=1, max_attack=8)
+        monster = Monster(name="Monster", hp=25, defense=1, initiative=5, min_attack=2, max_attack=7)
+        outcome = EncounterSolver(CombatManager([hero], [monster])).solve()
+
+        # The hero acts first, it wins if it needs no more turns than the monster
+        hero_kills = turns_to_kill(hero, monster, max_turns=200)
+        monster_kills = turns_to_kill(monster, hero, max_turns=200)
+        expected = sum(hero_kills.probability(turn) * (1 - monster_kills.cdf(turn - 1)) for turn in range(1, 201))
+        self.assertAlmostEqual(outcome.win_probability, float(expected))
+        self.assertAlmostEqual(outcome.win_probability + outcome.loss_probability, 1.0)
+
+    def test_identical_combatants_are_collapsed(self):
+        heroes = [Hero(name="Hero", hp=20, defense=1, initiative=10, min_attack=2, max_attack=6)]
+        monsters = [Monster(name=f"Goblin {i}", hp=8, defense=0, initiative=5, min_attack=1, max_attack=3) for i in range(3)]
+        solver = EncounterSolver(CombatManager(heroes, monsters))
+        outcome = solver.solve()
+        self.assertEqual(solver.groups, [(1, 4)])
+        states = set(solver.transition_cache)
+        self.assertEqual(len(states), len({(state[0], tuple(sorted(state[1:]))) for state in states}))
+        self.assertAlmostEqual(outcome.win_probability + outcome.loss_probability, 1.0)
+
+    def test_stalemate_is_a_draw(self):
+        hero = Hero(hp=10, defense=20, min_attack=0, max_attack=0)
+        monster = Monster(hp=10, defense=20, min_attack=0, max_attack=0)
+        outcome = EncounterSolver(CombatManager([hero], [monster])).solve()
+        self.assertEqual(outcome.draw_probability, 1.0)
+        self.assertEqual(outcome.expected_rounds, float('inf'))
+
+    def test_abilities_and_damage_over_time(self):
+        spawner = Spawner.from_files('./classes/templates')
+        heroes = spawner.spawn_heroes("Mage", 1)
+        monsters = spawner.spawn_monsters("Goblin", 2)
+        outcome = EncounterSolver(CombatManager(heroes, monsters), hp_bucket=5).solve()
+        self.assertAlmostEqual(outcome.win_probability + outcome.loss_probability + outcome.draw_probability, 1.0)
+        self.assertGreater(outcome.expected_rounds, 1)
+
+    def test_self_heals_match_played_fights(self):
+        spawner = Spawner.from_files('./classes/templates')
+        mage = spawner.spawn_heroes("Mage")[0]
+        goblins = spawner.spawn_monsters("Goblin", 2)
+        for goblin, initiative in zip(goblins, (10, 14)):
+            goblin.hp = goblin.max_hp = 33
+            goblin.initiative, goblin.defense, goblin.min_attack, goblin.max_attack = initiative, 5, 4, 14
+        solver = EncounterSolver(CombatManager([mage.clone()], [goblin.clone() for goblin in goblins]))
+        outcome = solver.solve()
+        # Regeneration is modelled as a heal ability
+        hero_model = next(model for model in solver.models if model.side == 0)
+        self.assertEqual([ability[-1] for ability in hero_model.abilities], [False, True])
+        random.seed(1)
+        fights = 2000
+        wins = sum(
+            CombatManager([mage.clone()], [goblin.clone() for goblin in goblins], auto_heroes=True, max_rounds=200).start_combat() == "heroes"
+            for _ in range(fights)
+        )
+        self.assertAlmostEqual(outcome.win_probability, wins / fights, delta=0.03)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+        self.specs = lambda: sweep([["Warior"], ["Mage", "Warior"]], [["Goblin", "Goblin"], ["Orc"]], repeats=3)
+
+    def test_fights_are_reproducible(self):
+        spec = EncounterSpec(7, ["Mage"], ["Shaman", "Goblin"])
+        random.seed(3)
+        expected = random.random()
+        random.seed(3)
+        first = next(simulate([spec], self.spawner))
+        # The global generator is left as it was
+        self.assertEqual(random.random(), expected)
+        second = next(simulate([spec], self.spawner))
+        self.assertEqual(first, second)
+        self.assertIn(first["winner"], ("heroes", "monsters", "none"))
+        self.assertEqual(first["party"], "Mage")
+
+    def test_sinks_round_trip(self):
+        records = list(simulate(self.specs(), self.spawner))
+        self.assertEqual(len(records), 12)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with JsonlSink(os.path.join(tmp_dir, "results.jsonl")) as sink:
+                self.assertEqual(stream(iter(records), sink, batch_size=5), 12)
+            with open(os.path.join(tmp_dir, "results.jsonl")) as file:
+                self.assertEqual([json.loads(line) for line in file], records)
+
+            with CsvSink(os.path.join(tmp_dir, "results.csv")) as sink:
+                stream(iter(records), sink, batch_size=5, max_pending_batches=1)
+            with open(os.path.join(tmp_dir, "results.csv")) as file:
+                rows = list(csv.DictReader(file))
+            self.assertEqual([int(row["rounds"]) for row in rows], [record["rounds"] for record in records])
+
+            chunk_dir = os.path.join(tmp_dir, "chunks")
+            with BinarySink(chunk_dir, chunk_records=5) as sink:
+                stream(iter(records), sink, batch_size=4)
+            self.assertEqual(len(os.listdir(chunk_dir)), 3)
+            self.assertEqual(list(read_binary(chunk_dir)), records)
+
+    def test_memory_stays_bounded(self):
+        class CountingSink(Sink):
+            def __init__(self):
+                self.count = 0
+
+            def write_batch(self, records):
+                self.count += len(records)
+
+        records = ({"encounter_id": i, "rounds": i % 7} for i in range(200000))
+        sink = CountingSink()
+        tracemalloc.start()
+        stream(records, sink, batch_size=500, max_pending_batches=2)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertEqual(sink.count, 200000)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.records = [
+            {"encounter_id": i, "party": ["Warior", "Mage"][i % 2], "monster_types": ["Goblin", "Orc", "Shaman"][i % 3],
+             "win": int(i % 5 != 0), "rounds": i % 11}
+            for i in range(1000)
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_group_by_across_flushes(self):
+        store = ResultStore(self.tmp_dir.name, flush_rows=97)
+        store.append(self.records)
+        store.flush()
+
+        reopened = ResultStore(self.tmp_dir.name)
+        self.assertEqual(reopened.rows, 1000)
+        self.assertEqual(list(reopened.column("encounter_id")), list(range(1000)))
+        groups = reopened.group_by(["party", "monster_types"], "win")
+        for (party, monster_types), aggregate in groups.items():
+            expected = [r["win"] for r in self.records if r["party"] == party and r["monster_types"] == monster_types]
+            self.assertEqual(aggregate.count, len(expected))
+            self.assertAlmostEqual(aggregate.mean, sum(expected) / len(expected))
+        self.assertEqual(len(groups), 6)
+
+    def test_filter_and_percentiles(self):
+        store = ResultStore(self.tmp_dir.name)
+        store.append(self.records)
+        store.flush()
+        groups = store.group_by(["party"], "rounds", where={"monster_types": "Orc"}, chunk_rows=64)
+        rounds = sorted(r["rounds"] for r in self.records if r["party"] == "Mage" and r["monster_types"] == "Orc")
+        aggregate = groups[("Mage",)]
+        self.assertEqual(aggregate.count, len(rounds))
+        self.assertEqual(aggregate.percentile(50), rounds[(len(rounds) + 1) // 2 - 1])
+        self.assertEqual(aggregate.max, max(rounds))
+        self.assertEqual(store.group_by(["party"], "rounds", where={"monster_types": "Dragon"}), {})
+
+    def test_columnar_sink(self):
+        records = list(simulate(sweep([["Warior"]], [["Goblin"], ["Orc"]], repeats=5), Spawner.from_files('./classes/templates')))
+        with ColumnarSink(self.tmp_dir.name) as sink:
+            stream(iter(records), sink, batch_size=3)
+        store = ResultStore(self.tmp_dir.name)
+        groups = store.group_by(["monster_types"], "rounds")
+        self.assertEqual(groups[("Orc",)].count, 5)
+        self.assertEqual(groups[("Orc",)].sum, sum(r["rounds"] for r in records if r["monster_types"] == "Orc"))
+
+
+class TestBalanceTuner(unittest.TestCase):
+    def setUp(self):
+        self.templates = {kind: templateStore.load_json(kind, './classes/templates') for kind in templateStore.TEMPLATE_FILES}
+        self.parameters = [
+            Parameter("abilities", ("Fireball", "power"), 0, 60, 5),
+            Parameter("effects", ("DamageOverTimeEffect", "Burning", "potency"), 0, 10)
+        ]
+
+    def test_patch_templates(self):
+        patched = patch_templates(self.templates, self.parameters, (45, 7))
+        self.assertEqual(patched["abilities"]["Fireball"]["power"], 45)
+        self.assertEqual(patched["effects"]["DamageOverTimeEffect"]["Burning"]["potency"], 7)
+        self.assertEqual(self.templates["abilities"]["Fireball"]["power"], 30)
+        with self.assertRaises(KeyError):
+            Parameter("abilities", ("Fireball", "powr"), 0, 1).apply(patched, 1)
+
+    def test_evaluate_uses_patched_effects(self):
+        patched = patch_templates(self.templates, self.parameters, (0, 0))
+        with templateStore.override({"effects": {}}):
+            wins, fights, rounds = evaluate(patched, [(["Warior"], ["Orc"])], range(5))
+            self.assertEqual(templateStore.get_templates("effects"), {})
+        self.assertEqual(fights, 5)
+        self.assertEqual(evaluate(patched, [(["Warior"], ["Orc"])], range(5)), (wins, fights, rounds))
+
+    def test_successive_halving(self):
+        tuner = BalanceTuner(self.parameters, [(["Warior"], ["Orc", "Goblin"])], target_win_rate=0.5, templates=self.templates)
+        result = tuner.tune(candidates=9, min_fights=4, eta=3, max_fights=36)
+        self.assertEqual([len(rung) for rung in result.history], [9, 3, 1])
+        self.assertEqual(result.fights, 9 * 4 + 3 * 8 + 1 * 24)
+        self.assertEqual(result.best.fights, 36)
+        # Survivors of a rung are the best of the previous one
+        self.assertEqual([c.values for c in result.history[1]], [c.values for c in result.history[0][:3]])
+        self.assertEqual(result.templates["abilities"]["Fireball"]["power"], result.best.values[0])
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            write_templates(result.templates, tmp_dir, ["abilities", "effects"])
+            self.assertEqual(templateStore.load_json("abilities", tmp_dir), result.templates["abilities"])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+class TestActionQueue(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+        self.hero = self.spawner.spawn_heroes("Mage")[0]
+        self.monster = self.spawner.spawn_monsters("Orc")[0]
+        self.queue = ActionQueue([self.hero, self.monster])
+
+    def test_adapter_round_trip(self):
+        potion = Item.create_item("Consumable", "Health Potion", templateStore.load_json("items", './classes/templates'))
+        self.hero.inventory.add_item(potion)
+        actions = [
+            AbilityAction(self.hero, self.monster, self.hero.abilities[1]),
+            UseItemAction(self.hero, self.hero, potion),
+            AttackAction(self.monster, self.hero),
+            DefendAction(self.monster, None),
+            WaitAction(self.hero, None)
+        ]
+        for action in actions:
+            self.queue.push_action(action)
+        self.assertEqual(list(self.queue.opcodes), [ABILITY, USE_ITEM, ATTACK, DEFEND, 0])
+        self.assertEqual(list(self.queue.payloads[:2]), [1, len(self.hero.inventory.items) - 1])
+        for position, action in enumerate(actions):
+            decoded = self.queue.action(position)
+            self.assertIs(type(decoded), type(action))
+            self.assertEqual(encode_action(decoded), encode_action(action))
+
+    def test_failing_action_clears_the_queue(self):
+        defense = self.monster.defense
+        self.queue.push(DEFEND, self.monster)
+        self.queue.push(USE_ITEM, self.hero, self.hero, len(self.hero.inventory.items))
+        self.queue.push(ATTACK, self.hero, self.monster)
+        with self.assertRaises(IndexError):
+            self.queue.execute()
+        self.assertEqual(len(self.queue), 0)
+        # Nothing is replayed by the next pass
+        self.assertEqual(self.queue.execute(), [])
+        self.assertEqual(self.monster.defense, defense + max(defense // 2, 1))
+
+    def test_execute(self):
+        defense = self.monster.defense
+        mana = self.hero.resources[CostType.MANA]
+        self.queue.push(DEFEND, self.monster)
+        self.queue.push(ATTACK, self.hero, self.monster)
+        self.queue.push(ABILITY, self.hero, self.monster, 0)
+        results = self.queue.execute()
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(results[0], max(defense // 2, 1))
+        self.assertEqual(self.monster.defense, defense + results[0])
+        low, high = self.hero.min_attack, self.hero.max_attack
+        self.assertIn(results[1], {0, *range(low, high + 1), *range(2 * low, 2 * high + 1, 2)})
+        self.assertEqual(self.hero.resources[CostType.MANA], mana - self.hero.abilities[0].cost)
+        self.assertLess(self.monster.hp, self.monster.max_hp)
+        self.monster.update_turn()
+        self.assertEqual(self.monster.defense, defense)
+
+        # Dead performers are skipped
+        self.monster.is_alive = False
+        self.queue.push(ATTACK, self.monster, self.hero)
+        self.assertEqual(self.queue.execute(), [None])
+
+    def test_consumables(self):
+        items = templateStore.load_json("items", './classes/templates')
+        self.hero.hp = 10
+        self.hero.resources[CostType.MANA] = mana = 50
+        UseItemAction(self.hero, self.hero, Item.create_item("Consumable", "Health Potion", items)).execute()
+        UseItemAction(self.hero, self.hero, Item.create_item("Consumable", "Mana Potion", items)).execute()
+        self.assertEqual(self.hero.hp, 60)
+        self.assertEqual(self.hero.resources[CostType.MANA], mana + 30)
+
+    def test_batched_combat(self):
+        for seed in range(5):
+            random.seed(seed)
+            heroes = self.spawner.spawn_heroes("Warior", 3) + self.spawner.spawn_heroes("Mage", 3)
+            monsters = self.spawner.spawn_monsters("Orc", 5) + self.spawner.spawn_monsters("Goblin", 5)
+            combat_manager = CombatManager(heroes, monsters, auto_heroes=True, max_rounds=100, batched=True)
+            self.assertIsNotNone(combat_manager.start_combat())
+            self.assertTrue(combat_manager.is_combat_over())
+
+
+class TestEnums(unittest.TestCase):
+    def test_parse(self):
+        self.assertIs(DamageType.parse("fire"), DamageType.FIRE)
+        self.assertIs(CostType.parse("Mana"), CostType.MANA)
+        self.assertIs(TargetType.parse(TargetType.SELF), TargetType.SELF)
+        self.assertIsNone(CostType.parse(None))
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(CostType.parse("gold"))
+        self.assertEqual(f"{CostType.STAMINA}", "stamina")
+        self.assertEqual(DamageType.mask(["fire", "poison"]), DamageType.FIRE | DamageType.POISON)
+        self.assertIs(type(DamageType.mask(["fire"])), int)
+
+    def test_multipliers_use_masks(self):
+        creature = Monster(resistances=["fire", "physical"], weaknesses=["fire", "poison"])
+        self.assertEqual(creature.mutlitply_power(DamageType.FIRE), 1.0)
+        self.assertEqual(creature.mutlitply_power(DamageType.PHYSICAL), 0.5)
+        self.assertEqual(creature.mutlitply_power(DamageType.POISON), 1.5)
+        self.assertEqual(creature.mutlitply_power(DamageType.MAGICAL), 1.0)
+        self.assertEqual(creature.mutlitply_power("poison"), 1.5)
+        self.assertEqual(creature.mutlitply_power(None), 1.0)
+
+    def test_templates_are_converted(self):
+        spawner = Spawner.from_files('./classes/templates')
+        mage = spawner.spawn_heroes("Mage")[0]
+        self.assertIs(mage.damage_type, DamageType.MAGICAL)
+        self.assertIs(mage.abilities[1].target_type, TargetType.SELF)
+        self.assertEqual(set(mage.equipment_manager.equipped_items), set(EquipmentSlot))
+        mage.equipment_manager.unequip_item("head")
+        self.assertIsNone(mage.equipment_manager.equipped_items[EquipmentSlot.HEAD])
+
+    def test_compiler_checks_enum_values(self):
+        templates = load_sources('./classes/templates')
+        templates["heroes"]["Mage"]["resistances"] = ["magical", "holy"]
+        templates["abilities"]["Fireball"]["cost_type"] = "gold"
+        errors = validate(templates)
+        self.assertIn("heroes: Mage: field 'resistances' has unknown value 'holy' (expected one of physical, magical, fire, poison)", errors)
+        self.assertIn("abilities: Fireball: field 'cost_type' has unknown value 'gold' (expected one of mana, stamina, rage, energy)", errors)
+
+
+class TestResources(unittest.TestCase):
+    def test_pool_regenerates_in_one_pass(self):
+        pool = ResourcePool()
+        mana = pool.allocate(50, 100, 10)
+        full = pool.allocate(95, 100, 10)
+        rage = pool.allocate(3, 100, -5)
+        pool.regenerate()
+        self.assertEqual(list(pool.current), [60, 100, 0])
+        pool.release(full)
+        self.assertEqual(pool.allocate(120, 100), full)
+        self.assertEqual(pool.current[full], 100)
+        self.assertEqual(len(pool), 3)
+        self.assertEqual(pool.current[mana], 60)
+        pool.release(rage)
+        self.assertEqual(pool.draining, 0)
+
+    def test_resources_mapping(self):
+        pool = ResourcePool()
+        spec = resource_spec({"mana": {"max": 120, "regen": 5}, "rage": {"max": 50, "start": 0}})
+        resources = Resources(spec, pool)
+        self.assertEqual(dict(resources), {CostType.MANA: 120, CostType.STAMINA: 100, CostType.RAGE: 0})
+        self.assertEqual(resources.get(CostType.ENERGY, 0), 0)
+        self.assertEqual(resources["mana"], 120)
+        self.assertTrue(resources.spend(CostType.MANA, 100))
+        self.assertFalse(resources.spend(CostType.MANA, 100))
+        resources[CostType.RAGE] = 80
+        self.assertEqual(resources[CostType.RAGE], 50)
+
+        clone = resources.copy()
+        clone[CostType.MANA] = 0
+        self.assertEqual(resources[CostType.MANA], 20)
+        del clone
+        self.assertEqual(len(pool), 3)
+
+        other = ResourcePool()
+        resources.move_to(other)
+        self.assertEqual((len(pool), len(other)), (0, 3))
+        self.assertEqual(resources.cap(CostType.MANA), 120)
+        self.assertEqual(resources.regen(CostType.MANA), 5)
+
+    def test_regeneration_each_round(self):
+        spawner = Spawner.from_files('./classes/templates')
+        mage = spawner.spawn_heroes("Mage")[0]
+        self.assertEqual(mage.resources.regen(CostType.MANA), 5)
+        goblin = spawner.spawn_monsters("Goblin")[0]
+        goblin.hp = goblin.max_hp = 1000
+        combat_manager = CombatManager([mage], [goblin], auto_heroes=True, max_rounds=1)
+        self.assertIs(mage.resources.pool, combat_manager.resource_pool)
+        combat_manager.start_combat()
+        self.assertEqual(mage.resources[CostType.MANA], 100 - mage.abilities[0].cost + 5)
+
+    def test_unknown_names_are_rejected(self):
+        resources = Resources(pool=ResourcePool())
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(KeyError):
+                resources["manna"] = 5
+            with self.assertRaises(KeyError):
+                resources.configure("manna", cap=10)
+            self.assertNotIn("manna", resources)
+        with self.assertRaises(KeyError):
+            resources[None] = 5
+        self.assertEqual(set(resources), {CostType.MANA, CostType.STAMINA})
+
+    def test_dead_creatures_do_not_regenerate(self):
+        spawner = Spawner.from_files('./classes/templates')
+        mage = spawner.spawn_heroes("Mage")[0]
+        mage.resources[CostType.MANA] = 50
+        combat_manager = CombatManager([mage], spawner.spawn_monsters("Goblin"))
+        mage.take_damage(1000)
+        self.assertTrue(mage.resources.paused)
+        combat_manager.end_round()
+        self.assertEqual(mage.resources[CostType.MANA], 50)
+        # The regeneration is kept, and copies stay paused
+        self.assertEqual(mage.resources.spec()[CostType.MANA], (50, 100, 5))
+        clone = mage.clone()
+        again = CombatManager([clone], spawner.spawn_monsters("Goblin"))
+        again.end_round()
+        self.assertEqual(clone.resources[CostType.MANA], 50)
+        clone.resources.resume()
+        again.end_round()
+        self.assertEqual(clone.resources[CostType.MANA], 55)
+
+    def test_solver_models_regeneration(self):
+        hero = Hero(name="Hero", hp=40, defense=0, initiative=10, min_attack=1, max_attack=1,
+                    abilities=[Ability("Bolt", "", power=10, cost=10, cooldown=0)],
+                    resources={CostType.MANA: (10, 10, 5)})
+        monster = Monster(name="Monster", hp=30, defense=0, initiative=5, min_attack=1, max_attack=1)
+        random.seed(0)
+        combat_manager = CombatManager([hero], [monster], max_rounds=10, auto_heroes=True)
+        solver = EncounterSolver(combat_manager)
+        outcome = solver.solve()
+        rounds = combat_manager.start_combat() and combat_manager.round
+        # Bolt every other round: 10, 1, 10, 1, 10 damage
+        self.assertEqual(rounds, 5)
+        self.assertAlmostEqual(outcome.win_probability, 1.0)
+        self.assertAlmostEqual(outcome.expected_rounds, 5)
+
+
+class TestSharedTemplates(unittest.TestCase):
+    def setUp(self):
+        self.templates = {kind: templateStore.get_templates(kind) for kind in templateStore.TEMPLATE_FILES}
+
+    def test_publish_and_attach(self):
+        with SharedTemplates.publish(self.templates) as shared:
+            attached = SharedTemplates.attach(shared.name)
+            try:
+                self.assertFalse(attached.owner)
+                abilities = attached.kinds["abilities"]
+                self.assertEqual(abilities.decoded, {})
+                self.assertEqual(abilities["Fireball"], self.templates["abilities"]["Fireball"])
+                self.assertEqual(list(abilities.decoded), ["Fireball"])
+                for kind, entries in self.templates.items():
+                    self.assertEqual(dict(attached.kinds[kind]), entries)
+                with self.assertRaises(TypeError):
+                    attached.buffer[0] = 0
+            finally:
+                attached.close()
+
+    def test_shards_are_stable(self):
+        spec = EncounterSpec(0, ["Warior", "Mage"], ["Orc"])
+        self.assertEqual(shard_key(spec), "Mage+Warior|Orc")
+        self.assertEqual(shard_key(spec), shard_key(EncounterSpec(1, ["Mage", "Warior"], ["Orc"])))
+        self.assertEqual(shard("Mage+Warior|Orc", 4), shard("Mage+Warior|Orc", 4))
+        self.assertTrue(all(0 <= shard(str(i), 3) < 3 for i in range(100)))
+
+    def test_sharded_matches_serial(self):
+        specs = lambda: sweep([["Warior"], ["Mage", "Warior"]], [["Goblin", "Goblin"], ["Orc"]], repeats=5)
+        sharded = sorted(run_sharded(specs(), workers=2, chunk_size=3), key=lambda record: record["encounter_id"])
+        self.assertEqual(sharded, list(simulate(specs(), Spawner.from_files('./classes/templates'))))
+
+
+class TestTemplateReload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for file_name in os.listdir('./classes/templates'):
+            if file_name.endswith('.json'):
+                shutil.copy(os.path.join('./classes/templates', file_name), self.tmp_dir)
+        templateStore.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        templateStore.clear()
+
+    def write_effects(self, content):
+        with open(os.path.join(self.tmp_dir, "effectsTemplates.json"), 'w') as file:
+            file.write(content)
+
+    def test_fights_keep_their_snapshot(self):
+        first = templateStore.reload(self.tmp_dir)
+        self.assertIs(templateStore.snapshot(), first)
+        self.assertIs(templateStore.reload(self.tmp_dir), first)
+        spawner = Spawner.from_snapshot(first)
+        combat_manager = CombatManager(spawner.spawn_heroes("Mage"), spawner.spawn_monsters("Goblin"), auto_heroes=True)
+        self.assertIs(combat_manager.templates, first)
+
+        effects = templateStore.load_json("effects", self.tmp_dir)
+        effects["DamageOverTimeEffect"]["Poison"]["duration"] = 12
+        self.write_effects(json.dumps(effects, indent=2))
+        second = templateStore.reload(self.tmp_dir)
+        self.assertGreater(second.version, first.version)
+        self.assertIs(templateStore.snapshot(), second)
+        self.assertIs(second["abilities"], first["abilities"])
+        with combat_manager.templates.activate():
+            self.assertIs(templateStore.snapshot(), first)
+            self.assertEqual(EffectFactory.create_effect("DamageOverTimeEffect", "Poison", source_type="environment").duration, 5)
+        with second.activate():
+            self.assertEqual(EffectFactory.create_effect("DamageOverTimeEffect", "Poison", source_type="environment").duration, 12)
+        with self.assertRaises(TypeError):
+            second["effects"]["DamageOverTimeEffect"] = {}
+
+        combat_manager.start_combat()
+        self.assertIn(first.version, templateStore.live_versions())
+        del combat_manager, spawner, first
+        gc.collect()
+        self.assertEqual(templateStore.live_versions(), [second.version])
+
+    def test_invalid_reload_keeps_current(self):
+        current = templateStore.reload(self.tmp_dir)
+        self.write_effects("{not json")
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(templateStore.reload(self.tmp_dir))
+        self.assertIs(templateStore.snapshot(), current)
+
+    def test_wrong_typed_value_keeps_current(self):
+        current = templateStore.reload(self.tmp_dir)
+        heroes = templateStore.load_json("heroes", self.tmp_dir)
+        heroes["Warior"]["max_attack"] = "5"
+        with open(os.path.join(self.tmp_dir, "heroTemplate.json"), 'w') as file:
+            json.dump(heroes, file)
+        with self.assertLogs(level="ERROR") as logs:
+            self.assertIsNone(templateStore.reload(self.tmp_dir))
+        self.assertIn("heroes: Warior: field 'max_attack' should be int, got str", "\n".join(logs.output))
+        self.assertIs(templateStore.snapshot(), current)
+        # The watcher survives a reload that fails and tries again
+        calls = []
+
+        def failing_reload(template_dir):
+            calls.append(template_dir)
+            if len(calls) == 1:
+                raise RuntimeError("bad save")
+
+        with mock.patch.object(templateStore, "reload", failing_reload), self.assertLogs(level="ERROR"):
+            watcher = templateStore.TemplateWatcher(self.tmp_dir, interval=0.01)
+            watcher.thread.start()
+            for _ in range(500):
+                if len(calls) > 1:
+                    break
+                time.sleep(0.01)
+            watcher.stop()
+        self.assertGreater(len(calls), 1)
+
+    def test_override_snapshot(self):
+        patched = {"abilities": {"Fireball": dict(templateStore.get_templates("abilities")["Fireball"], power=1)}}
+        before = templateStore.snapshot()
+        with templateStore.override(patched):
+            self.assertEqual(templateStore.snapshot()["abilities"]["Fireball"]["power"], 1)
+        self.assertIs(templateStore.snapshot(), before)
+
+
+class TestMemoryAccounting(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+
+    def test_report_per_subsystem(self):
+        with MemoryAccountant() as accountant:
+            templateStore.clear()
+            templateStore.get_templates("items")
+            heroes = self.spawner.spawn_heroes("Mage", count=50)
+            report = accountant.report()
+        templateStore.clear()
+        self.assertEqual(set(report), {"creatures", "effects", "inventories", "templates", "other"})
+        self.assertGreaterEqual(report["creatures"].objects, 50)
+        self.assertGreaterEqual(report["inventories"].objects, 50)
+        self.assertGreater(report["creatures"].bytes, 0)
+        self.assertGreater(report["templates"].bytes, 0)
+        del heroes
+
+    def test_creatures_are_freed_without_the_garbage_collector(self):
+        tracker = LeakTracker()
+        gc.disable()
+        try:
+            combat_manager = run_encounter(EncounterSpec(0, ["Mage"], ["Shaman"]), self.spawner)
+            tracker.track_encounter("first", combat_manager)
+            self.assertGreater(len(tracker), 4)
+            del combat_manager
+            self.assertEqual(tracker.leaks(collect=False), [])
+        finally:
+            gc.enable()
+
+    def test_objects_alive_after_their_encounter_are_flagged(self):
+        tracker = LeakTracker()
+        combat_manager = run_encounter(EncounterSpec(0, ["Warior"], ["Goblin"]), self.spawner)
+        tracker.track_encounter("first", combat_manager)
+        kept = combat_manager.heroes[0]
+        del combat_manager
+        leaks = tracker.leaks()
+        self.assertEqual({leak.kind for leak in leaks}, {"Hero", "EffectManager", "Inventory", "EquipmentManager"})
+        self.assertTrue(all(leak.encounter == "first" for leak in leaks))
+        self.assertEqual(tracker.summary()["Hero"], 1)
+        del kept
+        self.assertEqual(tracker.leaks(), [])
+
+
+class TestMassCombat(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+        random.seed(3)
+
+    def test_live_counts_follow_deaths(self):
+        goblins = self.spawner.spawn_monsters("Goblin", count=3)
+        orcs = self.spawner.spawn_monsters("Orc", count=2)
+        combat_manager = MassCombatManager({"goblins": goblins, "orcs": orcs})
+        self.assertEqual(combat_manager.alive, [3, 2])
+        self.assertFalse(combat_manager.is_combat_over())
+        orcs[0].take_damage(10000)
+        orcs[0].take_damage(10000)
+        self.assertEqual(combat_manager.alive, [3, 1])
+        orcs[1].take_damage(10000)
+        self.assertTrue(combat_manager.is_combat_over())
+        self.assertEqual(combat_manager.winner(), "goblins")
+
+    def test_three_factions(self):
+        factions = {
+            "warriors": self.spawner.spawn_heroes("Warior", count=20),
+            "goblins": self.spawner.spawn_monsters("Goblin", count=30),
+            "orcs": self.spawner.spawn_monsters("Orc", count=20)
+        }
+        combat_manager = MassCombatManager(factions, max_rounds=200)
+        winner = combat_manager.start_combat()
+        self.assertIn(winner, factions)
+        for name, creatures in factions.items():
+            self.assertEqual(any(creature.is_alive for creature in creatures), name == winner)
+        self.assertLessEqual(combat_manager.dead_in_turn_order * 2, len(combat_manager.turn_order))
+        self.assertLess(len(combat_manager.turn_order), 70)
+        self.assertTrue(all(creature.on_death is None for creatures in factions.values() for creature in creatures))
+
+    def test_from_sides(self):
+        heroes = self.spawner.spawn_heroes("Warior", count=50)
+        monsters = self.spawner.spawn_monsters("Goblin", count=50)
+        self.assertEqual(MassCombatManager.from_sides(heroes, monsters).start_combat(), "heroes")
+
+
+class TestAttackResolution(unittest.TestCase):
+    def test_natural_rolls(self):
+        self.assertEqual(outcome(1, 100, 0), MISS)
+        self.assertEqual(outcome(20, -100, 50), CRITICAL)
+        self.assertEqual(outcome(12, 3, 15), HIT)
+        self.assertEqual(outcome(11, 3, 15), MISS)
+
+    def test_tables_follow_the_rule(self):
+        for attack_bonus, defense in itertools.product(range(-3, 8), range(0, 25)):
+            table = outcome_table(attack_bonus, defense)
+            self.assertEqual(list(table), [outcome(roll, attack_bonus, defense) for roll in range(1, 21)])
+        self.assertEqual(outcome_counts(0, 10), (9, 10, 1))
+        self.assertEqual(outcome_counts(0, 40), (19, 0, 1))
+
+    def test_resolution_frequencies(self):
+        random.seed(5)
+        attacker = Monster(min_attack=2, max_attack=5, attack_bonus=2)
+        target = Hero(defense=12)
+        results = [resolve_attack(attacker, target) for _ in range(20000)]
+        misses, hits, criticals = outcome_counts(2, 12)
+        for result, faces in ((MISS, misses), (HIT, hits), (CRITICAL, criticals)):
+            self.assertAlmostEqual(sum(1 for r, _ in results if r == result) / len(results), faces / 20, delta=0.015)
+        for result, damage in results:
+            if result == MISS:
+                self.assertEqual(damage, 0)
+            else:
+                self.assertIn(damage // result, range(2, 6))
+                self.assertEqual(damage % result, 0)
+
+    def test_hits_ignore_flat_defense_reduction(self):
+        attacker = Monster(min_attack=6, max_attack=6, attack_bonus=30)
+        target = Hero(hp=50, defense=10)
+        random.seed(1)
+        damage = AttackAction(attacker, target).execute()
+        self.assertIn(damage, (0, 6, 12))
+        self.assertEqual(target.hp, 50 - damage)
+
+
+class TestChangeTracking(unittest.TestCase):
+    def setUp(self):
+        spawner = Spawner.from_files('./classes/templates')
+        self.hero = spawner.spawn_heroes("Mage")[0]
+        self.goblins = spawner.spawn_monsters("Goblin", count=2)
+        self.goblin = self.goblins[0]
+        self.tracker = DeltaTracker([self.hero] + self.goblins)
+
+    def test_clones_get_their_own_uid(self):
+        self.assertEqual(len({self.hero.uid, self.goblins[0].uid, self.goblins[1].uid}), 3)
+
+    def test_only_tracked_attributes_are_marked(self):
+        self.goblin.dirty = 0
+        self.goblin.defense += 1
+        self.assertEqual(self.goblin.dirty, 0)
+        self.goblin.hp -= 1
+        self.assertEqual((self.goblin.dirty, vars(self.goblin)["hp"]), (HP, self.goblin.hp))
+        # Effects of a manager whose creature is gone are kept without marking it
+        manager = EffectManager(Monster())
+        gc.collect()
+        manager.add_effect(DamageOverTimeEffect("Burning", 2, 1, 'fire'))
+        manager.remove_effect(manager.active_effects[0])
+        self.assertEqual(manager.active_effects, [])
+
+    def test_only_changes_are_delivered(self):
+        subscription = self.tracker.subscribe()
+        first = subscription.poll()
+        self.assertEqual(len(first), 1)
+        self.assertEqual(set(first[0]["creatures"]), {self.hero.uid, self.goblin.uid, self.goblins[1].uid})
+        self.assertEqual(first[0]["creatures"][self.hero.uid]["resources"]["mana"], 100)
+
+        self.assertEqual(self.tracker.tick(), {})
+        self.assertEqual(subscription.poll(), [])
+
+        self.goblin.take_damage(5, source="effect")
+        self.tracker.tick()
+        deltas = subscription.poll()
+        self.assertEqual(deltas, [{"tick": 2, "creatures": {self.goblin.uid: {"hp": self.goblin.hp, "max_hp": self.goblin.max_hp, "alive": True}}}])
+
+        fireball = self.hero.abilities[0]
+        fireball.use(self.hero, self.goblin)
+        changes = self.tracker.tick()
+        self.assertEqual(set(changes), {self.hero.uid, self.goblin.uid})
+        self.assertEqual(changes[self.hero.uid], {"resources": {"mana": 100 - fireball.cost}, "cooldowns": [fireball.max_cooldown, 0]})
+        self.assertEqual(changes[self.goblin.uid]["effects"], [["Burning", self.goblin.effect_manager.active_effects[0].duration]])
+        self.assertIn("hp", changes[self.goblin.uid])
+        self.assertEqual(self.tracker.tick(), {})
+
+    def test_filtered_subscriptions(self):
+        received = []
+        subscription = self.tracker.subscribe([self.goblin], fields=HP, callback=received.append)
+        self.assertEqual(set(received[0]["creatures"][self.goblin.uid]), {"name", "hp", "max_hp", "alive"})
+        self.hero.take_damage(5, source="effect")
+        self.goblins[1].take_damage(5, source="effect")
+        self.tracker.tick()
+        self.assertEqual(len(received), 1)
+        self.goblin.effect_manager.add_effect(EffectFactory.create_effect("DamageOverTimeEffect", "Poison", source_type="environment"))
+        self.goblin.is_alive = False
+        self.tracker.tick()
+        self.assertEqual(received[-1]["creatures"], {self.goblin.uid: {"hp": self.goblin.hp, "max_hp": self.goblin.max_hp, "alive": False}})
+        subscription.close()
+        self.goblin.hp = 1
+        self.tracker.tick()
+        self.assertEqual(len(received), 2)
+        self.assertEqual(encode({"tick": 1}), b'{"tick":1}')
+
+    def test_equipment_and_cooldowns(self):
+        self.hero.equipment_manager.unequip_item("weapon")
+        self.hero.update_turn()
+        changes = self.tracker.tick()[self.hero.uid]
+        self.assertEqual(list(changes), ["equipment"])
+        self.assertIsNone(changes["equipment"]["weapon"])
+        self.hero.dirty |= COOLDOWNS | EFFECTS
+        changes = self.tracker.tick()[self.hero.uid]
+        self.assertEqual(changes["cooldowns"], [ability.current_cooldown for ability in self.hero.abilities])
+        self.assertEqual(changes["effects"], [])
+
+
+class TestGameServer(unittest.TestCase):
+    def setUp(self):
+        self.server = GameServer(max_joins=1)
+        self.connection = Connection(1, None)
+
+    def replies(self):
+        replies = [json.loads(line) for line in b"".join(self.connection.outbox).splitlines()]
+        self.connection.outbox.clear()
+        return replies
+
+    def join(self):
+        self.server.inbox.append((self.connection, {"op": "join", "party": ["Mage"], "monsters": ["Goblin", "Goblin"]}))
+        self.server.tick()
+        return self.replies()[0]
+
+    def test_commands_are_played_at_the_next_tick(self):
+        joined = self.join()
+        self.assertEqual(joined["op"], "joined")
+        hero, abilities = joined["heroes"][0][0], joined["heroes"][0][2]
+        goblin = joined["monsters"][0][0]
+        self.assertIn("Fireball", abilities)
+        command = {"op": "act", "encounter": joined["encounter"], "hero": hero, "action": "ability", "ability": abilities.index("Fireball"), "target": goblin}
+        self.server.inbox.append((self.connection, command))
+        self.assertEqual(self.replies(), [])
+        self.server.tick()
+        reply = self.replies()[0]
+        self.assertEqual(reply["op"], "round")
+        self.assertEqual(reply["round"], 1)
+        self.assertIn(str(hero), reply["changes"])
+        # Fireball is now on cooldown
+        self.server.inbox.append((self.connection, dict(command, id=7)))
+        self.server.tick()
+        error = self.replies()[0]
+        self.assertEqual((error["op"], error["id"]), ("error", 7))
+
+    def test_invalid_commands_are_rejected(self):
+        joined = self.join()
+        hero = joined["heroes"][0][0]
+        for message in (
+            {"op": "act", "encounter": 999, "hero": hero},
+            {"op": "act", "encounter": joined["encounter"], "hero": hero, "target": hero},
+            {"op": "act", "encounter": joined["encounter"], "hero": hero, "action": "dance"},
+            {"op": "join", "party": ["Nobody"], "monsters": ["Goblin"]},
+            {"op": "fly"},
+            [],
+            # Unhashable values used to escape the tick and stop the server
+            {"op": "act", "encounter": joined["encounter"], "hero": [hero]},
+            {"op": "act", "encounter": joined["encounter"], "hero": hero, "target": {"uid": hero}},
+            {"op": "act", "encounter": [joined["encounter"]], "hero": hero},
+            {"op": ["act"]}
+        ):
+            self.server.inbox.append((self.connection, message))
+        self.server.tick()
+        self.assertEqual([reply["op"] for reply in self.replies()], ["error"] * 10)
+        self.assertEqual(len(self.server.encounters), 1)
+
+    def test_failing_command_does_not_stop_the_tick(self):
+        def fail(connection, message):
+            raise RuntimeError("bug")
+        self.server.handlers["fail"] = fail
+        for message in ({"op": "fail", "id": 7}, {"op": "stats"}):
+            self.server.inbox.append((self.connection, message))
+        with self.assertLogs(level="ERROR"):
+            self.server.tick()
+        replies = self.replies()
+        self.assertEqual([reply["op"] for reply in replies], ["error", "stats"])
+        self.assertEqual(replies[0]["id"], 7)
+
+    def test_joins_past_the_limit_wait(self):
+        for _ in range(2):
+            self.server.inbox.append((self.connection, {"op": "join", "party": ["Mage"], "monsters": ["Goblin"]}))
+        self.server.inbox.append((self.connection, {"op": "stats"}))
+        self.server.tick()
+        self.assertEqual([reply["op"] for reply in self.replies()], ["joined"])
+        self.server.tick()
+        self.assertEqual([reply["op"] for reply in self.replies()], ["joined", "stats"])
+
+    def test_work_past_the_budget_waits(self):
+        server = GameServer(budget=0)
+        other = Connection(2, None)
+        for connection in (self.connection, self.connection, other):
+            server.inbox.append((connection, {"op": "join", "party": ["Warior"], "monsters": ["Goblin"]}))
+        server.tick()
+        # The whole batch of the first connection is handled, the other one waits
+        joined = self.replies()
+        self.assertEqual([reply["op"] for reply in joined], ["joined", "joined"])
+        self.assertEqual(other.outbox, [])
+        server.tick()
+        self.assertEqual(len(other.outbox), 1)
+        for reply in joined:
+            server.inbox.append((self.connection, {"op": "act", "encounter": reply["encounter"], "hero": reply["heroes"][0][0], "target": reply["monsters"][0][0]}))
+        server.tick()
+        self.assertEqual([(reply["op"], reply["encounter"]) for reply in self.replies()], [("round", joined[0]["encounter"])])
+        self.assertEqual(server.stats()["waiting"], 1)
+        server.tick()
+        self.assertEqual([(reply["op"], reply["encounter"]) for reply in self.replies()], [("round", joined[1]["encounter"])])
+        self.assertEqual(server.stats()["waiting"], 0)
+
+    def test_load_test(self):
+        async def run():
+            server = await GameServer(tick_rate=50).start()
+            try:
+                return await load_test("127.0.0.1", server.port, clients=10, duration=0.5, party=["Warior", "Mage"])
+            finally:
+                await server.stop()
+        report = asyncio.run(run())
+        self.assertGreater(report["rounds"], 0)
+        self.assertEqual(report["errors"], 0)
+        self.assertEqual(report["server"]["connections"], 1)
+
+
+class TestThreat(unittest.TestCase):
+    def setUp(self):
+        spawner = Spawner.from_files('./classes/templates')
+        self.heroes = spawner.spawn_heroes("Warior", count=2) + spawner.spawn_heroes("Mage")
+        self.goblins = spawner.spawn_monsters("Goblin", count=3)
+
+    def test_indexed_heap(self):
+        rng = random.Random(3)
+        heap, reference = IndexedHeap(), {}
+        for _ in range(2000):
+            key = rng.randrange(100)
+            if key in heap and rng.random() < 0.3:
+                self.assertEqual(heap.remove(key), reference.pop(key))
+            else:
+                amount = rng.randrange(-5, 10)
+                heap.add(key, amount)
+                reference[key] = reference.get(key, 0) + amount
+            self.assertEqual(heap.peek()[1] if heap else None, max(reference.values(), default=None))
+        self.assertTrue(all(heap.index[key] == position for position, key in enumerate(heap.keys)))
+        expected = sorted(reference.values(), reverse=True)
+        self.assertEqual([priority for _, priority in heap.top(10)], expected[:10])
+        self.assertEqual(heap.top(0), [])
+        self.assertEqual(heap.pop()[1], expected[0])
+        self.assertEqual(len(heap), len(reference) - 1)
+
+    def test_threat_decays(self):
+        table = ThreatTable(decay=0.5)
+        first, second = self.heroes[:2]
+        table.add(first, 10)
+        table.end_turn()
+        self.assertAlmostEqual(table.threat(first), 5)
+        table.add(second, 6)
+        self.assertIs(table.target(), second)
+        for _ in range(60):
+            table.end_turn()
+        # Rescaled on the way, the order is kept
+        self.assertLess(table.scale, 1e12)
+        self.assertIs(table.target(), second)
+        self.assertAlmostEqual(table.threat(second) / table.threat(first), 6 / 5)
+        second.is_alive = False
+        self.assertIs(table.target(), first)
+        self.assertEqual(len(table), 1)
+
+    def test_damage_and_heals_generate_threat(self):
+        board = ThreatBoard(self.goblins, self.heroes)
+        warrior, other, mage = self.heroes
+        goblin = self.goblins[0]
+        self.assertIsNone(board.target(goblin))
+        goblin.take_damage(2, source="effect", attacker=warrior)
+        # Area damage: one pending entry per (monster, source)
+        for _ in range(3):
+            for monster in self.goblins:
+                monster.take_damage(1, source="effect", attacker=other)
+        self.assertEqual(len(board.pending), 4)
+        self.assertIs(board.target(goblin), other)
+        self.assertEqual([hero for hero, _ in board.top(goblin, 2)], [other, warrior])
+        warrior.hp -= 20
+        warrior.heal(20, healer=mage)
+        self.assertIs(board.target(goblin), mage)
+        self.assertAlmostEqual(board.table(self.goblins[1]).threat(mage), 10)
+        # Monsters healing each other and overheals generate no threat
+        goblin.heal(5, healer=self.goblins[1])
+        mage.heal(50, healer=mage)
+        self.assertEqual(board.pending, {})
+        board.release()
+        goblin.take_damage(3, source="effect", attacker=warrior)
+        self.assertEqual(board.pending, {})
+
+    def test_effects_generate_threat_for_their_applier(self):
+        board = ThreatBoard(self.goblins, self.heroes)
+        warrior, other, mage = self.heroes
+        goblin = self.goblins[0]
+        burning = EffectFactory.create_effect("DamageOverTimeEffect", "Burning", "creature", applier=other)
+        goblin.effect_manager.add_effect(burning)
+        goblin.update_turn()
+        self.assertIs(burning.applier, other)
+        self.assertIs(board.target(goblin), other)
+        warrior.hp -= 20
+        regeneration = EffectFactory.create_effect("HealOverTimeEffect", "Regeneration", "creature", applier=mage)
+        warrior.effect_manager.add_effect(regeneration)
+        warrior.update_turn()
+        self.assertGreater(board.table(self.goblins[1]).threat(mage), 0)
+        # Effects of the environment have no applier
+        self.assertIsNone(EffectFactory.create_effect("DamageOverTimeEffect", "Burning", "environment").applier)
+
+    def test_monsters_attack_the_highest_threat(self):
+        combat_manager = CombatManager(self.heroes, self.goblins, auto_heroes=True, batched=True, threat=True)
+        mage = self.heroes[2]
+        combat_manager.threat.add_threat(self.goblins, mage, 1000)
+        combat_manager.queue_round()
+        actions = [combat_manager.action_queue.action(position) for position in range(len(combat_manager.action_queue))]
+        self.assertEqual({action.target for action in actions if not action.performer.is_hero}, {mage})
+        combat_manager.action_queue.clear()
+        self.assertIs(combat_manager.monster_select_action(self.goblins[0]).target, mage)
+        self.assertIs(combat_manager.retarget(self.goblins[0]), mage)
+        self.assertIn(combat_manager.start_combat(), ("heroes", "monsters"))
+        self.assertTrue(all(creature.on_damage is None for creature in self.heroes + self.goblins))
+
+
+class TestProgression(unittest.TestCase):
+    def setUp(self):
+        self.templates = templateStore.load_json("progression", './classes/templates')
+        self.spawner = Spawner.from_files('./classes/templates')
+
+    def test_level_curve(self):
+        curve = LevelCurve(100, 2, 5)
+        self.assertEqual(curve.thresholds, (0, 100, 400, 900, 1600))
+        self.assertEqual([curve.level(xp) for xp in (0, 99, 100, 899, 900, 10000)], [1, 1, 2, 3, 4, 5])
+        self.assertEqual(curve.xp_for(3), 400)
+        self.assertEqual(curve.xp_to_next(150), 250)
+        self.assertEqual(curve.xp_to_next(2000), 0)
+        self.assertIs(level_curve(100, 2, 5), level_curve(100, 2, 5))
+
+    def test_xp_is_awarded_in_one_batch(self):
+        warrior, mage = self.spawner.spawn_heroes("Warior")[0], self.spawner.spawn_heroes("Mage")[0]
+        goblins = self.spawner.spawn_monsters("Goblin", count=3)
+        for goblin in goblins[:2]:
+            goblin.xp = 500
+            goblin.is_alive = False
+        mage.is_alive = False
+        curve, growth = progression_of("Warior", self.templates)
+        max_hp, attack = warrior.max_hp, warrior.max_attack
+        gained = award_xp([warrior, mage], goblins, self.templates)
+        level = curve.level(1000)
+        self.assertGreater(level, 2)
+        self.assertEqual(gained, {warrior.uid: level - 1})
+        self.assertEqual((warrior.exp, warrior.level, mage.exp), (1000, level, 0))
+        growth_per_level = self.templates["classes"]["Warior"]["growth"]
+        self.assertEqual(warrior.max_hp, max_hp + int(growth_per_level["max_hp"] * (level - 1)))
+        self.assertEqual(warrior.max_attack, attack + int(growth_per_level["max_attack"] * (level - 1)))
+        self.assertEqual(warrior.hp, warrior.max_hp)
+        self.assertEqual(award_xp([warrior], goblins[2:], self.templates), {})
+
+    def test_campaign_reuses_outcomes(self):
+        simulator = CampaignSimulator([["Goblin"], ["Orc"]], samples=5, spawner=self.spawner, templates=self.templates, seed=1)
+        report = simulator.run({"Warior": 200, "Mage": 100}, 20)
+        self.assertLessEqual(simulator.fights, 5 * len(simulator.outcomes))
+        self.assertLess(simulator.fights, 300 * 20)
+        warrior = report["classes"]["Warior"]
+        self.assertEqual(len(warrior["levels"]), 20)
+        self.assertEqual(sum(warrior["levels"][-1].values()), 200)
+        self.assertGreater(warrior["mean_level"], 1)
+        self.assertGreater(warrior["win_rate"], 0.5)
+
+    def test_progression_templates_are_validated(self):
+        templates = {kind: templateStore.load_json(kind, './classes/templates') for kind in templateStore.TEMPLATE_FILES}
+        self.assertEqual(validate(templates), [])
+        templates["progression"]["classes"]["Mage"] = {"curve": "steep", "growth": {"mana": 5}}
+        errors = validate(templates)
+        self.assertIn("progression: classes: Mage: unknown curve 'steep'", errors)
+        self.assertIn("progression: classes: Mage: growth of unknown stat 'mana' (expected one of "
+                      "max_hp, defense, initiative, max_attack, min_attack, attack_bonus)", errors)
+
+
+class TestHeroStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "heroes.db")
+        self.spawner = Spawner.from_files('./classes/templates')
+        self.heroes = self.spawner.spawn_heroes("Warior", count=3) + self.spawner.spawn_heroes("Mage", count=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def changes(self, store):
+        with store.pool.connection() as connection:
+            return connection.total_changes
+
+    def test_round_trip(self):
+        mage = self.heroes[3]
+        mage.effect_manager.add_effect(EffectFactory.create_effect("DamageOverTimeEffect", "Poison", source_type="environment"))
+        mage.hp, mage.exp, mage.level = 12, 340, 3
+        mage.resources["mana"] = 40
+        mage.abilities[0].current_cooldown = 2
+        mage.effect_manager.active_effects[0].duration = 2
+        mage.equipment_manager.unequip_item("head")
+        mage.inventory.add_item(Item.create_item("Consumable", "Bread", self.spawner.item_templates))
+        with HeroStore(self.path, spawner=self.spawner) as store:
+            self.assertEqual(store.save(self.heroes), 5)
+            ids = [store.hero_id(hero) for hero in self.heroes]
+        with HeroStore(self.path, spawner=self.spawner) as store:
+            loaded = store.load()
+            self.assertEqual(store.ids_of_class("Mage"), ids[3:])
+            self.assertEqual([hero.name for hero in store.load(ids[3:])], ["Mage 1", "Mage 2"])
+        self.assertEqual([hero.name for hero in loaded], [hero.name for hero in self.heroes])
+        copy = loaded[3]
+        self.assertEqual((copy.hp, copy.exp, copy.level, copy.resources["mana"]), (12, 340, 3, 40))
+        self.assertEqual([ability.current_cooldown for ability in copy.abilities], [2, 0])
+        self.assertEqual([(effect.name, effect.duration) for effect in copy.effect_manager.active_effects], [("Poison", 2)])
+        self.assertEqual([item.name for item in copy.inventory.items], [item.name for item in mage.inventory.items])
+        self.assertEqual(
+            {str(slot): item and item.name for slot, item in copy.equipment_manager.equipped_items.items()},
+            {str(slot): item and item.name for slot, item in mage.equipment_manager.equipped_items.items()}
+        )
+        self.assertIsNone(copy.equipment_manager.equipped_items[EquipmentSlot.HEAD])
+
+    def test_temporary_modifiers_are_reverted_after_loading(self):
+        effects = copy.deepcopy(templateStore.get_templates("effects"))
+        effects["StatModifierEffect"]["Stoneskin"] = {"duration": 1, "potency": 4, "stat_to_modify": "defense"}
+        warrior, mage = self.heroes[0], self.heroes[3]
+        base = (warrior.defense, mage.defense)
+        with templateStore.override({"effects": effects}):
+            warrior.defend()
+            mage.effect_manager.add_effect(EffectFactory.create_effect("StatModifierEffect", "Stoneskin", source_type="environment"))
+            self.assertEqual((warrior.defense, mage.defense), (base[0] + base[0] // 2, base[1] + 4))
+            with HeroStore(self.path, spawner=self.spawner) as store:
+                store.save(self.heroes)
+            with HeroStore(self.path, spawner=self.spawner) as store:
+                loaded = store.load()
+            warrior, mage = loaded[0], loaded[3]
+            self.assertEqual((warrior.defense, mage.defense), (base[0] + base[0] // 2, base[1] + 4))
+            for _ in range(2):
+                warrior.update_turn()
+                mage.update_turn()
+        self.assertEqual((warrior.defense, mage.defense), base)
+        self.assertEqual(mage.effect_manager.active_effects, [])
+
+    def test_only_changes_are_written(self):
+        with HeroStore(self.path, spawner=self.spawner) as store:
+            store.save(self.heroes)
+            self.assertEqual(store.save(self.heroes), 0)
+            warrior = self.heroes[0]
+            warrior.hp -= 5
+            before = self.changes(store)
+            self.assertEqual(store.save(self.heroes), 1)
+            # One hero row, no child rows
+            self.assertEqual(self.changes(store) - before, 1)
+            warrior.inventory.remove_item(warrior.inventory.items[0])
+            before = self.changes(store)
+            self.assertEqual(store.save(self.heroes), 1)
+            # The hero's inventory rows are replaced
+            self.assertEqual(self.changes(store) - before, 2 * len(warrior.inventory.items) + 1)
+            loaded = store.load([store.hero_id(warrior)])[0]
+            self.assertEqual(store.save([loaded]), 0)
+            self.assertEqual(store.delete([loaded]), 1)
+            self.assertEqual(len(store.load()), 4)
+
+    def test_stores_sharing_a_database_do_not_reuse_ids(self):
+        with HeroStore(self.path, spawner=self.spawner) as first, HeroStore(self.path, spawner=self.spawner) as second:
+            first.save(self.heroes[:3])
+            second.save(self.heroes[3:])
+            ids = [first.hero_id(hero) for hero in self.heroes[:3]] + [second.hero_id(hero) for hero in self.heroes[3:]]
+            self.assertEqual(len(set(ids)), 5)
+            self.assertEqual([hero.name for hero in first.load()], [hero.name for hero in self.heroes])
+
+    def test_unknown_class_is_skipped(self):
+        with HeroStore(self.path, spawner=self.spawner) as store:
+            store.save(self.heroes[:1])
+        spawner = Spawner(hero_templates={}, item_templates=self.spawner.item_templates)
+        with HeroStore(self.path, spawner=spawner) as store:
+            self.assertEqual(store.load(), [])
+
+    def test_pool_reuses_connections(self):
+        pool = ConnectionPool(self.path, size=2)
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+        with pool.connection() as again:
+            self.assertIn(again, (first, second))
+        self.assertEqual(len(pool.opened), 2)
+        pool.close()
+
+
+class TestTemplateGenerator(unittest.TestCase):
+    def setUp(self):
+        self.templates = generate_templates(scaled_sizes(60), seed=3)
+
+    def test_generated_templates_are_valid(self):
+        self.assertEqual(validate(self.templates), [])
+        self.assertEqual(len(self.templates["abilities"]), 60)
+        self.assertEqual(sum(len(entries) for entries in self.templates["effects"].values()), 60)
+        self.assertEqual(len(self.templates["heroes"]), 6)
+        self.assertEqual(set(self.templates["progression"]["classes"]), set(self.templates["heroes"]))
+        self.assertEqual(generate_templates(scaled_sizes(60), seed=3), self.templates)
+
+    def test_generated_creatures_fight(self):
+        spawner = Spawner(self.templates["creatures"], self.templates["heroes"], self.templates["abilities"], self.templates["items"])
+        with templateStore.override(self.templates):
+            heroes = [hero for name in self.templates["heroes"] for hero in spawner.spawn_heroes(name)]
+            monsters = [monster for name in list(self.templates["creatures"])[:6] for monster in spawner.spawn_monsters(name)]
+            self.assertTrue(all(EquipmentSlot.WEAPON in hero.equipment_manager.equipped_items for hero in heroes))
+            result = CombatManager(heroes, monsters, auto_heroes=True, max_rounds=20, batched=True).start_combat()
+        self.assertIn(result, ("heroes", "monsters", "draw"))
+
+    def test_measure(self):
+        result = measure(40, lookups=200, seed=1)
+        self.assertEqual((result["size"], result["entries"]), (40, 164))
+        for key in ("json_load_s", "bundle_load_s", "memory_kib", "create_item_us", "create_effect_us", "create_ability_us"):
+            self.assertGreater(result[key], 0)
+
+
+class TestItemCatalog(unittest.TestCase):
+    def setUp(self):
+        self.templates = templateStore.load_json("items", './classes/templates')
+        self.catalog = ItemCatalog(self.templates)
+
+    def test_lookup(self):
+        self.assertEqual(self.catalog.find("Armor", "Plate Armor"), (self.templates["Armor"]["chest"]["Plate Armor"], EquipmentSlot.CHEST))
+        self.assertEqual(self.catalog.item_type("Axe"), "Weapon")
+        with self.assertRaises(KeyError):
+            self.catalog.find("Armor", "Sword")
+        armor = Item.create_item("Armor", "Leather Trousers", self.templates)
+        self.assertEqual((armor.category, armor.defense), (EquipmentSlot.LEGS, 5))
+        self.assertIsNone(Item.create_item("Weapon", "Helmet", self.templates))
+        self.assertIs(item_catalog(self.templates), item_catalog(self.templates))
+
+    def test_queries(self):
+        self.assertEqual(self.catalog.query(slot="chest", weight=(None, 10), sort_by="defense", descending=True), ["Chainmail"])
+        self.assertEqual(self.catalog.query(slot=EquipmentSlot.HEAD, sort_by="defense", descending=True), ["Helmet", "Crown"])
+        self.assertEqual(self.catalog.query(item_type="Weapon", attack=(11, None)), ["Axe"])
+        self.assertEqual(self.catalog.query(slot="weapon", sort_by="weight"), ["Sword", "Axe"])
+        self.assertEqual(self.catalog.range("defense", 5, 10), ["Helmet", "Leather Trousers", "Chainmail"])
+        with self.assertRaises(ValueError):
+            self.catalog.query(sort_by="colour")
+
+    def test_queries_match_a_scan(self):
+        templates = generate_templates(scaled_sizes(300), seed=5)["items"]
+        catalog = ItemCatalog(templates)
+        rng = random.Random(5)
+        for _ in range(50):
+            slot = rng.choice([None, *EquipmentSlot.names()])
+            high = rng.randint(1, 20)
+            sort_by = rng.choice(["defense", "attack", "weight"])
+            expected = sorted(
+                (name for name, (item_type, item_slot, template) in catalog.entries.items()
+                 if template["weight"] <= high and sort_by in template
+                 and (slot is None or str(EquipmentSlot.WEAPON if item_type == "Weapon" else item_slot) == slot)),
+                key=lambda name: (catalog.entries[name][2][sort_by], name), reverse=True
+            )
+            self.assertEqual(catalog.query(slot=slot, weight=(None, high), sort_by=sort_by, descending=True), expected)
+            self.assertEqual(catalog.query(slot=slot, weight=(None, high), sort_by=sort_by, descending=True, limit=3), expected[:3])
+
+    def test_create_many(self):
+        items = self.catalog.create_many(["Sword", "Helmet", "Sword", "Nothing"], shared=True)
+        self.assertEqual([item.name for item in items], ["Sword", "Helmet", "Sword"])
+        self.assertIs(items[0], items[2])
+        self.assertIsInstance(items[1], Armor)
+        self.assertIsNot(*self.catalog.create_many(["Sword", "Sword"]))
+
+    def test_items_added_in_place(self):
+        catalog = item_catalog(self.templates)
+        self.templates["Armor"]["head"]["Hood"] = {"weight": 1, "defense": 1, "description": "A hood."}
+        self.assertEqual(Item.create_item("Armor", "Hood", self.templates).category, EquipmentSlot.HEAD)
+        self.assertIn("Hood", catalog)
+
+
+class TestLoadout(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+        self.catalog = ItemCatalog(self.spawner.item_templates)
+
+    def test_best_loadout_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(30):
+            options = tuple(
+                tuple(sorted({(rng.randint(1, 15), rng.randint(0, 20)) for _ in range(rng.randint(0, 4))}))
+                for _ in range(4)
+            )
+            budget = rng.randint(0, 40)
+            best = max(
+                sum(option[1] for option in choice if option)
+                for choice in itertools.product(*[(None, *slot_options) for slot_options in options])
+                if sum(option[0] for option in choice if option) <= budget
+            )
+            value, choices = best_loadout(options, budget)
+            self.assertEqual(value, best)
+            self.assertLessEqual(sum(choice[0] for choice in choices if choice), budget)
+
+    def test_auto_equip_respects_the_budget(self):
+        hero = self.spawner.spawn_heroes("Warior")[0]
+        self.assertEqual(auto_equip(hero), 0)
+        for item in self.catalog.create_many(["Plate Armor", "Axe", "Leather Trousers"]):
+            hero.inventory.add_item(item)
+        revision = hero.equipment_manager.revision
+        self.assertEqual(auto_equip(hero), 3)
+        self.assertEqual(hero.equipment_manager.revision, revision + 3)
+        names = {str(slot): item.name for slot, item in hero.equipment_manager.equipped_items.items()}
+        self.assertEqual(names, {"head": "Helmet", "chest": "Plate Armor", "legs": "Leather Trousers", "weapon": "Axe"})
+        # Helmet, Chainmail, Leather Trousers and Sword: 28 weight for 30 value
+        loadout = optimize(hero, budget=30)
+        self.assertLessEqual(sum(item.weight for item in loadout.values() if item), 30)
+        self.assertEqual(sum(item.defense if isinstance(item, Armor) else item.attack for item in loadout.values() if item), 30)
+        hero.inventory.add_item(self.catalog.create("Health Potion"))
+        self.assertEqual(equipment_budget(hero), hero.inventory.max_weight - 1)
+        self.assertIsNone(optimize(hero, budget=0)[EquipmentSlot.WEAPON])
+
+    def test_heroes_with_the_same_items_share_a_solve(self):
+        heroes = self.spawner.spawn_heroes("Warior", count=20)
+        for hero in heroes:
+            hero.inventory.add_item(self.catalog.create("Axe"))
+        best_loadout.cache_clear()
+        self.assertEqual(auto_equip_all(heroes), 20)
+        self.assertEqual(best_loadout.cache_info().misses, 1)
+        self.assertTrue(all(hero.equipment_manager.equipped_items[EquipmentSlot.WEAPON].name == "Axe" for hero in heroes))
+
+
+class TestHydration(unittest.TestCase):
+    def setUp(self):
+        self.spawner = Spawner.from_files('./classes/templates')
+
+    def test_managers_are_built_on_first_use(self):
+        goblin = self.spawner.spawn_monsters("Goblin")[0]
+        goblin.update_turn()
+        self.assertNotIn("effect_manager", vars(goblin))
+        self.assertIs(goblin.effect_manager.owner, goblin)
+        self.assertIn("effect_manager", vars(goblin))
+        self.assertNotIn("effect_manager", vars(goblin.clone()))
+        hero = Hero(max_weight=40)
+        dirty = hero.dirty
+        self.assertNotIn("inventory", vars(hero))
+        self.assertEqual(hero.inventory.max_weight, 40)
+        self.assertEqual(hero.dirty, dirty)
+
+    def test_monsters_round_trip(self):
+        world = DormantWorld(self.spawner)
+        uids = world.populate(Monster, "Goblin", count=5)
+        self.assertEqual((len(world), len(world.awake)), (5, 0))
+        goblin = world.wake(uids[:1])[0]
+        self.assertEqual((goblin.uid, goblin.name, goblin.hp), (uids[0], "Goblin 1", goblin.max_hp))
+        goblin.take_damage(3, source="attack")
+        hp = goblin.hp
+        self.assertEqual(world.sleep(), 1)
+        again = world.wake([uids[0]])[0]
+        self.assertIsNot(again, goblin)
+        self.assertEqual((again.uid, again.hp, again.max_hp, again.dirty), (uids[0], hp, goblin.max_hp, 0))
+        # A creature under an effect stays awake
+        again.effect_manager.add_effect(DamageOverTimeEffect("Burning", 2, 1, 'fire'))
+        self.assertEqual(world.sleep(), 0)
+        self.assertIsNone(dehydrate(again, self.spawner))
+
+    def test_heroes_round_trip(self):
+        hero = self.spawner.spawn_heroes("Mage")[0]
+        hero.inventory.add_item(Item.create_item("Weapon", "Axe", self.spawner.item_templates))
+        hero.equipment_manager.unequip_item(EquipmentSlot.HEAD)
+        hero.abilities[0].current_cooldown = 2
+        resource = next(iter(hero.resources))
+        hero.resources[resource] = 1
+        hero.exp, hero.level = 250, 3
+        record = dehydrate(hero, self.spawner)
+        loaded = hydrate(record, self.spawner)
+        self.assertEqual((loaded.uid, loaded.exp, loaded.level, loaded.resources[resource]), (hero.uid, 250, 3, 1))
+        self.assertEqual([item.name for item in loaded.inventory.items], [item.name for item in hero.inventory.items])
+        equipped = loaded.equipment_manager.equipped_items
+        self.assertEqual({slot: item and item.name for slot, item in equipped.items()},
+                         {slot: item and item.name for slot, item in hero.equipment_manager.equipped_items.items()})
+        self.assertTrue(all(item is None or item in loaded.inventory.items for item in equipped.values()))
+        self.assertEqual([ability.current_cooldown for ability in loaded.abilities], [ability.current_cooldown for ability in hero.abilities])
+        # An untouched hero is only its template
+        fresh = self.spawner.spawn_heroes("Mage")[0]
+        self.assertEqual(dehydrate(fresh, self.spawner).overrides, {})
+
+    def test_dormant_creatures_are_smaller(self):
+        self.spawner.compile(Monster, "Goblin")
+        gc.collect()
+        tracemalloc.start()
+        try:
+            monsters = self.spawner.spawn_monsters("Goblin", count=2000)
+            spawned = tracemalloc.get_traced_memory()[0]
+            del monsters
+            gc.collect()
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            world = DormantWorld(self.spawner)
+            world.populate(Monster, "Goblin", count=2000)
+            dormant = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        self.assertLess(dormant, spawned / 2)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file